@@ -13,10 +13,11 @@ from pathlib import Path
 from datetime import datetime
 from queue import Queue
 from threading import Thread
+from collections import OrderedDict
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException, UploadFile, File, Header
+from fastapi import FastAPI, BackgroundTasks, HTTPException, UploadFile, File, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from typing import Optional as Opt
@@ -25,6 +26,14 @@ import uvicorn
 from run import run_instructional_design
 from src.slide_optimizer import SlideOptimizer
 from src.pdf_processor import PDFSlideProcessor
+from src.agents import token_listener
+from src.archive import TarArchivePlan, collect_archive_entries, compute_etag, iter_zip_stream, parse_range_header
+from src.evaluate import EvaluationEngine, check_exp_name
+from src.kb_registry import get_kb_registry
+from src.metrics import enable_metrics, render_metrics
+import hashlib
+import threading
+import time
 import tempfile
 import shutil
 
@@ -50,6 +59,53 @@ tasks: Dict[str, Dict[str, Any]] = {}
 # Log queues for each task (in production, use Redis Streams)
 task_logs: Dict[str, Queue] = {}
 
+# Evaluation engines (and their client pools), reused across evaluation tasks;
+# the least recently used one is dropped beyond EVALUATION_ENGINE_CACHE_SIZE
+EVALUATION_ENGINE_CACHE_SIZE = int(os.environ.get("EVALUATION_ENGINE_CACHE_SIZE", 8))
+evaluation_engines: Dict[str, EvaluationEngine] = OrderedDict()
+evaluation_engines_lock = threading.Lock()
+
+# Metrics served on /metrics; pipeline metrics come from the tracing spans
+metrics_registry = enable_metrics()
+task_gauge = metrics_registry.gauge("api_tasks", "Tasks by type and status", ["type", "status"])
+log_queue_gauge = metrics_registry.gauge("api_log_queue_depth", "Log messages waiting to be streamed, over all tasks")
+sse_subscribers_gauge = metrics_registry.gauge("api_sse_subscribers", "Open log streams")
+event_loop_lag_histogram = metrics_registry.histogram(
+    "api_event_loop_lag_seconds", "Delay of the event loop in running a scheduled callback")
+event_loop_lag_gauge = metrics_registry.gauge("api_event_loop_lag_last_seconds", "Most recent event loop lag")
+
+# Interval of the event loop lag probe
+EVENT_LOOP_PROBE_INTERVAL = 0.5
+
+
+def collect_task_metrics():
+    """Refresh the task and log queue gauges (called on every scrape)"""
+    counts = {}
+    for task in list(tasks.values()):
+        key = (task.get("type", "course"), task.get("status", "unknown"))
+        counts[key] = counts.get(key, 0) + 1
+    task_gauge.replace(counts)
+    log_queue_gauge.set(sum(queue.qsize() for queue in list(task_logs.values())))
+
+
+metrics_registry.add_collector(collect_task_metrics)
+
+
+async def probe_event_loop_lag():
+    """Measure how late the event loop wakes up from a sleep; blocking calls show up as lag"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_PROBE_INTERVAL)
+        lag = max(0.0, loop.time() - start - EVENT_LOOP_PROBE_INTERVAL)
+        event_loop_lag_histogram.observe(lag)
+        event_loop_lag_gauge.set(lag)
+
+
+@app.on_event("startup")
+async def start_event_loop_probe():
+    asyncio.create_task(probe_event_loop_lag())
+
 # Request/Response models
 class CourseRequest(BaseModel):
     course_name: str = Field(..., description="Name of the course to generate")
@@ -58,6 +114,15 @@ class CourseRequest(BaseModel):
     copilot: Optional[bool] = Field(default=False, description="Enable copilot mode")
     catalog: Optional[str] = Field(default=None, description="Catalog name to use")
     catalog_data: Optional[Dict[str, Any]] = Field(default=None, description="Catalog data as JSON object")
+    routing: Optional[Dict[str, Any]] = Field(default=None, description="Model routing config (tiers and step routes)")
+
+class EvaluationRequest(BaseModel):
+    exp_names: List[str] = Field(..., description="Experiments to evaluate (directories under exp/)")
+    model_name: str = Field(default="gpt-4o-mini", description="OpenAI model used for evaluation")
+    routing: Optional[Dict[str, Any]] = Field(default=None, description="Model routing config (tiers and step routes)")
+    scoring_mode: str = Field(default="per_metric", description="per_metric or multi_metric")
+    use_cache: bool = Field(default=True, description="Reuse results of unchanged files")
+    calibrate: bool = Field(default=False, description="Only compare the scoring modes")
 
 class TaskStatus(BaseModel):
     task_id: str
@@ -88,6 +153,19 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+# Prometheus metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Metrics in the Prometheus text format: LLM requests, tokens, errors and
+    latency by model and step, rate limiter saturation, tasks, log streams,
+    compile and PDF extraction times, embeddings, cache hits and event loop lag
+
+    A plain function so that FastAPI runs it in the threadpool: the collectors
+    take the metric and knowledge base registry locks and walk all tasks.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Helper function to get API key from header or environment
 def get_api_key(x_openai_api_key: Opt[str] = Header(None, alias="X-OpenAI-API-Key")) -> str:
     """
@@ -241,6 +319,14 @@ async def stream_task_logs(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     
     async def event_generator():
+        sse_subscribers_gauge.inc()
+        try:
+            async for event in log_events():
+                yield event
+        finally:
+            sse_subscribers_gauge.dec()
+    
+    async def log_events():
         # Create log queue if it doesn't exist
         if task_id not in task_logs:
             task_logs[task_id] = Queue()
@@ -270,6 +356,11 @@ async def stream_task_logs(task_id: str):
                 for _ in range(20):  # Process up to 20 logs at once
                     try:
                         log_message = log_queue.get_nowait()
+                        # Streamed LLM tokens are forwarded as their own event type
+                        if isinstance(log_message, dict):
+                            yield f"data: {json.dumps(log_message)}\n\n"
+                            logs_sent = True
+                            continue
                         # Ensure message is a string
                         if not isinstance(log_message, str):
                             log_message = str(log_message)
@@ -323,6 +414,147 @@ async def download_file(task_id: str, file_path: str):
         media_type='application/octet-stream'
     )
 
+@app.get("/api/course/results/{task_id}/archive")
+async def download_archive(
+    task_id: str,
+    request: Request,
+    format: str = "tar",
+    chapters: Optional[str] = None,
+    include_root: bool = True
+):
+    """
+    Download all generated files of a task as a single streamed archive
+
+    Query parameters:
+    - format: "tar" (default, supports HTTP Range for resuming) or "zip"
+    - chapters: Comma-separated chapter numbers to include (e.g. "1,3,5"), default all
+    - include_root: Whether to include the foundation files at the experiment root
+    """
+    if task_id not in tasks:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if format not in ("tar", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'tar' or 'zip'")
+
+    chapter_list = None
+    if chapters:
+        try:
+            chapter_list = [int(c) for c in chapters.split(",") if c.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="chapters must be comma-separated chapter numbers")
+
+    task = tasks[task_id]
+    exp_name = task.get("exp_name", "default")
+    exp_dir = Path(f"./exp/{exp_name}")
+    if not exp_dir.exists():
+        raise HTTPException(status_code=404, detail="Output directory not found")
+
+    entries = collect_archive_entries(exp_dir, chapters=chapter_list, include_root=include_root)
+    if not entries:
+        raise HTTPException(status_code=404, detail="No files to archive")
+
+    suffix = f"_chapters_{'_'.join(str(c) for c in chapter_list)}" if chapter_list else ""
+    filename = f"{exp_name}{suffix}.{format}"
+    etag = compute_etag(entries, format)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "ETag": etag,
+    }
+
+    if format == "zip":
+        # Zip entries carry CRCs that are only known after reading, so the
+        # layout is not fixed in advance and ranges cannot be served
+        headers["Accept-Ranges"] = "none"
+        return StreamingResponse(iter_zip_stream(entries), media_type="application/zip", headers=headers)
+
+    plan = TarArchivePlan(entries)
+    headers["Accept-Ranges"] = "bytes"
+
+    # Only honor Range if the client's copy is still current (If-Range)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range_header(range_header, plan.total_size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{plan.total_size}"}
+        )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(plan.total_size)
+        return StreamingResponse(plan.iter_range(), media_type="application/x-tar", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{plan.total_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        plan.iter_range(start, end),
+        status_code=206,
+        media_type="application/x-tar",
+        headers=headers
+    )
+
+@app.post("/api/evaluate")
+async def evaluate_experiments(
+    request: EvaluationRequest,
+    background_tasks: BackgroundTasks,
+    x_openai_api_key: Opt[str] = Header(None, alias="X-OpenAI-API-Key")
+):
+    """
+    Start an evaluation task for one or more experiments
+    
+    Evaluation engines are kept between requests, so repeated evaluations
+    reuse the same client pool.
+    """
+    api_key = get_api_key(x_openai_api_key)
+    
+    if not request.exp_names:
+        raise HTTPException(status_code=400, detail="exp_names must not be empty")
+    if request.scoring_mode not in ("per_metric", "multi_metric"):
+        raise HTTPException(status_code=400, detail="scoring_mode must be per_metric or multi_metric")
+    for exp_name in request.exp_names:
+        try:
+            check_exp_name(exp_name)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    task_id = str(uuid.uuid4())
+    tasks[task_id] = {
+        "task_id": task_id,
+        "type": "evaluation",
+        "status": "pending",
+        "progress": 0,
+        "current_stage": "Task queued",
+        "error": None,
+        "created_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat(),
+        "exp_name": ", ".join(request.exp_names),
+        "exp_names": request.exp_names,
+        "results": {}
+    }
+    
+    background_tasks.add_task(run_evaluation_task, task_id, request, api_key)
+    
+    return {
+        "task_id": task_id,
+        "status": "started",
+        "message": f"Evaluation of {len(request.exp_names)} experiment(s) started"
+    }
+
+@app.get("/api/evaluate/{task_id}")
+async def get_evaluation_results(task_id: str):
+    """
+    Get the status and per-experiment results of an evaluation task
+    """
+    if task_id not in tasks or tasks[task_id].get("type") != "evaluation":
+        raise HTTPException(status_code=404, detail="Evaluation task not found")
+    
+    return tasks[task_id]
+
 @app.post("/api/catalog/upload")
 async def upload_catalog(
     file: UploadFile = File(...),
@@ -489,7 +721,7 @@ async def optimize_chapter(
         )
     
     try:
-        optimizer = SlideOptimizer()
+        optimizer = SlideOptimizer(api_key=api_key)
         result = optimizer.optimize_chapter(
             storage_id,
             chapter_name,
@@ -526,7 +758,7 @@ async def optimize_all_chapters(
         raise HTTPException(status_code=400, detail="storage_id is required")
     
     try:
-        optimizer = SlideOptimizer()
+        optimizer = SlideOptimizer(api_key=api_key)
         result = optimizer.optimize_all_chapters(
             storage_id,
             user_requirements,
@@ -566,26 +798,53 @@ async def get_storage_info(
 async def list_knowledge_bases(
     x_openai_api_key: Opt[str] = Header(None, alias="X-OpenAI-API-Key")
 ):
-    """列出所有已创建的知识库"""
+    """列出所有已创建的知识库（元数据由注册表按修改时间缓存）"""
     get_api_key(x_openai_api_key)
     
-    kb_dir = Path("knowledge_base")
-    if not kb_dir.exists():
-        return {"knowledge_bases": []}
+    return {"knowledge_bases": get_kb_registry().list("knowledge_base")}
+
+
+@app.get("/api/slides/search")
+def search_knowledge_base(
+    knowledge_base_name: str,
+    query: str,
+    top_k: int = 5,
+    exp_name: Optional[str] = None,
+    x_openai_api_key: Opt[str] = Header(None, alias="X-OpenAI-API-Key")
+):
+    """
+    在知识库中语义搜索幻灯片内容
+    
+    知识库常驻内存（LRU，预算由KB_CACHE_MB设置），只有首次搜索需要从磁盘加载。
+    同步端点，由线程池执行，embedding请求不阻塞事件循环。
+    
+    Query parameters:
+    - knowledge_base_name: 知识库名称
+    - query: 搜索查询
+    - top_k: 返回结果数量（默认5，最多50）
+    - exp_name: 实验名称（可选），提供时搜索exp/{exp_name}/knowledge_base/中的知识库
+    """
+    api_key = get_api_key(x_openai_api_key)
     
-    kb_list = []
-    for kb_folder in kb_dir.iterdir():
-        if kb_folder.is_dir():
-            metadata_file = kb_folder / "metadata.json"
-            if metadata_file.exists():
-                try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                    kb_list.append(metadata)
-                except Exception as e:
-                    print(f"Warning: Could not load metadata for {kb_folder.name}: {e}")
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="query is required")
+    try:
+        check_exp_name(knowledge_base_name)
+        if exp_name is not None:
+            check_exp_name(exp_name)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid knowledge base or experiment name")
+    top_k = max(1, min(top_k, 50))
+    kb_dir = f"./exp/{exp_name}/knowledge_base" if exp_name else "knowledge_base"
+    if not (Path(kb_dir) / knowledge_base_name / "metadata.json").exists():
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
     
-    return {"knowledge_bases": kb_list}
+    try:
+        results = get_kb_registry().search(knowledge_base_name, query, top_k=top_k, kb_dir=kb_dir,
+                                           api_key=api_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching knowledge base: {str(e)}")
+    return {"knowledge_base_name": knowledge_base_name, "query": query, "results": results}
 
 
 @app.post("/api/slides/generate-latex")
@@ -651,7 +910,7 @@ async def generate_enhanced_latex(
     print(f"DEBUG: Building output directory - exp_name: {exp_name}, chapter_name: {chapter_name}, output_dir: {output_dir}")
     
     try:
-        optimizer = SlideOptimizer()
+        optimizer = SlideOptimizer(api_key=api_key)
         result = optimizer.generate_enhanced_latex(
             knowledge_base_name=knowledge_base_name,
             recommendations=recommendations,
@@ -702,6 +961,11 @@ async def download_enhanced_slide_file(
     )
 
 # Custom stdout wrapper to capture logs
+# Streamed tokens are forwarded to a log stream in chunks of this many characters or seconds
+TOKEN_FLUSH_CHARS = 200
+TOKEN_FLUSH_INTERVAL = 0.25
+
+
 class LogCapture:
     def __init__(self, task_id: str, original_stdout):
         self.task_id = task_id
@@ -710,6 +974,9 @@ class LogCapture:
             task_logs[task_id] = Queue()
         self.log_queue = task_logs[task_id]
         self.buffer = ""  # Buffer for incomplete lines
+        # Thread ID -> [step, text parts, characters, time of the first part]
+        self.token_buffers = {}
+        self.token_lock = threading.Lock()
     
     def write(self, text):
         # Write to original stdout first (so it appears in docker logs)
@@ -732,6 +999,32 @@ class LogCapture:
                         import sys
                         print(f"Warning: Failed to add log to queue: {e}", file=sys.stderr)
     
+    def on_llm_event(self, event):
+        """
+        Forward streamed LLM tokens to the task's log stream
+        
+        Deltas are buffered per calling thread (one call at a time each) and
+        enqueued once TOKEN_FLUSH_CHARS characters or TOKEN_FLUSH_INTERVAL
+        seconds have accumulated, and when the call ends.
+        """
+        thread_id = threading.get_ident()
+        with self.token_lock:
+            buffered = self.token_buffers.get(thread_id)
+            if event.get("type") == "token":
+                if buffered is None:
+                    buffered = self.token_buffers[thread_id] = [event.get("step"), [], 0, time.monotonic()]
+                buffered[1].append(event["text"])
+                buffered[2] += len(event["text"])
+                if buffered[2] < TOKEN_FLUSH_CHARS and time.monotonic() - buffered[3] < TOKEN_FLUSH_INTERVAL:
+                    return
+            elif event.get("type") != "end" or buffered is None:
+                return
+            del self.token_buffers[thread_id]
+        try:
+            self.log_queue.put_nowait({"type": "token", "step": buffered[0], "text": "".join(buffered[1])})
+        except Exception:
+            pass
+    
     def flush(self):
         # Flush any remaining buffer
         if self.buffer.strip():
@@ -818,13 +1111,16 @@ async def run_generation_task(task_id: str, request: CourseRequest, api_key: str
         
         # Run the generation (this is synchronous, but we're in a background task)
         # Note: For better progress tracking, you might want to modify ADDIE to accept callbacks
-        run_instructional_design(
-            course_name=request.course_name,
-            copilot="default_copilot" if request.copilot else None,
-            catalog=catalog_source,
-            model_name=request.model_name,
-            exp_name=request.exp_name
-        )
+        # Streamed tokens of this run only (the listener follows the run into its worker threads)
+        with token_listener(log_capture.on_llm_event):
+            run_instructional_design(
+                course_name=request.course_name,
+                copilot="default_copilot" if request.copilot else None,
+                catalog=catalog_source,
+                model_name=request.model_name,
+                exp_name=request.exp_name,
+                routing=request.routing
+            )
         
         # Mark as completed
         print("\n" + "=" * 60)
@@ -864,10 +1160,80 @@ async def run_generation_task(task_id: str, request: CourseRequest, api_key: str
         elif "OPENAI_API_KEY" in os.environ:
             del os.environ["OPENAI_API_KEY"]
 
+def get_evaluation_engine(request: EvaluationRequest, api_key: str) -> EvaluationEngine:
+    """
+    Get (or create) the evaluation engine for a configuration and API key
+
+    At most EVALUATION_ENGINE_CACHE_SIZE engines are kept, so per-user keys do
+    not grow the cache without bound; a task keeps using its engine after it
+    has been dropped.
+    """
+    key = json.dumps({
+        "api_key": hashlib.sha256(api_key.encode()).hexdigest(),
+        "model_name": request.model_name,
+        "routing": request.routing,
+        "scoring_mode": request.scoring_mode,
+        "use_cache": request.use_cache
+    }, sort_keys=True)
+    
+    with evaluation_engines_lock:
+        if key not in evaluation_engines:
+            # Clients read the API key from the environment when they are created
+            original_key = os.environ.get("OPENAI_API_KEY")
+            os.environ["OPENAI_API_KEY"] = api_key
+            try:
+                evaluation_engines[key] = EvaluationEngine(
+                    request.model_name,
+                    routing=request.routing,
+                    scoring_mode=request.scoring_mode,
+                    use_cache=request.use_cache
+                )
+            finally:
+                if original_key:
+                    os.environ["OPENAI_API_KEY"] = original_key
+                else:
+                    os.environ.pop("OPENAI_API_KEY", None)
+            while len(evaluation_engines) > EVALUATION_ENGINE_CACHE_SIZE:
+                evaluation_engines.popitem(last=False)
+        else:
+            evaluation_engines.move_to_end(key)
+        return evaluation_engines[key]
+
+def run_evaluation_task(task_id: str, request: EvaluationRequest, api_key: str):
+    """
+    Run an evaluation task in background (in the threadpool, not the event loop)
+    """
+    task = tasks[task_id]
+    task["status"] = "running"
+    task["current_stage"] = "Preparing evaluation"
+    task["updated_at"] = datetime.now().isoformat()
+    
+    def on_complete(exp_name: str, result: Dict[str, Any]):
+        task["results"][exp_name] = result
+        task["progress"] = int(100 * len(task["results"]) / len(request.exp_names))
+        task["current_stage"] = f"Evaluated {exp_name}"
+        task["updated_at"] = datetime.now().isoformat()
+    
+    try:
+        engine = get_evaluation_engine(request, api_key)
+        engine.evaluate_many(request.exp_names, calibrate=request.calibrate, on_complete=on_complete)
+        
+        failed = [name for name, result in task["results"].items() if "error" in result]
+        task["status"] = "failed" if len(failed) == len(request.exp_names) else "completed"
+        if failed:
+            task["error"] = f"Evaluation failed for: {', '.join(failed)}"
+        task["progress"] = 100
+        task["current_stage"] = "Completed"
+    except Exception as e:
+        task["status"] = "failed"
+        task["error"] = str(e)
+        task["current_stage"] = f"Error: {e}"
+    task["updated_at"] = datetime.now().isoformat()
+
 # Mount static files for results (optional, for direct file access)
+# check_dir=False keeps the mount available even if ./exp is created after startup
 results_dir = Path("./exp")
-if results_dir.exists():
-    app.mount("/results", StaticFiles(directory=str(results_dir)), name="results")
+app.mount("/results", StaticFiles(directory=str(results_dir), check_dir=False), name="results")
 
 if __name__ == "__main__":
     # Load config if exists
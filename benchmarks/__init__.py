@@ -0,0 +1 @@
+"""Offline benchmarks: mock OpenAI server and pipeline harness"""
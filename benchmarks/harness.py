@@ -0,0 +1,256 @@
+"""
+Benchmark Harness
+Runs the pipelines end to end against the mock OpenAI server and reports
+wall time, calls, tokens and the concurrency they achieved.
+
+Pipelines:
+    addie       run_instructional_design (foundation deliberations and all chapters)
+    optimizer   SlideOptimizer.optimize_chapter and generate_enhanced_latex on
+                synthetic extracted slides (PDF parsing is not benchmarked)
+    evaluate    src.evaluate on the course generated by the addie pipeline
+
+Every pipeline runs in a scratch working directory; its output goes to a
+log file there. By default an in-process mock server is started; with
+--base-url the harness uses an already running one (its /_stats endpoint
+must be reachable).
+
+Usage:
+    python -m benchmarks.harness addie evaluate --ttft lognormal:0.4,0.5 --tokens-per-second 80
+    python -m benchmarks.harness all --rate-limit-rate 0.05 --output bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.mock_openai import add_server_arguments, server_from_args
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+PIPELINES = ["addie", "optimizer", "evaluate"]
+
+EXP_NAME = "benchmark"
+
+
+def _server_call(base_url: str, path: str, method: str = "GET") -> Dict[str, Any]:
+    """Call a mock server control endpoint (/_stats or /_reset)"""
+    root = base_url.rstrip("/")
+    root = root[:-len("/v1")] if root.endswith("/v1") else root
+    request = urllib.request.Request(root + path, method=method, data=b"{}" if method == "POST" else None,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def run_addie(args: argparse.Namespace):
+    from run import run_instructional_design
+    run_instructional_design(
+        course_name=args.course,
+        catalog=args.catalog,
+        model_name=args.model,
+        exp_name=EXP_NAME,
+        parallel_rounds=args.parallel_rounds,
+        history_mode=args.history_mode,
+        routing=args.routing
+    )
+
+
+def _synthetic_extraction(storage_id: str, user_requirements: str, chapter: str, decks: int, slides: int) -> Dict[str, Any]:
+    """Extracted-slides data in the shape PDFSlideProcessor.extract_by_requirement returns"""
+    deck_data = []
+    for deck in range(decks):
+        structure = [{
+            "slide_number": number + 1,
+            "title": f"{chapter} Topic {deck + 1}.{number + 1}",
+            "content": f"Key ideas of topic {deck + 1}.{number + 1}: definitions, a worked example and common pitfalls.",
+            "bullet_points": ["Definition", "Worked example", "Common pitfalls"]
+        } for number in range(slides)]
+        deck_data.append({
+            "filename": f"deck_{deck + 1}.pdf",
+            "file_path": f"deck_{deck + 1}.pdf",
+            "pdf_name": f"deck_{deck + 1}",
+            "metadata": {"num_pages": slides},
+            "total_pages": slides,
+            "extracted_slides_count": slides,
+            "slide_structure": structure,
+            "processed_at": "2026-01-01T00:00:00"
+        })
+    return {
+        "storage_id": storage_id,
+        "extracted_at": "2026-01-01T00:00:00",
+        "user_requirements": user_requirements,
+        "target_chapters": [chapter],
+        "total_extracted_files": decks,
+        "slides": deck_data
+    }
+
+
+def run_optimizer(args: argparse.Namespace):
+    from src.slide_optimizer import SlideOptimizer
+
+    requirements = "Add worked examples and clarify the definitions"
+    optimizer = SlideOptimizer()
+    optimizer.processor.extract_by_requirement = lambda storage_id, user_requirements, target_chapters=None: \
+        _synthetic_extraction(storage_id, user_requirements, target_chapters[0], args.decks, args.deck_slides)
+
+    result = optimizer.optimize_chapter(EXP_NAME, "Chapter 1", requirements, exp_name=EXP_NAME)
+    if not result["success"]:
+        raise RuntimeError(result.get("error", "optimize_chapter failed"))
+    optimizer.generate_enhanced_latex(
+        result["knowledge_base_name"],
+        result["recommendations"],
+        output_dir=f"./exp/{EXP_NAME}/enhanced_slides/",
+        exp_name=EXP_NAME
+    )
+
+
+def run_evaluate(args: argparse.Namespace):
+    from src.evaluate import main as evaluate_main
+    if not Path("exp", EXP_NAME).exists():
+        raise RuntimeError("No generated course to evaluate; run the addie pipeline first")
+    evaluate_main(args.model, [EXP_NAME], routing=args.routing, max_workers=args.workers,
+                  scoring_mode=args.scoring_mode, use_cache=False)
+
+
+RUNNERS: Dict[str, Callable[[argparse.Namespace], None]] = {
+    "addie": run_addie,
+    "optimizer": run_optimizer,
+    "evaluate": run_evaluate,
+}
+
+
+def run_pipeline(name: str, args: argparse.Namespace, base_url: str, log) -> Dict[str, Any]:
+    """
+    Run one pipeline and collect its measurements
+
+    Returns:
+        Dictionary with the wall time, the outcome and the server-side counts
+        (calls, tokens, errors and concurrency) of the run
+    """
+    _server_call(base_url, "/_reset", method="POST")
+    error = None
+    start = time.time()
+    with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        print(f"\n{'#'*60}\nBenchmark: {name}\n{'#'*60}\n")
+        try:
+            RUNNERS[name](args)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+    wall_time = time.time() - start
+
+    stats = _server_call(base_url, "/_stats")
+    return {
+        "pipeline": name,
+        "ok": error is None,
+        "error": error,
+        "wall_time": wall_time,
+        "calls": stats["chat_requests"] + stats["embedding_requests"],
+        "chat_requests": stats["chat_requests"],
+        "embedding_requests": stats["embedding_requests"],
+        "rate_limited": stats["rate_limited"],
+        "server_errors": stats["server_errors"],
+        "prompt_tokens": stats["prompt_tokens"],
+        "completion_tokens": stats["completion_tokens"],
+        "cached_tokens": stats["cached_tokens"],
+        "embedding_tokens": stats["embedding_tokens"],
+        "max_concurrency": stats["max_in_flight"],
+        "mean_concurrency": stats["mean_concurrency"],
+        "tokens_per_second": (stats["prompt_tokens"] + stats["completion_tokens"]) / wall_time if wall_time else 0.0
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    header = f"{'pipeline':<10} {'status':<7} {'wall(s)':>8} {'calls':>6} {'429':>5} {'5xx':>5} " \
+             f"{'prompt tok':>11} {'compl tok':>10} {'cached':>8} {'max conc':>9} {'mean conc':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['pipeline']:<10} {'ok' if r['ok'] else 'FAILED':<7} {r['wall_time']:>8.2f} {r['calls']:>6} "
+              f"{r['rate_limited']:>5} {r['server_errors']:>5} {r['prompt_tokens']:>11} {r['completion_tokens']:>10} "
+              f"{r['cached_tokens']:>8} {r['max_concurrency']:>9} {r['mean_concurrency']:>10.2f}")
+    for r in results:
+        if r["error"]:
+            print(f"{r['pipeline']}: {r['error']}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipelines against a mock OpenAI server")
+    parser.add_argument("pipelines", nargs="+", choices=PIPELINES + ["all"], help="Pipelines to run, in order")
+    parser.add_argument("--base-url", default=None,
+                        help="Use a running mock server (e.g. http://127.0.0.1:8765/v1) instead of starting one")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temporary directory)")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--course", default="Introduction to Machine Learning", help="Course name for the addie pipeline")
+    parser.add_argument("--catalog", default=None, help="Catalog name (from the repository's catalog directory)")
+    parser.add_argument("--model", default="gpt-4o-mini", help="Model name sent to the server")
+    parser.add_argument("--routing", default=None, help="Model routing config (JSON string or file)")
+    parser.add_argument("--parallel-rounds", choices=["off", "first_round", "all_rounds"], default="off")
+    parser.add_argument("--history-mode", choices=["full", "rolling"], default="full")
+    parser.add_argument("--workers", type=int, default=8, help="Evaluation workers (default: 8)")
+    parser.add_argument("--scoring-mode", choices=["per_metric", "multi_metric"], default="per_metric")
+    parser.add_argument("--decks", type=int, default=2, help="Synthetic slide decks for the optimizer (default: 2)")
+    parser.add_argument("--deck-slides", type=int, default=6, help="Slides per synthetic deck (default: 6)")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    names = PIPELINES if "all" in args.pipelines else args.pipelines
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="benchmark_")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    if args.catalog and not (workdir / "catalog").exists():
+        (workdir / "catalog").symlink_to(REPO_ROOT / "catalog", target_is_directory=True)
+    log_path = workdir / "benchmark.log"
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = server_from_args(args)
+        base_url = server.start()
+    # Clients read these when they are created, i.e. inside the pipelines
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "mock"
+    sys.path.insert(0, str(REPO_ROOT))
+
+    # The log stays open for the whole session: loggers configured during a
+    # pipeline keep writing to the stream that was current at the time
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        with open(log_path, "a", encoding="utf-8") as log:
+            for name in names:
+                print(f"Running {name} ...", flush=True)
+                results.append(run_pipeline(name, args, base_url, log))
+    finally:
+        os.chdir(cwd)
+        if server:
+            server.stop()
+
+    print()
+    print_report(results)
+    print(f"\nWorking directory: {workdir}\nLog: {log_path}")
+    if args.output:
+        report = {
+            "pipelines": results,
+            "server": None if server is None else {
+                "seed": server.seed, "ttft": server.ttft.spec, "tokens_per_second": server.tokens_per_second,
+                "error_rate": server.error_rate, "rate_limit_rate": server.rate_limit_rate,
+                "max_concurrency": server.max_concurrency, "chapters": server.chapters
+            }
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
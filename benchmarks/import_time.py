@@ -0,0 +1,162 @@
+"""
+Import-Time Budget
+Measures how long the entry points take to import in a fresh interpreter
+and checks them against a budget.
+
+Every entry point is imported several times in a new process (after one
+warm-up import that writes the bytecode caches); the fastest import is
+compared with the budget. Independently of timing, importing an entry point
+must not load any of the heavy dependencies that are imported on first use
+(see src/lazy.py). The exit status is 1 if any entry point is over budget or
+loads a heavy dependency, so the script can run in CI.
+
+Entry points whose third-party dependencies are not installed (e.g. fastapi
+for api_server) are reported and skipped.
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget api_server=800 --repeat 10 --profile
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Entry point -> import-time budget in milliseconds
+DEFAULT_BUDGETS = {
+    "api_server": 1500,
+    "run": 300,
+    "evaluate": 300,
+    "src.slide_optimizer": 300,
+}
+
+# Dependencies that must only be imported when a code path needs them
+HEAVY_MODULES = ["openai", "chromadb", "pdfplumber", "PyPDF2", "numpy", "pandas", "tiktoken"]
+
+SNIPPET = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+error = None
+try:
+    import {module}
+except ModuleNotFoundError as e:
+    error = ["missing", e.name]
+except Exception as e:
+    error = ["error", type(e).__name__ + ": " + str(e)]
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "error": error,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def _import_once(module: str, extra_args: List[str] = None) -> subprocess.CompletedProcess:
+    code = SNIPPET.format(root=str(REPO_ROOT), module=module, heavy=HEAVY_MODULES)
+    return subprocess.run([sys.executable] + (extra_args or []) + ["-c", code],
+                          cwd=REPO_ROOT, capture_output=True, text=True)
+
+
+def measure(module: str, repeat: int) -> Dict[str, Any]:
+    """
+    Import a module in fresh interpreters
+
+    Returns:
+        Dictionary with the fastest and median import time in milliseconds,
+        the peak RSS in MB, the heavy modules loaded and any import error
+    """
+    _import_once(module)    # Warm-up: bytecode caches
+    runs = []
+    for _ in range(repeat):
+        result = _import_once(module)
+        if result.returncode != 0 or not result.stdout.strip():
+            return {"module": module, "error": ["error", (result.stderr.strip().splitlines() or ["no output"])[-1]]}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        if runs[-1]["error"]:
+            return {"module": module, "error": runs[-1]["error"]}
+
+    times = sorted(run["seconds"] * 1000 for run in runs)
+    return {
+        "module": module,
+        "error": None,
+        "min_ms": times[0],
+        "median_ms": times[len(times) // 2],
+        "max_rss_mb": max(run["max_rss_kb"] for run in runs) / 1024,
+        "heavy": runs[-1]["heavy"]
+    }
+
+
+def profile(module: str, top: int = 10) -> List[tuple]:
+    """The modules with the highest cumulative import time (python -X importtime)"""
+    result = _import_once(module, ["-X", "importtime"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check the import time of the entry points against a budget")
+    parser.add_argument("modules", nargs="*", help="Entry points to check (default: all with a budget)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Set or override a budget in milliseconds")
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per entry point (default: 5)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Show the slowest imports of entry points that fail their check")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in args.budget:
+        module, _, ms = item.partition("=")
+        budgets[module] = float(ms)
+    modules = args.modules or list(budgets)
+
+    results = []
+    failed = False
+    print(f"{'entry point':<22} {'min(ms)':>8} {'median':>8} {'budget':>7} {'rss(MB)':>8}  status")
+    for module in modules:
+        result = measure(module, args.repeat)
+        result["budget_ms"] = budgets.get(module)
+        if result["error"]:
+            kind, detail = result["error"]
+            result["status"] = f"skipped (missing {detail})" if kind == "missing" else f"error: {detail}"
+            failed = failed or kind != "missing"
+            print(f"{module:<22} {'-':>8} {'-':>8} {result['budget_ms'] or '-':>7} {'-':>8}  {result['status']}")
+            results.append(result)
+            continue
+
+        problems = []
+        if result["budget_ms"] is not None and result["min_ms"] > result["budget_ms"]:
+            problems.append("over budget")
+        if result["heavy"]:
+            problems.append("loads " + ", ".join(result["heavy"]))
+        result["status"] = "; ".join(problems) or "ok"
+        failed = failed or bool(problems)
+        print(f"{module:<22} {result['min_ms']:>8.0f} {result['median_ms']:>8.0f} {result['budget_ms'] or '-':>7} "
+              f"{result['max_rss_mb']:>8.1f}  {result['status']}")
+        if problems and args.profile:
+            for ms, name in profile(module):
+                print(f"    {ms:>8.1f} ms  {name}")
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
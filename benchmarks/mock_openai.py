@@ -0,0 +1,698 @@
+"""
+Mock OpenAI Server
+Deterministic, OpenAI-compatible stand-in for offline benchmarks.
+
+Endpoints:
+    POST /v1/chat/completions   plain and streaming (SSE) chat completions
+    POST /v1/embeddings         deterministic unit-length embeddings
+    GET  /v1/models             model list
+    GET  /_stats                request, token, error and concurrency counts
+    POST /_reset                clear the counts
+
+Responses are synthesized from the prompt: the server recognizes the prompts
+of the pipeline steps (syllabus processing, slides outline, templates, LaTeX
+frames, assessments, evaluation scores, ...) and answers each with the JSON
+or text structure its parser expects. Content, latency and injected errors
+are drawn from random generators seeded with the prompt, so a run is
+reproducible no matter in which order concurrent requests arrive. Usage
+reports cached prompt tokens like a provider-side prefix cache would.
+
+Usage:
+    python -m benchmarks.mock_openai --port 8765 --ttft lognormal:0.4,0.5 --tokens-per-second 80
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock python run.py "Machine Learning"
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# Rough characters-per-token ratio used for usage accounting
+CHARS_PER_TOKEN = 4
+
+# Prefix cache granularity, like OpenAI's (1024 tokens minimum, 128-token steps)
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+EMBEDDING_DIMENSIONS = 1536
+
+WORDS = (
+    "learning model data students concept example function gradient network training value "
+    "feature practice theory analysis method result system process structure variable "
+    "algorithm evaluation lecture course objective assessment outcome approach knowledge "
+    "problem solution question review principle framework application context design"
+).split()
+
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+class Latency:
+    """
+    Latency distribution parsed from a spec string
+
+    Specs: "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,STDDEV" and
+    "lognormal:MEDIAN,SIGMA", all in seconds.
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, args = spec.partition(":")
+        params = [float(x) for x in args.split(",") if x.strip()]
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Invalid latency spec '{spec}'; expected e.g. fixed:0.2, uniform:0.1,0.5, "
+                             f"normal:0.3,0.1 or lognormal:0.3,0.5")
+        self.spec = spec
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, count)))
+
+
+def _sentence(rng: random.Random, low: int = 6, high: int = 14) -> str:
+    return _words(rng, rng.randint(low, high)).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, tokens: int) -> str:
+    """Markdown prose of roughly the given number of tokens"""
+    parts = []
+    remaining = tokens
+    while remaining > 0:
+        parts.append(f"## {_words(rng, 3).title()}\n\n" + " ".join(_sentence(rng) for _ in range(rng.randint(2, 5))))
+        parts.append("\n".join(f"- {_sentence(rng, 4, 9)}" for _ in range(rng.randint(2, 4))))
+        remaining = tokens - count_tokens("\n\n".join(parts))
+    return "\n\n".join(parts)
+
+
+def _json_after(prompt: str, marker: str) -> Any:
+    """Decode the JSON value following a marker in the prompt, or None"""
+    pos = prompt.find(marker)
+    if pos == -1:
+        return None
+    start = pos + len(marker)
+    while start < len(prompt) and prompt[start] not in "[{":
+        start += 1
+    try:
+        return json.JSONDecoder().raw_decode(prompt, start)[0]
+    except ValueError:
+        return None
+
+
+def _outline_titles(prompt: str) -> List[str]:
+    outline = _json_after(prompt, "Slides Outline:")
+    if isinstance(outline, list) and outline:
+        return [item.get("title", f"Slide {i + 1}") if isinstance(item, dict) else str(item)
+                for i, item in enumerate(outline)]
+    return ["Introduction", "Key Concepts", "Summary"]
+
+
+def _frame(rng: random.Random, title: str) -> str:
+    bullets = "\n".join(f"        \\item {_sentence(rng, 4, 10)}" for _ in range(rng.randint(3, 5)))
+    return (f"\\begin{{frame}}[fragile]\n    \\frametitle{{{title}}}\n"
+            f"    \\begin{{itemize}}\n{bullets}\n    \\end{{itemize}}\n\\end{{frame}}")
+
+
+def _questions(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    return [{
+        "type": "multiple_choice",
+        "question": _sentence(rng)[:-1] + "?",
+        "options": [f"{letter}) {_words(rng, 4)}" for letter in "ABCD"],
+        "correct_answer": rng.choice("ABCD"),
+        "explanation": _sentence(rng)
+    } for _ in range(count)]
+
+
+# Responses per pipeline step: (prompt pattern, generator(prompt, rng, server))
+def _syllabus(prompt, rng, server):
+    return json.dumps([
+        {"title": f"Chapter {i + 1}: {_words(rng, 3).title()}", "description": _sentence(rng)}
+        for i in range(server.chapters)
+    ], indent=2)
+
+
+def _outline(prompt, rng, server):
+    match = re.search(r"about ([\d.]+) slides", prompt)
+    count = server.slides or (max(1, int(float(match.group(1)))) if match else 5)
+    return json.dumps([
+        {"slide_id": i + 1, "title": f"{_words(rng, 3).title()} {i + 1}", "description": _sentence(rng)}
+        for i in range(count)
+    ], indent=2)
+
+
+def _script_template(prompt, rng, server):
+    return json.dumps([
+        {"slide_id": i + 1, "title": title, "script": _sentence(rng)}
+        for i, title in enumerate(_outline_titles(prompt))
+    ], indent=2)
+
+
+def _assessment_template(prompt, rng, server):
+    return json.dumps([
+        {"slide_id": i + 1, "title": title, "assessment": {
+            "questions": _questions(rng, 1), "activities": [_sentence(rng)], "learning_objectives": [_sentence(rng)]
+        }}
+        for i, title in enumerate(_outline_titles(prompt))
+    ], indent=2)
+
+
+def _initial_latex(prompt, rng, server):
+    frames = "\n\n".join(_frame(rng, title) for title in _outline_titles(prompt))
+    return f"\\documentclass{{beamer}}\n\\begin{{document}}\n\n{frames}\n\n\\end{{document}}"
+
+
+def _slide_latex(prompt, rng, server):
+    match = re.search(r"Slide Title: (.*)", prompt)
+    title = match.group(1).strip() if match else "Slide"
+    count = rng.randint(1, 2)
+    return "\n\n".join(_frame(rng, f"{title} - Part {i + 1}" if count > 1 else title) for i in range(count))
+
+
+def _fixed_frame(prompt, rng, server):
+    match = re.search(r"\\frametitle\{([^{}]*)\}", prompt)
+    return _frame(rng, match.group(1) if match else "Slide")
+
+
+def _slide_assessment(prompt, rng, server):
+    slide_id = re.search(r'"slide_id": (\d+)', prompt)
+    title = re.search(r"Slide Title: (.*)", prompt)
+    return json.dumps({
+        "slide_id": int(slide_id.group(1)) if slide_id else 1,
+        "title": title.group(1).strip() if title else "Slide",
+        "assessment": {
+            "questions": _questions(rng, rng.randint(3, 5)),
+            "activities": [_sentence(rng)],
+            "learning_objectives": [_sentence(rng), _sentence(rng)],
+            "discussion_questions": [_sentence(rng)[:-1] + "?"]
+        }
+    }, indent=2)
+
+
+def _multi_score(prompt, rng, server):
+    section = prompt.split("on each of these metrics:", 1)[1].split("Rate the content", 1)[0]
+    metrics = re.findall(r"^\s*- ([^:\n]+):", section, re.MULTILINE)
+    return json.dumps({
+        metric.strip(): {"THOUGHT": _sentence(rng), "SCORE": round(rng.uniform(2.0, 5.0), 1)} for metric in metrics
+    })
+
+
+def _score(prompt, rng, server):
+    return json.dumps({"THOUGHT": _sentence(rng), "SCORE": round(rng.uniform(2.0, 5.0), 1)})
+
+
+def _enhancement(prompt, rng, server):
+    return (f"**Enhanced Title:** {_words(rng, 4).title()}\n\n**Enhanced Content:**\n"
+            f"{_paragraphs(rng, server.sample_length(rng) // 2)}\n\n**Key Improvements Made:**\n- {_sentence(rng)}")
+
+
+STEP_RESPONSES = [
+    (re.compile(r"extract its weekly topics"), _syllabus),
+    (re.compile(r"create a detailed slides outline"), _outline),
+    (re.compile(r"create a template for slides scripts"), _script_template),
+    (re.compile(r"create an assessment template"), _assessment_template),
+    (re.compile(r"generate initial LaTeX code"), _initial_latex),
+    (re.compile(r"generate LaTeX code for a presentation slide"), _slide_latex),
+    (re.compile(r"beamer frame does not compile"), _fixed_frame),
+    (re.compile(r"generate detailed assessment content"), _slide_assessment),
+    (re.compile(r"on each of these metrics:"), _multi_score),
+    (re.compile(r'"SCORE"'), _score),
+    (re.compile(r"Enhanced Title"), _enhancement),
+]
+
+
+class PrefixCache:
+    """Set of prompt prefixes seen so far, at the provider's block granularity"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prefixes = set()
+
+    def lookup_and_add(self, text: str) -> int:
+        """Return the cached prompt tokens for text and remember its prefixes"""
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        minimum = CACHE_MIN_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha1()
+        keys = []
+        for end in range(block, len(text) + 1, block):
+            digest.update(text[end - block:end].encode("utf-8"))
+            if end >= minimum:
+                keys.append((end, digest.hexdigest()))
+        cached = 0
+        with self.lock:
+            for end, key in keys:
+                if key not in self.prefixes:
+                    break
+                cached = end
+            self.prefixes.update(key for _, key in keys)
+        return cached // CHARS_PER_TOKEN
+
+
+class MockOpenAIServer:
+    """
+    In-process mock server
+
+    Start it with start() (serves from a daemon thread) or serve_forever(),
+    then point OpenAI clients at base_url, e.g. through OPENAI_BASE_URL.
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 seed: int = 0,
+                 ttft: str = "fixed:0",
+                 tokens_per_second: float = 0.0,
+                 embedding_latency: str = "fixed:0",
+                 completion_tokens: str = "uniform:150,400",
+                 error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 retry_after: float = 0.5,
+                 max_concurrency: int = 0,
+                 chapters: int = 3,
+                 slides: int = 0,
+                 responses: Optional[List[Dict[str, Any]]] = None):
+        """
+        Initialize MockOpenAIServer
+
+        Args:
+            host: Interface to listen on
+            port: Port (0 picks a free port)
+            seed: Seed mixed into every random draw
+            ttft: Latency spec of the time to first token
+            tokens_per_second: Streaming speed (0 sends the whole response at once)
+            embedding_latency: Latency spec of embedding requests
+            completion_tokens: Spec of the length of free-text responses, in tokens
+            error_rate: Share of requests answered with a 500 error
+            rate_limit_rate: Share of requests answered with a 429 error
+            retry_after: Retry-After seconds sent with 429 errors
+            max_concurrency: Requests in flight beyond this get a 429 (0 means no limit)
+            chapters: Number of chapters returned for a syllabus
+            slides: Number of slides per outline (0 follows the count asked for in the prompt)
+            responses: Canned responses checked before the built-in ones, each
+                {"match": regex, "response": text or JSON value}
+        """
+        self.seed = seed
+        self.ttft = Latency(ttft)
+        self.tokens_per_second = tokens_per_second
+        self.embedding_latency = Latency(embedding_latency)
+        self.completion_tokens = Latency(completion_tokens)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.chapters = chapters
+        self.slides = slides
+        self.canned = [(re.compile(item["match"]), item["response"]) for item in (responses or [])]
+
+        self.cache = PrefixCache()
+        self.lock = threading.Lock()
+        self.occurrences = {}
+        self.reset_stats()
+
+        handler = type("MockOpenAIHandler", (MockOpenAIHandler,), {"server_state": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """Serve from a daemon thread; returns the base URL"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Statistics
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {
+                "chat_requests": 0, "stream_requests": 0, "embedding_requests": 0, "embedding_inputs": 0,
+                "rate_limited": 0, "server_errors": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "embedding_tokens": 0,
+                "max_in_flight": 0
+            }
+            self.in_flight = 0
+            self.busy_area = 0.0       # Integral of in-flight requests over time
+            self.last_change = None
+            self.first_request = None
+            self.last_request_end = None
+
+    def _update_in_flight(self, delta: int) -> int:
+        """Change the in-flight count (under self.lock); returns the new count"""
+        now = time.time()
+        if self.last_change is not None:
+            self.busy_area += self.in_flight * (now - self.last_change)
+        self.last_change = now
+        if self.first_request is None:
+            self.first_request = now
+        self.in_flight += delta
+        if delta < 0:
+            self.last_request_end = now
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        return self.in_flight
+
+    def report(self) -> Dict[str, Any]:
+        """Counts plus the mean concurrency between the first request and the last response"""
+        with self.lock:
+            report = dict(self.stats)
+            span = (self.last_request_end or 0) - (self.first_request or 0)
+            report["in_flight"] = self.in_flight
+            report["active_seconds"] = span if span > 0 else 0.0
+            report["mean_concurrency"] = self.busy_area / span if span > 0 else 0.0
+            cacheable = report["prompt_tokens"]
+            report["cached_ratio"] = report["cached_tokens"] / cacheable if cacheable else 0.0
+            return report
+
+    # Request handling
+
+    def request_rng(self, kind: str, body: Dict[str, Any]) -> tuple:
+        """
+        Random generators for a request
+
+        Returns:
+            Tuple of (content rng, fault rng): the content generator depends only
+            on the request, the fault generator also on how often the same request
+            was seen, so a retried request draws new latency and errors
+        """
+        key = hashlib.sha256(json.dumps([kind, body.get("model"), body.get("messages", body.get("input"))],
+                                        sort_keys=True).encode("utf-8")).hexdigest()
+        with self.lock:
+            occurrence = self.occurrences.get(key, 0)
+            self.occurrences[key] = occurrence + 1
+        return random.Random(f"{self.seed}:{key}"), random.Random(f"{self.seed}:{key}:{occurrence}")
+
+    def admit(self, fault_rng: random.Random) -> Optional[tuple]:
+        """
+        Start a request, or refuse it
+
+        Returns:
+            None if admitted, otherwise (status, error type, message)
+        """
+        with self.lock:
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                self.stats["rate_limited"] += 1
+                return 429, "rate_limit_exceeded", "Too many concurrent requests"
+            roll = fault_rng.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429, "rate_limit_exceeded", "Injected rate limit"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["server_errors"] += 1
+                return 500, "server_error", "Injected server error"
+            self._update_in_flight(1)
+        return None
+
+    def finish(self):
+        with self.lock:
+            self._update_in_flight(-1)
+
+    def sample_length(self, rng: random.Random) -> int:
+        return max(1, int(self.completion_tokens.sample(rng)))
+
+    def chat_response(self, body: Dict[str, Any], rng: random.Random) -> str:
+        """Synthesize the assistant message for a chat request"""
+        messages = body.get("messages", [])
+        prompt = messages[-1].get("content", "") if messages else ""
+        if not isinstance(prompt, str):
+            prompt = json.dumps(prompt)
+        for pattern, response in self.canned:
+            if pattern.search(prompt):
+                return response if isinstance(response, str) else json.dumps(response, indent=2)
+        for pattern, generate in STEP_RESPONSES:
+            if pattern.search(prompt):
+                return generate(prompt, rng, self)
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"result": _paragraphs(rng, self.sample_length(rng))})
+        return _paragraphs(rng, self.sample_length(rng))
+
+    def record_chat(self, stream: bool, prompt_tokens: int, completion_tokens: int, cached_tokens: int):
+        with self.lock:
+            self.stats["chat_requests"] += 1
+            self.stats["stream_requests"] += int(stream)
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            self.stats["cached_tokens"] += cached_tokens
+
+    def record_embeddings(self, inputs: int, tokens: int):
+        with self.lock:
+            self.stats["embedding_requests"] += 1
+            self.stats["embedding_inputs"] += inputs
+            self.stats["embedding_tokens"] += tokens
+
+
+def _embedding(text: str, seed: int, dimensions: int) -> List[float]:
+    """Deterministic unit vector for a text"""
+    rng = random.Random(f"{seed}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}")
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """HTTP handler; server_state is set on the subclass created by MockOpenAIServer"""
+
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, error_type: str, message: str):
+        headers = {"Retry-After": str(self.server_state.retry_after)} if status == 429 else None
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": error_type}}, headers)
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        state = self.server_state
+        if self.path.rstrip("/") == "/_stats":
+            self._send_json(200, state.report())
+        elif self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model", "owned_by": "mock"}
+                for model in ("gpt-4o-mini", "gpt-4o", "gpt-4.1-nano", "text-embedding-3-small")
+            ]})
+        else:
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+
+    def do_POST(self):
+        state = self.server_state
+        path = self.path.rstrip("/")
+        try:
+            body = self._read_body()
+        except ValueError:
+            self._send_error(400, "invalid_request_error", "Request body is not valid JSON")
+            return
+
+        if path == "/_reset":
+            state.reset_stats()
+            self._send_json(200, {"ok": True})
+        elif path == "/v1/chat/completions":
+            self._chat(body)
+        elif path == "/v1/embeddings":
+            self._embeddings(body)
+        else:
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+
+    def _chat(self, body: Dict[str, Any]):
+        state = self.server_state
+        content_rng, fault_rng = state.request_rng("chat", body)
+        refused = state.admit(fault_rng)
+        if refused:
+            self._send_error(*refused)
+            return
+        try:
+            text = state.chat_response(body, content_rng)
+            prompt_text = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+            usage = {
+                "prompt_tokens": count_tokens(prompt_text),
+                "completion_tokens": count_tokens(text),
+                "prompt_tokens_details": {"cached_tokens": state.cache.lookup_and_add(prompt_text)}
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            stream = bool(body.get("stream"))
+            state.record_chat(stream, usage["prompt_tokens"], usage["completion_tokens"],
+                              usage["prompt_tokens_details"]["cached_tokens"])
+
+            time.sleep(state.ttft.sample(fault_rng))
+            completion_id = f"chatcmpl-{uuid.UUID(int=content_rng.getrandbits(128)).hex}"
+            model = body.get("model", "gpt-4o-mini")
+            if stream:
+                include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+                self._stream(completion_id, model, text, usage if include_usage else None)
+            else:
+                if state.tokens_per_second > 0:
+                    time.sleep(usage["completion_tokens"] / state.tokens_per_second)
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+        finally:
+            state.finish()
+
+    def _stream(self, completion_id: str, model: str, text: str, usage: Optional[Dict[str, Any]]):
+        """Send a completion as server-sent events, paced at tokens_per_second"""
+        state = self.server_state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(choices, extra=None):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": choices}
+            payload.update(extra or {})
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n")
+
+        # One chunk per token-sized piece of text
+        pieces = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        start = time.time()
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for i, piece in enumerate(pieces):
+            if state.tokens_per_second > 0:
+                delay = start + (i + 1) / state.tokens_per_second - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage:
+            event([], {"usage": usage})
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _embeddings(self, body: Dict[str, Any]):
+        state = self.server_state
+        content_rng, fault_rng = state.request_rng("embeddings", body)
+        refused = state.admit(fault_rng)
+        if refused:
+            self._send_error(*refused)
+            return
+        try:
+            inputs = body.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+            dimensions = int(body.get("dimensions") or EMBEDDING_DIMENSIONS)
+            tokens = sum(count_tokens(str(text)) for text in inputs)
+            state.record_embeddings(len(inputs), tokens)
+            time.sleep(state.embedding_latency.sample(fault_rng))
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"object": "embedding", "index": i, "embedding": _embedding(str(text), state.seed, dimensions)}
+                         for i, text in enumerate(inputs)],
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+            })
+        finally:
+            state.finish()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """Add the mock server options to an argument parser"""
+    parser.add_argument("--seed", type=int, default=0, help="Seed of all random draws (default: 0)")
+    parser.add_argument("--ttft", default="fixed:0",
+                        help="Time to first token: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Streaming speed per request (default: 0, no pacing)")
+    parser.add_argument("--embedding-latency", default="fixed:0", help="Latency of embedding requests")
+    parser.add_argument("--completion-tokens", default="uniform:150,400",
+                        help="Length distribution of free-text responses, in tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds of 429 responses")
+    parser.add_argument("--server-max-concurrency", type=int, default=0,
+                        help="Answer requests beyond this many in flight with 429 (default: 0, unlimited)")
+    parser.add_argument("--chapters", type=int, default=3, help="Chapters per syllabus (default: 3)")
+    parser.add_argument("--slides", type=int, default=0,
+                        help="Slides per outline (default: 0, the number the prompt asks for)")
+    parser.add_argument("--responses", default=None,
+                        help="JSON file with canned responses: [{\"match\": regex, \"response\": ...}]")
+
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> MockOpenAIServer:
+    """Create a MockOpenAIServer from parsed add_server_arguments() options"""
+    responses = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+    return MockOpenAIServer(
+        host=host,
+        port=port,
+        seed=args.seed,
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        embedding_latency=args.embedding_latency,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        max_concurrency=args.server_max_concurrency,
+        chapters=args.chapters,
+        slides=args.slides,
+        responses=responses
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, host=args.host, port=args.port)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    print(f"Use it with: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
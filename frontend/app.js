@@ -81,6 +81,8 @@ const translations = {
         copyPathSuccess: '✅ 路径已复制到剪贴板！\n\n{path}',
         copyPathFailure: '❌ 无法自动复制，请手动复制：\n\n{path}',
         downloadLabel: '📥 下载',
+        downloadAllLabel: '📦 下载全部 (.tar)',
+        downloadChapterLabel: '📦 下载本章',
         newBadgeLabel: '<span class="new-badge">🆕 新</span>',
         statusPending: '等待中',
         statusRunning: '运行中',
@@ -214,6 +216,8 @@ const translations = {
         copyPathSuccess: '✅ Path copied to clipboard!\n\n{path}',
         copyPathFailure: '❌ Could not copy automatically. Please copy manually:\n\n{path}',
         downloadLabel: '📥 Download',
+        downloadAllLabel: '📦 Download all (.tar)',
+        downloadChapterLabel: '📦 Download chapter',
         newBadgeLabel: '<span class="new-badge">🆕 New</span>',
         statusPending: 'Pending',
         statusRunning: 'Running',
@@ -1119,6 +1123,13 @@ function displayFiles(files, taskStatus, newFiles = [], expName = null) {
         </div>
     `;
 
+    const archiveUrl = `${API_BASE_URL}/api/course/results/${currentTaskId}/archive`;
+    html += `
+        <div style="margin: 10px 0;">
+            <a href="${archiveUrl}" class="btn btn-primary" download>${t('downloadAllLabel')}</a>
+        </div>
+    `;
+
     html += '<div class="file-groups">';
 
     const sortedDirs = Object.keys(fileGroups).sort((a, b) => {
@@ -1131,7 +1142,11 @@ function displayFiles(files, taskStatus, newFiles = [], expName = null) {
         const dirFiles = fileGroups[dir];
         html += `<div class="file-group">`;
         if (dir !== ROOT_DIR_KEY) {
-            html += `<h4 class="file-group-title">📁 ${dir}</h4>`;
+            const chapterMatch = dir.match(/^chapter_(\d+)$/);
+            const chapterLink = chapterMatch
+                ? ` <a href="${archiveUrl}?chapters=${chapterMatch[1]}&include_root=false" class="btn-small" download>${t('downloadChapterLabel')}</a>`
+                : '';
+            html += `<h4 class="file-group-title">📁 ${dir}${chapterLink}</h4>`;
         }
         html += '<ul class="file-list">';
 
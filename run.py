@@ -36,7 +36,7 @@ def load_catalog(catalog_dir: str = "catalog", catalog_name: str = "merged_catal
     return data_catalog
 
 
-def run_instructional_design(course_name: str, copilot = None, catalog = None, model_name: str = "gpt-4o-mini", exp_name: str = "test"):
+def run_instructional_design(course_name: str, copilot = None, catalog = None, model_name: str = "gpt-4o-mini", exp_name: str = "test", context_budget: int = 6000, parallel_rounds: str = "off", history_mode: str = "full", routing=None, batch: str = None):
     """
     Main function to run the instructional design workflow by sequentially
     executing the six deliberation processes
@@ -45,6 +45,11 @@ def run_instructional_design(course_name: str, copilot = None, catalog = None, m
         copilot: Whether to enable copilot mode with user feedback
         model_name: Name of the LLM model to use
         exp_name: Name of the experiment for logging purposes
+        context_budget: Token budget for the prior-results context of each deliberation
+        parallel_rounds: Parallel round mode of the foundation deliberations
+        history_mode: Discussion history of multi-round deliberations (full or rolling)
+        routing: Model routing config (dict, JSON string or file path)
+        batch: Submit per-slide generation as batches ("openai", "local" or None)
     
     Returns:
         List of results from each process
@@ -93,7 +98,7 @@ def run_instructional_design(course_name: str, copilot = None, catalog = None, m
     print("Using catalog data for the workflow.")
 
 
-    addie = ADDIE(course_name, model_name=model_name, copilot=use_copilot, catalog=use_catalog, data_catalog=data_catalog, data_copilot=data_copilot)
+    addie = ADDIE(course_name, model_name=model_name, copilot=use_copilot, catalog=use_catalog, data_catalog=data_catalog, data_copilot=data_copilot, context_budget=context_budget, parallel_rounds=parallel_rounds, history_mode=history_mode, routing=routing, batch=batch)
 
     # Run the workflow
     output_dir = f"./exp/{exp_name}/"
@@ -151,6 +156,41 @@ if __name__ == "__main__":
         help="Experiment name for logging"
     )
 
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=6000,
+        help="Token budget for the prior-results context of each deliberation (default: 6000)"
+    )
+
+    parser.add_argument(
+        "--parallel-rounds",
+        choices=["off", "first_round", "all_rounds"],
+        default="off",
+        help="Query the agents of a deliberation round concurrently (default: off)"
+    )
+
+    parser.add_argument(
+        "--history-mode",
+        choices=["full", "rolling"],
+        default="full",
+        help="Keep the full discussion history or summarize rounds older than the previous one (default: full)"
+    )
+
+    parser.add_argument(
+        "--routing",
+        type=str,
+        default=None,
+        help="Model routing config as a JSON string or path to a JSON file"
+    )
+
+    parser.add_argument(
+        "--batch",
+        choices=["openai", "local"],
+        default=None,
+        help="Submit per-slide generation through the Batch API (openai) or the local file-based stand-in (local)"
+    )
+
     args = parser.parse_args()
 
     # Run workflow with specified options
@@ -160,4 +200,9 @@ if __name__ == "__main__":
         catalog=args.catalog,
         model_name=args.model,
         exp_name=args.exp,
+        context_budget=args.context_budget,
+        parallel_rounds=args.parallel_rounds,
+        history_mode=args.history_mode,
+        routing=args.routing,
+        batch=args.batch,
     )
\ No newline at end of file
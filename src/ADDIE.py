@@ -1,7 +1,7 @@
 import os
 import json
-import re
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional
 
 from src.agents import (
     LLM,
@@ -9,8 +9,33 @@ from src.agents import (
     Deliberation,
 )
 
-from src.slides import SlidesDeliberation
+from src.slides import SlidesDeliberation, SlideUtils
 from src.compile import LaTeXCompiler
+from src.context import ContextBuilder
+from src.scheduler import DeliberationScheduler, ChapterScheduler
+from src.router import ModelRouter
+from src.batch import BatchExecutor
+from src.structured import ArrayStreamListener, ParseError, parse_json, parse_stats
+from src.latex_lint import lint_stats
+from src.prompts import prefix_stats
+from src.tracing import export_chrome_trace, in_context, span, trace, tracer
+
+# Key under which the course name is stored alongside deliberation results
+COURSE_NAME_KEY = "course_name"
+
+# Chapter list returned by the SyllabusProcessor
+CHAPTERS_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "required": ["title", "description"],
+        "properties": {"title": {"type": "string"}, "description": {"type": "string"}}
+    }
+}
+
+# Foundation results the chapter-level SlidesDeliberation reads
+CHAPTER_INPUTS = [COURSE_NAME_KEY, "instructional_goals", "syllabus_design", "assessment_planning"]
 
 class SyllabusProcessor(Agent):
     """
@@ -24,12 +49,15 @@ class SyllabusProcessor(Agent):
             system_prompt="You are a Syllabus Processor responsible for analyzing a course syllabus and extracting its weekly topics and schedule. Your task is to create a structured list of chapters, each with a title and brief introduction. The format should be clear and consistent, making it easy to understand the course structure."
         )
     
-    def process_syllabus(self, syllabus_content: str) -> List[Dict[str, str]]:
+    def process_syllabus(self, syllabus_content: str,
+                         on_chapter: Optional[Callable[[Dict[str, str]], None]] = None) -> List[Dict[str, str]]:
         """
         Process the syllabus content and return a list of chapters
         
         Args:
             syllabus_content: The raw syllabus content
+            on_chapter: Optional callback receiving each chapter as soon as it
+                has been streamed, before the rest of the list is generated
             
         Returns:
             A list of dictionaries, each containing 'title' and 'description' for a chapter
@@ -57,38 +85,24 @@ class SyllabusProcessor(Agent):
         # Reset message history to ensure a clean context
         self.reset_history()
         
+        # Emit chapters while the response is streaming
+        listener = ArrayStreamListener(on_chapter, CHAPTERS_SCHEMA["items"]) if on_chapter else None
+        
         # Get the response from the LLM
         response, elapsed_time, token_usage = self.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False  # No need to save this interaction in history
+            save_to_history=False,  # No need to save this interaction in history
+            step="syllabus_processing",
+            listener=listener
         )
         
         # Parse the JSON response
         try:
-            # First try to parse the entire response as JSON
-            try:
-                chapters = json.loads(response)
-                return chapters
-            except json.JSONDecodeError:
-                # If that fails, try to extract JSON from the response
-                json_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    chapters = json.loads(json_str)
-                    return chapters
-                else:
-                    # If no JSON array pattern is found, try to extract individual chapter objects
-                    chapter_matches = re.findall(r'\{\s*"title"\s*:\s*"[^"]*"\s*,\s*"description"\s*:\s*"[^"]*"\s*\}', response)
-                    if chapter_matches:
-                        # Combine individual objects into an array
-                        combined_json = "[" + ",".join(chapter_matches) + "]"
-                        chapters = json.loads(combined_json)
-                        return chapters
-                    else:
-                        raise ValueError("No valid JSON found in response")
-            
-        except (json.JSONDecodeError, ValueError) as e:
+            chapters = parse_json(response, expect="array", schema=CHAPTERS_SCHEMA,
+                                  name="syllabus_chapters", drop_invalid_items=True)
+            return listener.merge(chapters) if listener else chapters
+        except ParseError as e:
             print(f"Error: Could not parse JSON response from LLM: {e}")
             print("Response:", response)
             raise ValueError("Failed to process syllabus into chapters")
@@ -110,7 +124,11 @@ class ADDIERunner:
         self.course_name = None
         self.output_dir = output_dir
         self.results = []
+        self.result_map = {}  # Deliberation ID -> result, in completion order
+        self.chapter_context = None
         self.chapters = []
+        # Set in automatic mode, where chapters start while the syllabus is processed
+        self.chapter_scheduler = None
 
         # Store these for retry logic with slides
         self.latex_source = None
@@ -124,6 +142,7 @@ class ADDIERunner:
             raise ValueError("Course name or topic is required to proceed.")
         
         self.results = [self.course_name]
+        self.result_map = {COURSE_NAME_KEY: self.course_name}
     
     def run_foundation_deliberations(self):
         """Run the first 6 foundational deliberations"""
@@ -132,6 +151,35 @@ class ADDIERunner:
         # Get the first 6 deliberations
         foundation_deliberations = self.addie.deliberations
         
+        # Human-readable labels for the context sections
+        labels = {COURSE_NAME_KEY: "Course"}
+        labels.update({d.id: d.name for d in foundation_deliberations})
+        
+        # Without user interaction, independent deliberations run concurrently.
+        # The syllabus is processed as soon as its deliberation finishes, and
+        # each streamed chapter starts once the results chapters read are ready
+        if not self.addie.copilot:
+            self.chapter_scheduler = ChapterScheduler(self._run_chapter)
+            try:
+                with ThreadPoolExecutor(max_workers=1) as syllabus_executor:
+                    syllabus_futures = []
+                    
+                    def on_result(deliberation_id):
+                        if deliberation_id == "syllabus_design":
+                            syllabus_futures.append(syllabus_executor.submit(in_context(self._process_syllabus, "syllabus", "step")))
+                        if self.chapter_context is None and all(key in self.result_map for key in CHAPTER_INPUTS):
+                            self.chapter_context = self._chapter_context()
+                            self.chapter_scheduler.open()
+                    
+                    self._run_foundation_graph(foundation_deliberations, labels, on_result)
+                for future in syllabus_futures:
+                    future.result()
+            except BaseException:
+                # Chapters may already be running; do not start any more for a failed run
+                self.chapter_scheduler.cancel()
+                raise
+            return
+        
         # Run each deliberation in sequence
         i = 0
         statistics = []
@@ -154,9 +202,14 @@ class ADDIERunner:
                 \n\n'''
                 print(f"User suggestions loaded: {user_suggestion}")
             
-            # Run deliberation with current state and user suggestion
-            result, elapsed_time, token_usage = deliberation.run(current_context=str(self.results), user_suggestion=user_suggestion)
-            statistics.append({"elapsed_time": elapsed_time, "token_usage": token_usage})
+            # Run deliberation with its declared inputs and user suggestion
+            context = deliberation.build_context(self._prior_results(deliberation), labels)
+            result, elapsed_time, token_usage = deliberation.run(current_context=context, user_suggestion=user_suggestion)
+            stats = {"elapsed_time": elapsed_time, "token_usage": token_usage}
+            if deliberation.context_report:
+                stats["context_tokens"] = deliberation.context_report["context_tokens"]
+                stats["context_tokens_saved"] = deliberation.context_report["tokens_saved"]
+            statistics.append(stats)
 
             with open(os.path.join(self.output_dir, "statistics.json"), "w") as f:
                 json.dump(statistics, f, indent=2)
@@ -166,6 +219,7 @@ class ADDIERunner:
                 self.results.append(result)
             else:
                 self.results[i+1] = result  # +1 to skip the course name
+            self.result_map[deliberation.id] = result
             
             # Save the result to file
             self._save_result(deliberation, result)
@@ -182,6 +236,62 @@ class ADDIERunner:
         # After running the syllabus design deliberation, process the syllabus
         self._process_syllabus()
     
+    def _run_foundation_graph(self, foundation_deliberations, labels, on_result=None):
+        """
+        Run the foundation deliberations as a dependency graph of their declared inputs
+        
+        Args:
+            foundation_deliberations: Deliberations to run
+            labels: Context section labels
+            on_result: Optional callback with the deliberation ID, called after
+                each result has been recorded
+        """
+        statistics = [None] * len(foundation_deliberations)
+        positions = {d.id: idx for idx, d in enumerate(foundation_deliberations)}
+        self.results = [self.course_name] + [None] * len(foundation_deliberations)
+        
+        def run_deliberation(deliberation, upstream):
+            context = deliberation.build_context(upstream, labels)
+            return deliberation.run(current_context=context, user_suggestion="")
+        
+        def record(deliberation, output):
+            result, elapsed_time, token_usage = output
+            idx = positions[deliberation.id]
+            stats = {"elapsed_time": elapsed_time, "token_usage": token_usage}
+            if deliberation.context_report:
+                stats["context_tokens"] = deliberation.context_report["context_tokens"]
+                stats["context_tokens_saved"] = deliberation.context_report["tokens_saved"]
+            statistics[idx] = stats
+            
+            with open(os.path.join(self.output_dir, "statistics.json"), "w") as f:
+                json.dump([s for s in statistics if s is not None], f, indent=2)
+            
+            self.results[idx + 1] = result  # +1 to skip the course name
+            self._save_result(deliberation, result)
+            if on_result:
+                on_result(deliberation.id)
+        
+        scheduler = DeliberationScheduler(foundation_deliberations, self.result_map)
+        scheduler.run(run_deliberation, on_complete=record)
+    
+    def _prior_results(self, deliberation) -> Dict[str, str]:
+        """Get the results of the deliberations listed before the given one"""
+        earlier = [COURSE_NAME_KEY]
+        for d in self.addie.deliberations:
+            if d.id == deliberation.id:
+                break
+            earlier.append(d.id)
+        return {key: self.result_map[key] for key in earlier if key in self.result_map}
+    
+    def _chapter_context(self) -> str:
+        """Build the compressed foundation context shared by all chapters"""
+        labels = {COURSE_NAME_KEY: "Course"}
+        labels.update({d.id: d.name for d in self.addie.deliberations})
+        sections = [(labels.get(key, key), self.result_map[key]) for key in CHAPTER_INPUTS if key in self.result_map]
+        context, report = self.addie.context_builder.build(sections, baseline=str(self.results))
+        print(f"[Chapter context: {report['context_tokens']} tokens, saved {report['tokens_saved']} tokens per chapter]")
+        return context
+    
     def _process_syllabus(self):
         """Process the syllabus to extract chapters"""
         # Get the syllabus design result 
@@ -193,7 +303,21 @@ class ADDIERunner:
             
             # Create and use the SyllabusProcessor agent
             processor = SyllabusProcessor(llm=self.addie.llm)
-            self.chapters = processor.process_syllabus(syllabus_content)
+            on_chapter = None
+            if self.chapter_scheduler is not None:
+                # Schedule each chapter as soon as it has been streamed
+                self.chapters = []
+                
+                def on_chapter(chapter):
+                    self.chapters.append(chapter)
+                    print(f"\nChapter {len(self.chapters)} received: {chapter['title']}")
+                    self.chapter_scheduler.add(len(self.chapters) - 1, chapter)
+            
+            self.chapters = processor.process_syllabus(syllabus_content, on_chapter=on_chapter)
+            if self.chapter_scheduler is not None:
+                # Chapters that were not recognized while streaming
+                for chapter_idx, chapter in enumerate(self.chapters):
+                    self.chapter_scheduler.add(chapter_idx, chapter)
             
             # Save the processed chapters
             self._save_chapters()
@@ -238,21 +362,48 @@ class ADDIERunner:
         
         print(f"\n{'#'*60}\nStarting ADDIE Workflow: Chapter Development Phase\n{'#'*60}\n")
         
-        # For each chapter, run the SlidesDeliberation
-        for chapter_idx, chapter in enumerate(self.chapters):
-            print(f"\n{'#'*50}\nChapter {chapter_idx+1}/{len(self.chapters)}: {chapter['title']}\n{'#'*50}\n")
-            
-            # Create chapter directory
-            chapter_dir = os.path.join(self.output_dir, f"chapter_{chapter_idx+1}")
-            os.makedirs(chapter_dir, exist_ok=True)
-            
-            # Run SlidesDeliberation for this chapter with retry support
-            self._run_slides_generation_with_retry(chapter, chapter_idx, chapter_dir)
+        if self.chapter_scheduler is not None:
+            # Chapters were started during the foundation phase
+            self.chapter_scheduler.wait()
+        else:
+            # For each chapter, run the SlidesDeliberation
+            for chapter_idx, chapter in enumerate(self.chapters):
+                with span("chapter", "chapter", index=chapter_idx + 1, title=chapter.get("title")):
+                    self._run_chapter(chapter_idx, chapter)
+        
+        # After all chapters, compile the LaTeX source and slides script; frames
+        # that break the compilation are sent back for repair or left out
+        compiler = LaTeXCompiler(self.output_dir, repair_frame=self._repair_frame)
+        with span("compile", "compile"):
+            compiler.compile_all()
+        
+    def _repair_frame(self, frame, errors):
+        """Ask the model to fix a frame that does not compile; returns the fixed frame or None"""
+        fixer = Agent(
+            name="LaTeX Fixer",
+            role="Expert fixing LaTeX beamer frames",
+            llm=self.addie.llm
+        )
+        response, _, _ = fixer.generate_response(
+            prompt=SlideUtils.generate_latex_fix_prompt(frame, errors),
+            stream=True,
+            save_to_history=False,
+            step="latex"
+        )
+        frames = SlideUtils.extract_latex_frames(response)
+        return SlideUtils.repair_latex_frames(frames[:1])[0]["frame"] if frames else None
+    
+    def _run_chapter(self, chapter_idx, chapter):
+        """Generate the slides of one chapter"""
+        print(f"\n{'#'*50}\nChapter {chapter_idx+1}/{len(self.chapters)}: {chapter['title']}\n{'#'*50}\n")
         
-        # After all chapters, compile the LaTeX source and slides script
-        compiler = LaTeXCompiler(self.output_dir)
-        compiler.compile_all()
+        # Create chapter directory
+        chapter_dir = os.path.join(self.output_dir, f"chapter_{chapter_idx+1}")
+        os.makedirs(chapter_dir, exist_ok=True)
         
+        # Run SlidesDeliberation for this chapter with retry support
+        self._run_slides_generation_with_retry(chapter, chapter_idx, chapter_dir)
+    
     def _run_slides_generation_with_retry(self, chapter, chapter_idx, chapter_dir):
         """Run slides generation with retry support"""
         print(f"\n{'#'*40}\nSlides Generation for Chapter {chapter_idx+1}: {len(self.chapters)}: {chapter['title']}\n{'#'*40}\n")
@@ -264,8 +415,10 @@ class ADDIERunner:
             user_suggestion = input("Your suggestion: ").strip()
         
         # Create context for slides deliberation
+        if self.chapter_context is None:
+            self.chapter_context = self._chapter_context()
         slides_context = {
-            "foundation_results": self.results,
+            "foundation_results": self.chapter_context,
             "course_name": self.course_name,
             "slides": "",
             "script": "",
@@ -378,6 +531,7 @@ class ADDIERunner:
             output_dir=os.path.join(self.output_dir, chapter_dir_name),
             catalog=self.addie.catalog,
             catalog_dict=self.addie.catalog_dict,
+            batch_executor=self.addie.batch_executor,
         )
     
     def _save_result(self, deliberation, result):
@@ -423,7 +577,9 @@ class ADDIERunner:
             context_str = str(original_context)
         else:
             # Foundation deliberation context
-            context_str = str(self.results)
+            labels = {COURSE_NAME_KEY: "Course"}
+            labels.update({d.id: d.name for d in self.addie.deliberations})
+            context_str = deliberation.build_context(self._prior_results(deliberation), labels)
         
         # Keep track of previous user suggestions to include in each retry
         previous_suggestions = []
@@ -461,8 +617,9 @@ class ADDIERunner:
                 self._save_chapter_result(deliberation, result, chapter_idx, chapter_dir)
             else:
                 # Re-run foundation deliberation with combined suggestions but original context
-                result = deliberation.run(current_context=context_str, user_suggestion=combined_suggestions)
+                result, _, _ = deliberation.run(current_context=context_str, user_suggestion=combined_suggestions)
                 self.results[idx] = result
+                self.result_map[deliberation.id] = result
                 self._save_result(deliberation, result)
             
             # Ask if the user is satisfied or wants to retry again
@@ -510,19 +667,28 @@ class ADDIE:
     ADDIE (Analyze, Design, Develop, Implement, Evaluate) class for instructional design
     This class coordinates a series of deliberations to create a complete course design
     """
-    def __init__(self, course_name, model_name: str = "gpt-4o-mini", copilot: bool = False, catalog: bool = False, data_catalog: dict = {}, data_copilot: dict = {}):
+    def __init__(self, course_name, model_name: str = "gpt-4o-mini", copilot: bool = False, catalog: bool = False, data_catalog: dict = {}, data_copilot: dict = {}, context_budget: int = 6000, parallel_rounds: str = "off", history_mode: str = "full", routing=None, batch: str = None):
         """
         Initialize ADDIE workflow
         
         Args:
             model_name: Name of the LLM model to use
             copilot: Whether to enable copilot mode with user feedback
+            context_budget: Token budget for the prior-results context of each deliberation
+            parallel_rounds: Parallel round mode of the foundation deliberations (off, first_round, all_rounds)
+            history_mode: Discussion history of multi-round deliberations (full, or rolling to summarize older rounds)
+            routing: Model routing config (dict, JSON string or file path) mapping steps to model tiers
+            batch: Batch mode for per-slide generation ("openai", "local" or None)
         """
         self.course_name = course_name
         self.model_name = model_name
         self.copilot = copilot
         self.catalog = catalog
-        self.llm = LLM(model_name=model_name)
+        self.llm = ModelRouter.from_config(model_name, routing)
+        self.batch_executor = BatchExecutor.create(batch, llm=self.llm)
+        self.context_builder = ContextBuilder(token_budget=context_budget, model_name=model_name)
+        self.parallel_rounds = parallel_rounds
+        self.history_mode = history_mode
         self.deliberations = []
         self.results = []
         
@@ -625,6 +791,10 @@ class ADDIE:
             instruction_prompt=f"Start by defining clear instructional goals.",
             input_files=self.catalog_dict.get("objectives_definition", []),
             output_format="md",
+            inputs=[COURSE_NAME_KEY],
+            context_builder=self.context_builder,
+            parallel_rounds=self.parallel_rounds,
+            history_mode=self.history_mode,
         )
     
     def create_resource_assessment_deliberation(self) -> Deliberation:
@@ -662,6 +832,10 @@ class ADDIE:
             instruction_prompt="Evaluate the resources needed and constraints to consider for delivering the course. Consider faculty expertise requirements, necessary computing resources, software requirements, and any scheduling or facility limitations.",
             input_files=self.catalog_dict.get("resource_assessment", []),
             output_format="md",
+            inputs=[COURSE_NAME_KEY, "instructional_goals"],
+            context_builder=self.context_builder,
+            parallel_rounds=self.parallel_rounds,
+            history_mode=self.history_mode,
         )
 
     def create_learner_analysis_deliberation(self) -> Deliberation:
@@ -699,6 +873,10 @@ class ADDIE:
             instruction_prompt="Based on the learning objectives defined previously, analyze the target audience for the course. Consider students' typical background, prerequisite knowledge, and career aspirations. Identify potential knowledge gaps and learning needs.",
             input_files=self.catalog_dict.get("learner_analysis", []),
             output_format="md",
+            inputs=[COURSE_NAME_KEY, "instructional_goals"],
+            context_builder=self.context_builder,
+            parallel_rounds=self.parallel_rounds,
+            history_mode=self.history_mode,
         )
     
     def create_syllabus_design_deliberation(self) -> Deliberation:
@@ -736,6 +914,10 @@ class ADDIE:
             instruction_prompt="Develop a comprehensive syllabus for the course. Include weekly topics, required readings, learning objectives, and assessment methods. Ensure alignment with previously defined instructional goals and student needs.",
             input_files=self.catalog_dict.get("syllabus_design", []),
             output_format="md",
+            inputs=[COURSE_NAME_KEY, "instructional_goals", "resource_assessment", "target_audience"],
+            context_builder=self.context_builder,
+            parallel_rounds=self.parallel_rounds,
+            history_mode=self.history_mode,
         )
     
     def create_assessment_planning_deliberation(self) -> Deliberation:
@@ -791,6 +973,10 @@ class ADDIE:
             ),
             input_files=self.catalog_dict.get("assessment_planning", []),
             output_format="md",
+            inputs=[COURSE_NAME_KEY, "instructional_goals", "syllabus_design"],
+            context_builder=self.context_builder,
+            parallel_rounds=self.parallel_rounds,
+            history_mode=self.history_mode,
         )
     
     def create_final_exam_deliberation(self) -> Deliberation:
@@ -851,9 +1037,30 @@ class ADDIE:
             ),
             input_files=self.catalog_dict.get("assessment_planning", []),
             output_format="md",
+            inputs=[COURSE_NAME_KEY, "instructional_goals", "syllabus_design", "assessment_planning"],
+            context_builder=self.context_builder,
+            parallel_rounds=self.parallel_rounds,
+            history_mode=self.history_mode,
         )
 
         
+    def _export_trace(self, root, output_dir: str):
+        """Write the run's trace to output_dir/trace.json and print its summary"""
+        trace_path = os.path.join(output_dir, "trace.json")
+        try:
+            trace_summary = export_chrome_trace(root, trace_path)
+        except Exception as e:
+            # Never mask the run's own error
+            tracer.pop(root.trace_id)
+            print(f"Warning: Could not save trace to {trace_path}: {e}")
+            return
+        print(f"Trace saved to {trace_path}: {trace_summary['wall_time']:.1f}s wall, "
+              f"{trace_summary['llm_calls']} LLM calls (max {trace_summary['llm_max_concurrency']} in flight), "
+              f"no LLM call in flight for {trace_summary['llm_idle_time']:.1f}s")
+        print("Critical path: " + " > ".join(
+            f"{step['name']} ({step['duration']:.1f}s)" for step in trace_summary["critical_path"] if step["depth"] == 1
+        ))
+
     def run(self, output_dir: str = "./outputs/") -> List[str]:
         """Run the ADDIE workflow using the ADDIERunner
         
@@ -864,4 +1071,41 @@ class ADDIE:
             List of results from each deliberation
         """
         runner = ADDIERunner(self, output_dir=output_dir)
-        return runner.run()
+        # The collectors are process-wide (e.g. in the API server); report this run only
+        root = None
+        try:
+            with parse_stats.collect() as run_parse_stats, lint_stats.collect() as run_lint_stats, \
+                    prefix_stats.collect() as run_prefix_stats, \
+                    trace("addie", course=self.course_name, model=self.model_name, copilot=self.copilot) as root:
+                results = runner.run()
+        finally:
+            # Failed runs are written too, and their spans released
+            if root is not None:
+                self._export_trace(root, output_dir)
+        
+        costs = self.llm.cost_report()
+        with open(os.path.join(output_dir, "costs.json"), "w") as f:
+            json.dump(costs, f, indent=2)
+        print(f"Estimated API cost: ${costs['total_cost']:.4f} (saved to {os.path.join(output_dir, 'costs.json')})")
+        
+        parse_report = run_parse_stats.report()
+        with open(os.path.join(output_dir, "parse_stats.json"), "w") as f:
+            json.dump(parse_report, f, indent=2)
+        for name, counts in parse_report.items():
+            if counts["failed"] or counts["repaired"]:
+                print(f"JSON parsing [{name}]: {counts['repaired']} repaired, {counts['failed']} failed of {counts['total']}")
+        
+        lint_report = run_lint_stats.report()
+        with open(os.path.join(output_dir, "lint_stats.json"), "w") as f:
+            json.dump(lint_report, f, indent=2)
+        if lint_report["frames"]:
+            print(f"LaTeX lint: {lint_report['repaired']} repaired, {lint_report['regenerated']} regenerated, "
+                  f"{lint_report['flagged']} still failing of {lint_report['frames']} frames")
+        
+        prefix_report = run_prefix_stats.report()
+        with open(os.path.join(output_dir, "prompt_prefix_stats.json"), "w") as f:
+            json.dump(prefix_report, f, indent=2)
+        for step, counts in prefix_report.items():
+            print(f"Prompt prefix [{step}]: {counts['prefix_ratio']:.0%} shared with the previous call, "
+                  f"{counts['cacheable_ratio']:.0%} cacheable over {counts['calls']} calls")
+        return results
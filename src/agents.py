@@ -1,83 +1,280 @@
 import os
-from typing import List, Dict
-from openai import OpenAI
+import json
+import threading
+import contextlib
+import contextvars
+from typing import List, Dict, Any, Callable
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from src.context import ContextBuilder, count_tokens
+from src.prompts import build_prompt, prefix_stats
+from src.rate_limit import get_rate_limiter
+from src.tracing import in_context, span
+from src.structured import JSON_OBJECT_FORMAT
 
-class LLM:
-    def __init__(self, model_name: str = "gpt-4o-mini"):
-        self.model_name = "gpt-4o-mini"
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
-    def generate_response(self, messages: List[Dict[str, str]], stream = False) -> str:
-        start_time = time.time()
+def _bad_request_errors() -> tuple:
+    """Errors raised when a request parameter (e.g. response_format) is rejected"""
+    import openai
+    return tuple(getattr(openai, name) for name in ("BadRequestError",) if hasattr(openai, name))
 
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=messages,
-                model=self.model_name
-            )
-            response = chat_completion.choices[0].message.content
-            print(f"[Response from {self.model_name}]: {response}")
 
-            elapsed_time = time.time() - start_time
-            token_usage = chat_completion.usage.total_tokens
+def _rejects_json_mode(error: Exception) -> bool:
+    """
+    Whether an error says the model does not support response_format
+    
+    Other bad requests (e.g. an exceeded context length or an invalid
+    message) must not turn JSON mode off.
+    """
+    if not isinstance(error, _bad_request_errors()):
+        return False
+    param = getattr(error, "param", None) or ""
+    code = getattr(error, "code", None) or ""
+    return "response_format" in str(param) or "response_format" in str(code) or "response_format" in str(error)
+
+
+class LLMError(Exception):
+    """Raised when an LLM call fails after the rate limiter's retries"""
+    pass
+
+
+# Callbacks that receive streamed tokens as they arrive (e.g. for SSE log streams), per context
+_token_listeners = contextvars.ContextVar("token_listeners", default=())
+
+
+@contextlib.contextmanager
+def token_listener(listener: Callable[[Dict[str, Any]], None]):
+    """
+    Send the streamed output of the LLM calls made inside the block to a callback
+    
+    Only calls made in the current context see the listener, including calls
+    on worker threads whose tasks were submitted through src.tracing.in_context,
+    so concurrent runs (e.g. two API tasks) each receive only their own tokens.
+    
+    The listener is called with {"type": "token", "model", "step", "text"} for
+    every streamed delta and {"type": "end", "model", "step", **stats} when a
+    call finishes. Listeners run on the thread making the call and must not block.
+    """
+    token = _token_listeners.set(_token_listeners.get() + (listener,))
+    try:
+        yield listener
+    finally:
+        _token_listeners.reset(token)
 
-            print(f"[Response Time: {elapsed_time:.2f}s]")
-            print(f"[Total Tokens: {token_usage}]")
-            return response, elapsed_time, token_usage
 
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            return f"Error: {e}"
+def _call_listener(listener: Callable[[Dict[str, Any]], None], event: Dict[str, Any]):
+    try:
+        listener(event)
+    except Exception as e:
+        print(f"Token listener failed: {e}")
 
-class LLM_stream:
+
+def _notify_token_listeners(event: Dict[str, Any]):
+    for listener in _token_listeners.get():
+        _call_listener(listener, event)
+
+
+class LLM:
     """
-    Base LLM class, responsible for calling OpenAI API with streaming input/output
+    Base LLM class, responsible for calling the OpenAI chat API
+    
+    Responses are streamed by default so that time-to-first-token can be
+    measured and listeners receive tokens as they arrive. Usage is taken from
+    the final stream chunk (stream_options.include_usage). Statistics of the
+    last call are kept per thread in `last_call_stats`.
     """
     def __init__(self, model_name: str = "gpt-4o-mini"):
+        # Imported on first use; importing openai takes about half a second
+        from openai import OpenAI
         self.model_name = model_name
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        
-        
-    def generate_response(self, messages: List[Dict[str, str]], stream: bool = True) -> str:
+        # Retries are handled by the shared rate limiter
+        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+        self._local = threading.local()
+        # Cleared when the model rejects response_format (JSON mode)
+        self.json_mode_supported = True
+
+    @property
+    def last_call_stats(self) -> Dict[str, Any]:
+        """Statistics of the most recent call made by the current thread"""
+        return getattr(self._local, "stats", None)
+
+    def generate_response(self, messages: List[Dict[str, str]], stream: bool = True, step: str = None,
+                          json_mode: bool = False, listener: Callable[[Dict[str, Any]], None] = None):
         """
         Call OpenAI API to generate a response
         
         Args:
             messages: List of messages with role and content
-            stream: Whether to use streaming output
+            stream: Whether to stream the response
+            step: Optional name of the pipeline step, passed to listeners and stats
+            json_mode: Request a JSON object response (response_format); ignored
+                by models that do not support it
+            listener: Optional callback for this call only. It receives
+                {"type": "attempt"} when an attempt starts (a retry restarts the
+                output) and {"type": "token", "text"} for every streamed delta
+                (the whole response at once when not streaming)
             
         Returns:
-            Generated response text
+            Tuple of (response text, elapsed time, total tokens)
+            
+        Raises:
+            LLMError: If the call fails after retries
         """
-        try:
-            if stream:
-                chat_completion = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model_name,
-                    stream=True
-                )
-                
-                response = ""
-                for chunk in chat_completion:
-                    delta = chunk.choices[0].delta
-                    if delta.content is not None:
-                        response += delta.content
-                        print(delta.content, end="", flush=True)
-                print()  # Ensure newline after streaming output
-                
-                return response
-            else:
-                chat_completion = self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model_name
+        with span(step or "llm", "llm", model=self.model_name, step=step, json_mode=json_mode) as call_span:
+            start_time = time.time()
+            limiter = get_rate_limiter()
+            prompt_estimate = sum(count_tokens(m["content"], self.model_name) for m in messages)
+            response_format = JSON_OBJECT_FORMAT if json_mode and self.json_mode_supported else None
+            attempts = []
+
+            def attempt():
+                attempts.append(time.time())
+                return self._complete(messages, stream, step, response_format, listener)
+
+            try:
+                response, attempt_start, first_token_time, usage = limiter.call(
+                    attempt,
+                    estimated_tokens=prompt_estimate,
+                    tokens_used=lambda result: result[3].total_tokens if result[3] else prompt_estimate,
+                    description=f"{self.model_name} chat completion"
                 )
-                return chat_completion.choices[0].message.content
-                
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            return f"Error: {e}"
+            except Exception as e:
+                call_span.set(attempts=len(attempts))
+                if response_format and _rejects_json_mode(e):
+                    print(f"{self.model_name} rejected JSON mode ({e}), retrying without it")
+                    self.json_mode_supported = False
+                    return self.generate_response(messages, stream, step, listener=listener)
+                print(f"Error generating response: {e}")
+                raise LLMError(f"{self.model_name} call failed: {e}") from e
+
+            elapsed_time = time.time() - start_time
+            stats = self._build_stats(messages, response, usage, attempt_start, first_token_time, elapsed_time, step,
+                                      prompt_estimate)
+            # The prompt was tokenized once for the rate limiter; the prefix statistics reuse that count
+            stats.update(prefix_stats.record(self.model_name, step, messages, stats["cached_tokens"],
+                                             prompt_tokens=prompt_estimate))
+            self._local.stats = stats
+            call_span.set(
+                # Time spent waiting for the rate limiter before the first attempt
+                queue_wait=attempts[0] - start_time,
+                retries=len(attempts) - 1,
+                ttft=stats["ttft"],
+                prompt_tokens=stats["prompt_tokens"],
+                completion_tokens=stats["completion_tokens"],
+                cached_tokens=stats["cached_tokens"],
+                cache_hit=bool(stats["cached_tokens"]),
+                prefix_ratio=stats["prefix_ratio"]
+            )
+        _notify_token_listeners({"type": "end", **stats})
+
+        print(f"[Response from {self.model_name}]: {response}")
+        print(f"[Response Time: {elapsed_time:.2f}s, TTFT: {stats['ttft']:.2f}s]")
+        print(f"[Total Tokens: {stats['total_tokens']} "
+              f"(prompt {stats['prompt_tokens']}, completion {stats['completion_tokens']}, "
+              f"{stats['tokens_per_second']:.1f} tok/s)]")
+        cached = f", provider cached {stats['cached_tokens']}" if stats["cached_tokens"] is not None else ""
+        print(f"[Prompt Prefix: {stats['prefix_tokens']} tokens shared with the previous {step or 'unnamed'} call "
+              f"({stats['prefix_ratio']:.0%}){cached}]")
+        return response, elapsed_time, stats["total_tokens"]
+
+    def _complete(self, messages: List[Dict[str, str]], stream: bool, step: str = None, response_format: Dict = None,
+                  listener: Callable[[Dict[str, Any]], None] = None):
+        """Make one API attempt, returning (text, attempt start, first token time, usage)"""
+        attempt_start = time.time()
+        extra = {"response_format": response_format} if response_format else {}
+        if listener:
+            _call_listener(listener, {"type": "attempt", "model": self.model_name, "step": step})
+        if stream:
+            response, first_token_time, usage = self._stream_completion(messages, step, extra, listener)
+        else:
+            chat_completion = self.client.chat.completions.create(
+                messages=messages,
+                model=self.model_name,
+                **extra
+            )
+            response = chat_completion.choices[0].message.content or ""
+            first_token_time = time.time()
+            usage = chat_completion.usage
+            if listener and response:
+                _call_listener(listener, {"type": "token", "model": self.model_name, "step": step, "text": response})
+        return response, attempt_start, first_token_time, usage
+
+    def _stream_completion(self, messages: List[Dict[str, str]], step: str = None, extra: Dict = None,
+                           listener: Callable[[Dict[str, Any]], None] = None):
+        """Stream a chat completion, returning (text, first token time, usage)"""
+        chat_completion = self.client.chat.completions.create(
+            messages=messages,
+            model=self.model_name,
+            stream=True,
+            stream_options={"include_usage": True},
+            **(extra or {})
+        )
+
+        parts = []
+        first_token_time = None
+        usage = None
+        for chunk in chat_completion:
+            # The usage chunk arrives last and has no choices
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                parts.append(content)
+                if listener or _token_listeners.get():
+                    event = {"type": "token", "model": self.model_name, "step": step, "text": content}
+                    _notify_token_listeners(event)
+                    if listener:
+                        _call_listener(listener, event)
+
+        return "".join(parts), first_token_time, usage
+
+    def _build_stats(self, messages, response, usage, attempt_start, first_token_time, elapsed_time, step,
+                     prompt_estimate: int = None) -> Dict[str, Any]:
+        """Assemble per-call statistics, estimating token counts if usage is missing"""
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None)
+        else:
+            prompt_tokens = prompt_estimate if prompt_estimate is not None else \
+                sum(count_tokens(m["content"], self.model_name) for m in messages)
+            completion_tokens = count_tokens(response, self.model_name)
+            cached_tokens = None
+
+        end_time = time.time()
+        first_token_time = first_token_time or end_time
+        generation_time = end_time - first_token_time
+        return {
+            "model": self.model_name,
+            "step": step,
+            "ttft": first_token_time - attempt_start,
+            "elapsed_time": elapsed_time,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cached_tokens": cached_tokens,
+            "tokens_per_second": completion_tokens / generation_time if generation_time > 0 else 0.0,
+            "usage_reported": usage is not None
+        }
+
+
+class LLM_stream(LLM):
+    """
+    Streaming LLM that returns only the response text
+    
+    Kept for backward compatibility; use LLM, which streams and also reports
+    latency and token usage.
+    """
+    def generate_response(self, messages: List[Dict[str, str]], stream: bool = True, step: str = None,
+                          json_mode: bool = False, listener: Callable[[Dict[str, Any]], None] = None) -> str:
+        response, _, _ = super().generate_response(messages, stream, step, json_mode, listener)
+        return response
 
 
 class Agent:
@@ -126,10 +323,20 @@ class Agent:
         messages.append({"role": "user", "content": prompt})
         return messages
     
+    def prepare_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Build the messages for a prompt, including the output constraint"""
+        full_prompt = prompt
+        if self.output_constraint:
+            full_prompt += f"\n\n{self.output_constraint}"
+        return self.get_messages_with_system(full_prompt)
+    
     def generate_response(self, 
                           prompt: str,  
                           stream: bool = True,
-                          save_to_history: bool = True) -> str:
+                          save_to_history: bool = True,
+                          step: str = None,
+                          json_mode: bool = False,
+                          listener: Callable[[Dict[str, Any]], None] = None) -> str:
         """
         Generate Agent's response
         
@@ -138,18 +345,20 @@ class Agent:
             output_constraint: Output constraints
             stream: Whether to use streaming output
             save_to_history: Whether to save to message history
+            step: Optional name of the pipeline step, for statistics
+            json_mode: Request a JSON object response where the model supports it
+            listener: Optional callback receiving this call's streamed output
+                (see LLM.generate_response)
             
         Returns:
             Generated response
         """
-        full_prompt = prompt
-        if self.output_constraint:
-            full_prompt += f"\n\n{self.output_constraint}"
-            
-        messages = self.get_messages_with_system(full_prompt)
+        messages = self.prepare_messages(prompt)
         
         print(f"{'-'*50}\n{self.name} ({self.role}) is thinking...\n")
-        response, elapsed_time, token_usage = self.llm.generate_response(messages, stream)
+        response, elapsed_time, token_usage = self.llm.generate_response(
+            messages, stream, step=step, json_mode=json_mode, listener=listener
+        )
 
         if save_to_history:
             self.add_message_to_history("user", prompt)
@@ -158,6 +367,69 @@ class Agent:
         return response, elapsed_time, token_usage
 
 
+class DiscussionTranscript:
+    """
+    Append-only transcript of a deliberation
+
+    Each entry is rendered once when it is added, and the full text is cached
+    until the next append, so building the history for every agent turn does
+    not re-format the whole discussion. Earlier rounds can be replaced by a
+    condensed summary (rolling-summary mode) while the raw entries are kept.
+    """
+    HEADER = "Discussion History:\n\n"
+
+    def __init__(self):
+        self.entries = []
+        self._rendered = []
+        self._summary = None
+        self._summary_through_round = -1  # Last round folded into the summary
+        self._text = None
+
+    def append(self, agent_name: str, content: str, round_num: int = 0):
+        """Append an agent's contribution"""
+        self.entries.append({
+            "agent": agent_name,
+            "content": content,
+            "round": round_num
+        })
+        self._rendered.append(f"{agent_name}: {content}\n\n")
+        self._text = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def raw_text(self, from_round: int = 0, to_round: int = None) -> str:
+        """Render the raw entries of a range of rounds (inclusive)"""
+        return "".join(
+            rendered for entry, rendered in zip(self.entries, self._rendered)
+            if entry["round"] >= from_round and (to_round is None or entry["round"] <= to_round)
+        )
+
+    def set_summary(self, summary: str, through_round: int):
+        """Replace all rounds up to and including through_round with a summary"""
+        self._summary = summary
+        self._summary_through_round = through_round
+        self._text = None
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @property
+    def summary_through_round(self) -> int:
+        return self._summary_through_round
+
+    def render(self) -> str:
+        """Render the transcript as seen by agents"""
+        if self._text is None:
+            parts = [self.HEADER]
+            if self._summary:
+                parts.append(f"Summary of rounds 1-{self._summary_through_round + 1}:\n{self._summary}\n\n")
+            parts.append(self.raw_text(from_round=self._summary_through_round + 1))
+            self._text = "".join(parts)
+        return self._text
+
+
 class Deliberation:
     """
     Deliberation class, managing interactions between multiple agents
@@ -170,7 +442,11 @@ class Deliberation:
                  max_rounds: int = 1,
                  instruction_prompt: str = "",
                  input_files = None,
-                 output_format: str = "md"):
+                 output_format: str = "md",
+                 inputs: List[str] = None,
+                 context_builder: ContextBuilder = None,
+                 history_mode: str = "full",
+                 parallel_rounds: str = "off"):
         """
         Initialize Deliberation
         
@@ -183,30 +459,143 @@ class Deliberation:
             summary_agent: Agent responsible for summarizing (optional)
             input_prompt: Default input prompt for this deliberation
             input_files: List of input files to use as additional context
+            inputs: IDs of earlier deliberations whose results this one reads (None means all)
+            context_builder: Builder that fits the selected results into a token budget
+            history_mode: "full" passes the whole raw transcript to every turn;
+                "rolling" condenses all but the most recent round into a summary
+            parallel_rounds: "off" lets agents speak one after another; "first_round"
+                queries all agents of round 1 concurrently; "all_rounds" does so for
+                every round, each agent seeing only the history of earlier rounds
         """
         self.id = id
         self.name = name
         self.agents = agents
         self.max_rounds = max_rounds
         self.summary_agent = summary_agent if summary_agent else agents[0]
-        self.discussion_history = []
+        if history_mode not in ("full", "rolling"):
+            raise ValueError(f"Unknown history_mode: {history_mode}")
+        self.history_mode = history_mode
+        if parallel_rounds not in ("off", "first_round", "all_rounds"):
+            raise ValueError(f"Unknown parallel_rounds mode: {parallel_rounds}")
+        self.parallel_rounds = parallel_rounds
+        self.transcript = DiscussionTranscript()
+        self.discussion_history = self.transcript.entries
         self.instruction_prompt = instruction_prompt
         self.input_files = input_files
+        # Serialized once; the same text opens the prompt of every round
+        self.file_contents = ""
+        if input_files:
+            self.file_contents = input_files if isinstance(input_files, str) else json.dumps(input_files, ensure_ascii=False, default=str)
         self.output_format = output_format
+        self.inputs = inputs
+        self.context_builder = context_builder
+        self.context_report = None
+        
+    def build_context(self, results: Dict[str, str], labels: Dict[str, str] = None) -> str:
+        """
+        Build the context for this deliberation from earlier results
         
-    def add_to_discussion(self, agent_name: str, content: str):
+        Args:
+            results: Earlier results keyed by deliberation ID, in execution order
+            labels: Optional human-readable names for the result keys
+            
+        Returns:
+            Context string containing only the declared inputs, within the token budget
+        """
+        labels = labels or {}
+        keys = list(results.keys()) if self.inputs is None else [k for k in results if k in self.inputs]
+        sections = [(labels.get(k, k), results[k]) for k in keys]
+        
+        if not self.context_builder:
+            self.context_report = None
+            return "\n\n".join(f"### {label}\n{text}" for label, text in sections if text)
+        
+        # Baseline is what the prompt used to carry: every prior result, stringified
+        context, self.context_report = self.context_builder.build(sections, baseline=str(list(results.values())))
+        print(f"[Context: {self.context_report['context_tokens']} tokens, "
+              f"saved {self.context_report['tokens_saved']} tokens "
+              f"(budget {self.context_report['token_budget']})]")
+        return context
+        
+    def add_to_discussion(self, agent_name: str, content: str, round_num: int = 0):
         """Add content to discussion history"""
-        self.discussion_history.append({
-            "agent": agent_name,
-            "content": content
-        })
+        self.transcript.append(agent_name, content, round_num)
         
     def format_discussion_history(self) -> str:
         """Format discussion history as text"""
-        formatted = "Discussion History:\n\n"
-        for entry in self.discussion_history:
-            formatted += f"{entry['agent']}: {entry['content']}\n\n"
-        return formatted
+        return self.transcript.render()
+    
+    def _condense_rounds(self, through_round: int):
+        """
+        Fold all rounds up to through_round into the rolling summary
+        
+        Returns:
+            Tuple of (elapsed_time, token_usage) of the condensing call
+        """
+        previous_summary = self.transcript.summary
+        new_rounds = self.transcript.raw_text(
+            from_round=self.transcript.summary_through_round + 1,
+            to_round=through_round
+        )
+        if not new_rounds:
+            return 0, 0
+        
+        condenser = Agent(
+            name="Discussion Condenser",
+            role="Note taker for a multi-round discussion",
+            llm=self.summary_agent.llm,
+            system_prompt="You condense discussions into concise notes. Keep every concrete proposal, decision, disagreement and open question, attributed to the agent who raised it. Drop repetition and pleasantries."
+        )
+        prompt = "Condense the following discussion rounds into concise notes."
+        if previous_summary:
+            prompt += f"\n\nNotes from earlier rounds (merge these in):\n{previous_summary}"
+        prompt += f"\n\nNew rounds:\n{new_rounds}"
+        
+        print(f"Condensing discussion rounds 1-{through_round + 1}...")
+        summary, et, tu = condenser.generate_response(prompt, save_to_history=False, step="deliberation_summary")
+        self.transcript.set_summary(summary, through_round)
+        return et, tu
+    
+    def _is_parallel_round(self, round_num: int) -> bool:
+        """Whether the agents of a round are queried concurrently"""
+        if len(self.agents) < 2:
+            return False
+        if self.parallel_rounds == "all_rounds":
+            return True
+        return self.parallel_rounds == "first_round" and round_num == 0
+    
+    def _agent_prompt(self, current_prompt: str) -> str:
+        """Build an agent's input, including previous discussion"""
+        if self.discussion_history:
+            return f"{current_prompt}\n\n{self.format_discussion_history()}\n\nIt's now your turn to provide your thoughts."
+        return current_prompt
+    
+    def _run_parallel_round(self, current_prompt: str, round_num: int):
+        """
+        Query all agents concurrently on the same prompt
+        
+        Responses are added to the discussion in agent order, so the transcript
+        is the same regardless of which agent finishes first.
+        
+        Returns:
+            Tuple of (round latency, token usage)
+        """
+        agent_prompt = self._agent_prompt(current_prompt)
+        with ThreadPoolExecutor(max_workers=len(self.agents)) as executor:
+            futures = [
+                executor.submit(in_context(agent.generate_response), agent_prompt, save_to_history=False,
+                                step="deliberation")
+                for agent in self.agents
+            ]
+            outputs = [future.result() for future in futures]
+        
+        token_usage = 0
+        for agent, (response, _, tu) in zip(self.agents, outputs):
+            self.add_to_discussion(agent.name, response, round_num)
+            token_usage += tu
+        
+        # The round takes as long as its slowest agent
+        return max(et for _, et, _ in outputs), token_usage
     
     def run(self, current_context: str = None, user_suggestion: str = None) -> str:
         """
@@ -219,58 +608,71 @@ class Deliberation:
         Returns:
             Discussion summary
         """
-        print(f"\n{'='*50}\nStarting Deliberation: {self.name}\n{'='*50}\n")
+        with span("deliberation", "deliberation", id=self.id, title=self.name, rounds=self.max_rounds):
+            print(f"\n{'='*50}\nStarting Deliberation: {self.name}\n{'='*50}\n")
         
-        # Process input files if provided
-        file_contents = str(self.input_files)
+            # Combine initial prompt with file contents, user suggestion and previous state;
+            # the parts that do not change between runs come first
+            print(f"Instruction prompt: {self.instruction_prompt}\n")
         
-        # Combine initial prompt with previous state, user suggestion, and file contents
-        print(f"Instruction prompt: {self.instruction_prompt}\n")
-        
-        full_prompt = self.instruction_prompt
-        if user_suggestion:
-            full_prompt += f"\n\nUser Suggestion: {user_suggestion}"
-        if current_context:
-            full_prompt += f"\n\nCurrent Context:\n{current_context}"
-        if file_contents:
-            full_prompt += f"\n\nAdditional input from files:\n{file_contents}"
-        current_prompt = full_prompt
+            current_prompt = build_prompt(
+                [
+                    self.instruction_prompt,
+                    f"Additional input from files:\n{self.file_contents}" if self.file_contents else ""
+                ],
+                [
+                    f"User Suggestion: {user_suggestion}" if user_suggestion else "",
+                    f"Current Context:\n{current_context}" if current_context else ""
+                ]
+            )
         
-        # Reset all Agent histories
-        for agent in self.agents:
-            agent.reset_history()
+            # Reset all Agent histories
+            for agent in self.agents:
+                agent.reset_history()
             
-        # Clear discussion history
-        self.discussion_history = []
+            # Clear discussion history
+            self.transcript = DiscussionTranscript()
+            self.discussion_history = self.transcript.entries
             
-        # Main discussion loop
-        elapsed_time = 0
-        token_usage = 0
-        for round_num in range(self.max_rounds):
-            print(f"\n{'-'*50}\nRound {round_num + 1} of {self.max_rounds}\n{'-'*50}\n")
+            # Main discussion loop
+            elapsed_time = 0
+            token_usage = 0
+            for round_num in range(self.max_rounds):
+                with span("round", "deliberation", round=round_num + 1,
+                          parallel=self._is_parallel_round(round_num)):
+                    print(f"\n{'-'*50}\nRound {round_num + 1} of {self.max_rounds}\n{'-'*50}\n")
             
-            for agent in self.agents:
-                # Build current agent's input, including previous discussion
-                if self.discussion_history:
-                    agent_prompt = f"{current_prompt}\n\n{self.format_discussion_history()}\n\nIt's now your turn to provide your thoughts."
-                else:
-                    agent_prompt = current_prompt
+                    # In rolling mode only the previous round stays verbatim
+                    if self.history_mode == "rolling" and round_num >= 2:
+                        et, tu = self._condense_rounds(round_num - 2)
+                        elapsed_time += et
+                        token_usage += tu
+            
+                    if self._is_parallel_round(round_num):
+                        et, tu = self._run_parallel_round(current_prompt, round_num)
+                        elapsed_time += et
+                        token_usage += tu
+                        continue
+            
+                    for agent in self.agents:
+                        agent_prompt = self._agent_prompt(current_prompt)
                 
-                # Get agent's response
-                response, et, tu = agent.generate_response(agent_prompt, save_to_history=False)
-                self.add_to_discussion(agent.name, response)
+                        # Get agent's response
+                        response, et, tu = agent.generate_response(agent_prompt, save_to_history=False, step="deliberation")
+                        self.add_to_discussion(agent.name, response, round_num)
 
-                elapsed_time += et
-                token_usage += tu
+                        elapsed_time += et
+                        token_usage += tu
         
-        # Generate results of this discussion          
-        summary, et, tu = self.summary_agent.generate_response(
-            f"{self.format_discussion_history()}",
-            save_to_history=False
-        )
-        elapsed_time += et
-        token_usage += tu
+            # Generate results of this discussion          
+            summary, et, tu = self.summary_agent.generate_response(
+                f"{self.format_discussion_history()}",
+                save_to_history=False,
+                step="deliberation_summary"
+            )
+            elapsed_time += et
+            token_usage += tu
         
-        print(f"\n{'='*50}\nDeliberation Complete\n{'='*50}\n")
-        return summary, elapsed_time, token_usage
+            print(f"\n{'='*50}\nDeliberation Complete\n{'='*50}\n")
+            return summary, elapsed_time, token_usage
 
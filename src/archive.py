@@ -0,0 +1,270 @@
+"""
+Experiment Archive
+Streams the generated artifacts of an experiment as a tar or zip archive
+without building the archive in memory or on disk.
+"""
+
+import hashlib
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+CHUNK_SIZE = 64 * 1024
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+# Already-compressed formats are stored as-is inside zip archives
+STORED_SUFFIXES = {".pdf", ".png", ".jpg", ".jpeg", ".gif", ".zip", ".gz", ".pkl"}
+
+
+def collect_archive_entries(
+    exp_dir: Path,
+    chapters: Optional[List[int]] = None,
+    include_root: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Collect the files of an experiment directory that belong in an archive
+
+    Args:
+        exp_dir: Experiment output directory (exp/{exp_name})
+        chapters: Chapter numbers to include (None means all chapters)
+        include_root: Whether to include files at the experiment root
+
+    Returns:
+        Sorted list of entries with path, arcname, size and mtime
+    """
+    exp_dir = Path(exp_dir)
+    entries = []
+
+    for file_path in exp_dir.rglob("*"):
+        relative_path = file_path.relative_to(exp_dir)
+        # Skip hidden files and compilation caches (.cache/...)
+        if any(part.startswith('.') for part in relative_path.parts):
+            continue
+        if not file_path.is_file():
+            continue
+
+        top_level = relative_path.parts[0]
+        if len(relative_path.parts) == 1:
+            if not include_root:
+                continue
+        elif chapters is not None:
+            if not top_level.startswith("chapter_"):
+                continue
+            try:
+                chapter_num = int(top_level[len("chapter_"):])
+            except ValueError:
+                continue
+            if chapter_num not in chapters:
+                continue
+
+        try:
+            stat = file_path.stat()
+        except OSError:
+            continue
+
+        entries.append({
+            "path": file_path,
+            "arcname": f"{exp_dir.name}/{relative_path.as_posix()}",
+            "size": stat.st_size,
+            "mtime": int(stat.st_mtime),
+            "mtime_ns": stat.st_mtime_ns
+        })
+
+    entries.sort(key=lambda e: e["arcname"])
+    return entries
+
+
+def compute_etag(entries: List[Dict[str, Any]], archive_format: str) -> str:
+    """Compute a strong ETag that changes whenever any archived file changes"""
+    digest = hashlib.sha1(archive_format.encode("utf-8"))
+    for entry in entries:
+        digest.update(f"{entry['arcname']}\0{entry['size']}\0{entry['mtime_ns']}\n".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def parse_range_header(range_header: Optional[str], total_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range HTTP Range header
+
+    Args:
+        range_header: Value of the Range header (e.g. "bytes=100-")
+        total_size: Total size of the representation
+
+    Returns:
+        Inclusive (start, end) tuple, or None if no usable range was given
+
+    Raises:
+        ValueError: If the range is syntactically valid but unsatisfiable
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+
+    spec = range_header[len("bytes="):].strip()
+    # Multiple ranges are not supported, serve the full archive instead
+    if "," in spec or "-" not in spec:
+        return None
+
+    start_str, end_str = spec.split("-", 1)
+    if not (start_str.isdigit() or end_str.isdigit()):
+        return None
+    if (start_str and not start_str.isdigit()) or (end_str and not end_str.isdigit()):
+        return None
+
+    if start_str == "":
+        # Suffix range: the last N bytes
+        suffix_length = int(end_str)
+        if suffix_length == 0:
+            raise ValueError(f"Range {range_header} not satisfiable for size {total_size}")
+        start = max(0, total_size - suffix_length)
+        end = total_size - 1
+    else:
+        start = int(start_str)
+        end = int(end_str) if end_str else total_size - 1
+
+    if start >= total_size or start > end:
+        raise ValueError(f"Range {range_header} not satisfiable for size {total_size}")
+
+    return start, min(end, total_size - 1)
+
+
+class TarArchivePlan:
+    """
+    Deterministic byte layout of an uncompressed tar archive
+
+    Because every header and padding block is known up front, the total size
+    is known before streaming starts and any byte range can be produced
+    without generating the preceding bytes, which is what HTTP range
+    requests need for resuming interrupted downloads.
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.segments = []  # (offset, length, kind, payload)
+        offset = 0
+
+        for entry in entries:
+            info = tarfile.TarInfo(name=entry["arcname"])
+            info.size = entry["size"]
+            info.mtime = entry["mtime"]
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+            self.segments.append((offset, len(header), "bytes", header))
+            offset += len(header)
+
+            if entry["size"]:
+                self.segments.append((offset, entry["size"], "file", entry))
+                offset += entry["size"]
+
+            remainder = entry["size"] % BLOCK_SIZE
+            if remainder:
+                padding = BLOCK_SIZE - remainder
+                self.segments.append((offset, padding, "bytes", b"\0" * padding))
+                offset += padding
+
+        # End-of-archive marker: two zero blocks
+        self.segments.append((offset, BLOCK_SIZE * 2, "bytes", b"\0" * (BLOCK_SIZE * 2)))
+        offset += BLOCK_SIZE * 2
+
+        self.total_size = offset
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Yield the archive bytes between start and end (inclusive)
+
+        Files are read lazily in CHUNK_SIZE pieces. A file that shrank since
+        the plan was made is zero-padded so the advertised layout holds.
+        """
+        if end is None:
+            end = self.total_size - 1
+
+        for seg_offset, seg_length, kind, payload in self.segments:
+            seg_end = seg_offset + seg_length - 1
+            if seg_end < start:
+                continue
+            if seg_offset > end:
+                break
+
+            local_start = max(start, seg_offset) - seg_offset
+            local_end = min(end, seg_end) - seg_offset + 1
+
+            if kind == "bytes":
+                yield payload[local_start:local_end]
+                continue
+
+            remaining = local_end - local_start
+            with open(payload["path"], "rb") as f:
+                f.seek(local_start)
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        yield b"\0" * remaining
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+class _ZipSink:
+    """Unseekable write target that hands out whatever zipfile has written so far"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def iter_zip_stream(entries: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Yield a zip archive of the given entries as it is being written
+
+    zipfile falls back to data descriptors when its target cannot seek, so
+    memory use is bounded by CHUNK_SIZE plus the compressor's window.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for entry in entries:
+            zinfo = zipfile.ZipInfo(entry["arcname"], date_time=_zip_date_time(entry["mtime"]))
+            zinfo.file_size = entry["size"]
+            zinfo.external_attr = 0o644 << 16
+            if Path(entry["arcname"]).suffix.lower() in STORED_SUFFIXES:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+
+            with open(entry["path"], "rb") as src, zf.open(zinfo, "w") as dest:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            data = sink.drain()
+            if data:
+                yield data
+
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _zip_date_time(mtime: int) -> Tuple[int, int, int, int, int, int]:
+    """Convert a timestamp to a zip date tuple (zip cannot store dates before 1980)"""
+    date_time = time.localtime(mtime)[:6]
+    if date_time[0] < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return date_time
@@ -0,0 +1,379 @@
+"""
+Batch Execution
+Collects independent chat requests of a pipeline stage, submits them as one
+batch, waits for completion and maps the results back by request ID.
+
+Two backends are available:
+- OpenAIBatchBackend uses the OpenAI Batch API (JSONL upload, 24h window,
+  discounted pricing)
+- LocalBatchBackend is a file-based stand-in with the same file formats that
+  processes a batch on the first poll, for testing without the Batch API
+"""
+
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.lazy import optional_import
+from src.structured import JSON_OBJECT_FORMAT
+
+# Batch API requests are billed at half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+COMPLETED = "completed"
+FAILED_STATES = {"failed", "expired", "cancelled"}
+
+
+def build_request(custom_id: str, messages: List[Dict[str, str]], model: str, step: Optional[str] = None,
+                  json_mode: bool = False) -> Dict[str, Any]:
+    """
+    Build one line of a batch input file
+
+    Args:
+        custom_id: ID used to map the result back to its caller
+        messages: Chat messages
+        model: Model to use
+        step: Pipeline step name, kept in metadata for accounting
+        json_mode: Request a JSON object response
+
+    Returns:
+        Request dictionary in the Batch API input format
+    """
+    body = {"model": model, "messages": messages}
+    if json_mode:
+        body["response_format"] = JSON_OBJECT_FORMAT
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body,
+        "step": step
+    }
+
+
+def parse_output_line(line: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract content and usage from one line of a batch output file"""
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code", 200) != 200 or not body.get("choices"):
+        return {"content": None, "usage": None, "error": line.get("error") or body.get("error") or "empty response"}
+    return {
+        "content": body["choices"][0]["message"].get("content") or "",
+        "usage": body.get("usage"),
+        "error": None
+    }
+
+
+class BatchBackend(ABC):
+    """Interface of batch backends"""
+
+    # Whether the backend already records token usage with the LLM it calls
+    accounts_usage = False
+
+    @abstractmethod
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        """Submit requests and return the batch ID"""
+
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        """Get the status of a batch (validating, in_progress, completed, failed, ...)"""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """Get the results of a completed batch, keyed by custom_id"""
+
+    @abstractmethod
+    def cancel(self, batch_id: str):
+        """Cancel a batch that is still running, so it is not billed once its requests are run directly"""
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Backend using the OpenAI Batch API"""
+
+    def __init__(self, work_dir: str = "batches", completion_window: str = "24h"):
+        """
+        Initialize OpenAIBatchBackend
+
+        Args:
+            work_dir: Directory for the uploaded input files
+            completion_window: Batch completion window
+        """
+        openai = optional_import("openai")
+        if openai is None:
+            raise ImportError("openai is required for the OpenAI batch backend")
+        self.client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.completion_window = completion_window
+
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        input_path = self.work_dir / f"input_{uuid.uuid4().hex[:12]}.jsonl"
+        with open(input_path, "w", encoding="utf-8") as f:
+            for request in requests:
+                line = {key: request[key] for key in ("custom_id", "method", "url", "body")}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def cancel(self, batch_id: str):
+        self.client.batches.cancel(batch_id)
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for raw_line in self.client.files.content(file_id).text.splitlines():
+                if raw_line.strip():
+                    line = json.loads(raw_line)
+                    results[line["custom_id"]] = parse_output_line(line)
+        return results
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for the Batch API
+
+    Each batch is a directory with input.jsonl, output.jsonl and status. The
+    batch is processed on the first status poll, either through an LLM client
+    (synchronously, one request at a time) or, without one, by echoing a
+    deterministic placeholder response.
+    """
+
+    def __init__(self, work_dir: str = "batches/local", llm=None):
+        """
+        Initialize LocalBatchBackend
+
+        Args:
+            work_dir: Directory holding the batch directories
+            llm: Optional LLM (or ModelRouter) used to answer requests
+        """
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.llm = llm
+        self.accounts_usage = llm is not None
+
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        batch_dir = self.work_dir / batch_id
+        batch_dir.mkdir(parents=True)
+        with open(batch_dir / "input.jsonl", "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        (batch_dir / "status").write_text("validating")
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        batch_dir = self.work_dir / batch_id
+        status = (batch_dir / "status").read_text().strip()
+        if status == "validating":
+            (batch_dir / "status").write_text("in_progress")
+            self._process(batch_dir)
+            (batch_dir / "status").write_text(COMPLETED)
+            status = COMPLETED
+        return status
+
+    def cancel(self, batch_id: str):
+        status_file = self.work_dir / batch_id / "status"
+        if status_file.read_text().strip() != COMPLETED:
+            status_file.write_text("cancelled")
+
+    def _process(self, batch_dir: Path):
+        with open(batch_dir / "input.jsonl", "r", encoding="utf-8") as f_in, \
+                open(batch_dir / "output.jsonl", "w", encoding="utf-8") as f_out:
+            for raw_line in f_in:
+                if not raw_line.strip():
+                    continue
+                request = json.loads(raw_line)
+                f_out.write(json.dumps(self._answer(request), ensure_ascii=False) + "\n")
+
+    def _answer(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        messages = request["body"]["messages"]
+        try:
+            if self.llm is not None:
+                content, _, total_tokens = self.llm.generate_response(
+                    messages, stream=False, step=request.get("step"),
+                    json_mode="response_format" in request["body"]
+                )
+                stats = getattr(self.llm, "last_call_stats", None) or {}
+                usage = {
+                    "prompt_tokens": stats.get("prompt_tokens", 0),
+                    "completion_tokens": stats.get("completion_tokens", 0),
+                    "total_tokens": total_tokens
+                }
+            else:
+                content = f"[local batch response to {request['custom_id']}]"
+                usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        except Exception as e:
+            return {"id": uuid.uuid4().hex, "custom_id": request["custom_id"], "response": None,
+                    "error": {"message": str(e)}}
+
+        return {
+            "id": uuid.uuid4().hex,
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "model": request["body"]["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                    "usage": usage
+                }
+            },
+            "error": None
+        }
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        with open(self.work_dir / batch_id / "output.jsonl", "r", encoding="utf-8") as f:
+            for raw_line in f:
+                if raw_line.strip():
+                    line = json.loads(raw_line)
+                    results[line["custom_id"]] = parse_output_line(line)
+        return results
+
+
+class BatchExecutor:
+    """
+    Runs a set of independent requests as one batch
+
+    Requests that fail inside the batch are retried through the regular
+    synchronous path, so callers always get a response per request.
+    """
+
+    def __init__(self, backend: BatchBackend, poll_interval: float = 30.0, timeout: float = 24 * 3600):
+        """
+        Initialize BatchExecutor
+
+        Args:
+            backend: Batch backend to submit to
+            poll_interval: Seconds between status polls
+            timeout: Seconds to wait before giving up on a batch
+        """
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    @classmethod
+    def create(cls, mode: Optional[str], llm=None, work_dir: str = "batches") -> Optional["BatchExecutor"]:
+        """
+        Create an executor for a batch mode
+
+        Args:
+            mode: "openai", "local" or None (no batching)
+            llm: LLM used by the local backend to answer requests
+            work_dir: Directory for batch files
+
+        Returns:
+            BatchExecutor, or None if mode is None
+        """
+        if not mode:
+            return None
+        if mode == "openai":
+            return cls(OpenAIBatchBackend(work_dir=work_dir))
+        if mode == "local":
+            return cls(LocalBatchBackend(work_dir=os.path.join(work_dir, "local"), llm=llm), poll_interval=0.1)
+        raise ValueError(f"Unknown batch mode: {mode}")
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Run requests as one batch
+
+        Args:
+            jobs: List of {"id", "step"} plus either {"agent", "prompt"} for
+                agent prompts or {"llm", "messages"} for raw chat messages;
+                an optional "json_mode" requests a JSON object response
+
+        Returns:
+            Dictionary of job ID -> {"content", "tokens", "elapsed_time"}
+        """
+        if not jobs:
+            return {}
+
+        start_time = time.time()
+        requests = []
+        for job in jobs:
+            llm = self._llm(job)
+            model = llm.model_for(job.get("step")) if hasattr(llm, "model_for") else llm.model_name
+            messages = job["agent"].prepare_messages(job["prompt"]) if "agent" in job else job["messages"]
+            requests.append(build_request(job["id"], messages, model, job.get("step"), job.get("json_mode", False)))
+
+        print(f"Submitting batch of {len(requests)} requests...")
+        batch_id = self.backend.submit(requests)
+        status = self._wait(batch_id)
+        results = self.backend.results(batch_id) if status == COMPLETED else {}
+        elapsed_time = time.time() - start_time
+        print(f"Batch {batch_id} {status} after {elapsed_time:.1f}s")
+
+        outputs = {}
+        for job in jobs:
+            result = results.get(job["id"])
+            if result and result["content"] is not None:
+                usage = result["usage"] or {}
+                if not self.backend.accounts_usage:
+                    self._record_usage(self._llm(job), job.get("step"), usage)
+                outputs[job["id"]] = {
+                    "content": result["content"],
+                    "tokens": usage.get("total_tokens", 0),
+                    "elapsed_time": elapsed_time
+                }
+            else:
+                # Fall back to a synchronous call for requests the batch did not answer
+                error = result["error"] if result else status
+                print(f"Batch request {job['id']} failed ({error}), running it directly")
+                if "agent" in job:
+                    content, et, tu = job["agent"].generate_response(
+                        job["prompt"], save_to_history=False, step=job.get("step"), json_mode=job.get("json_mode", False)
+                    )
+                else:
+                    content, et, tu = job["llm"].generate_response(
+                        job["messages"], stream=False, step=job.get("step"), json_mode=job.get("json_mode", False)
+                    )
+                outputs[job["id"]] = {"content": content, "tokens": tu, "elapsed_time": elapsed_time + et}
+        return outputs
+
+    @staticmethod
+    def _llm(job: Dict[str, Any]):
+        return job["agent"].llm if "agent" in job else job["llm"]
+
+    def _wait(self, batch_id: str) -> str:
+        """Poll a batch until it completes, fails or times out"""
+        deadline = time.time() + self.timeout
+        while True:
+            status = self.backend.status(batch_id)
+            if status == COMPLETED or status in FAILED_STATES:
+                return status
+            if time.time() > deadline:
+                # The requests are run directly next; stop the batch so they are not billed twice
+                print(f"Batch {batch_id} timed out after {self.timeout:.0f}s, cancelling it")
+                try:
+                    self.backend.cancel(batch_id)
+                except Exception as e:
+                    print(f"Warning: Could not cancel batch {batch_id}: {e}")
+                return "expired"
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _record_usage(llm, step: Optional[str], usage: Dict[str, Any]):
+        """Account batch usage with the router's cost tracking, at batch prices"""
+        if hasattr(llm, "record_usage"):
+            llm.record_usage(
+                step,
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+                price_factor=BATCH_PRICE_FACTOR
+            )
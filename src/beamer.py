@@ -0,0 +1,196 @@
+"""
+Beamer Parsing
+Single-pass tokenizer that splits a beamer document into the text before the
+first frame, the frames (with their spans, options and titles) and the text
+after the last frame.
+
+The scan is linear in the size of the document. It tracks nested
+environments, so an inner \\end{...} does not end a frame early, skips
+comments (a commented-out \\begin{frame} is not a frame) and does not look
+inside verbatim-like environments, whose content may contain anything. A
+frame missing its \\end{frame} is dropped at the next \\begin{frame}, so it
+does not swallow the frames after it.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Environments whose content is not LaTeX and must not be tokenized
+VERBATIM_ENVIRONMENTS = {"verbatim", "verbatim*", "Verbatim", "lstlisting", "minted", "comment"}
+
+TOKEN_PATTERN = re.compile(
+    r"(?P<comment>(?<!\\)%[^\n]*)"
+    r"|\\begin\s*\{(?P<begin>[^{}]*)\}"
+    r"|\\end\s*\{(?P<end>[^{}]*)\}"
+)
+
+FRAMETITLE_PATTERN = re.compile(r"\\frametitle\s*(?:<[^>]*>\s*)?(?:\[[^\]]*\]\s*)?\{")
+
+
+def _braced(text: str, pos: int) -> Optional[Tuple[str, int]]:
+    """
+    Read a balanced {...} group
+
+    Args:
+        text: Source text
+        pos: Index of the opening brace
+
+    Returns:
+        Tuple of (content, index after the closing brace), or None if the
+        group is not closed
+    """
+    depth = 0
+    i = pos
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[pos + 1:i], i + 1
+        i += 1
+    return None
+
+
+def _frame_header(frame: str) -> Tuple[str, str, int]:
+    """
+    Read the arguments following \\begin{frame}
+
+    Returns:
+        Tuple of (options, title argument, index where the body starts)
+    """
+    pos = frame.index("}") + 1  # End of \begin{frame}
+    options = ""
+    title = ""
+    while True:
+        rest = frame[pos:]
+        stripped = rest.lstrip(" \t")
+        skip = len(rest) - len(stripped)
+        if stripped.startswith("<"):
+            end = stripped.find(">")
+            if end == -1:
+                break
+            pos += skip + end + 1
+        elif stripped.startswith("["):
+            end = stripped.find("]")
+            if end == -1:
+                break
+            options = stripped[1:end]
+            pos += skip + end + 1
+        elif stripped.startswith("{") and not title:
+            group = _braced(frame, pos + skip)
+            if group is None:
+                break
+            title, pos = group
+        else:
+            break
+    return options, title, pos
+
+
+def frame_title(frame: str) -> str:
+    """Get the title of a frame from \\frametitle or the frame's title argument"""
+    match = FRAMETITLE_PATTERN.search(frame)
+    if match:
+        group = _braced(frame, match.end() - 1)
+        if group:
+            return group[0].strip()
+    return _frame_header(frame)[1].strip()
+
+
+def parse_beamer(source: str) -> Dict[str, Any]:
+    """
+    Split a beamer document into prefix, frames and suffix
+
+    Args:
+        source: LaTeX source (a full document or a bare list of frames)
+
+    Returns:
+        Dictionary with:
+            "prefix": text before the first frame (or dropped unclosed frame)
+            "frames": list of {"text", "start", "end", "content", "options", "title"}
+                where content is the text between \\begin{frame} and \\end{frame}
+            "suffix": text after the last frame
+            "unclosed": number of frames left out because they are not closed
+        Frames left unclosed (e.g. truncated output, or a missing \\end{frame}
+        before the next \\begin{frame}) are not returned.
+    """
+    frames = []
+    stack = []           # Open environment names
+    frame_start = None   # Start of the current top-level frame
+    frame_depth = None   # Stack depth of the current frame
+    first_begin = None   # Start of the first top-level frame, closed or not
+    unclosed = 0         # Frames dropped for a missing \\end{frame}
+    verbatim = None      # Open verbatim-like environment, if any
+
+    for match in TOKEN_PATTERN.finditer(source):
+        begin, end = match.group("begin"), match.group("end")
+
+        if verbatim is not None:
+            # Only the matching \end closes a verbatim environment
+            if end is not None and end.strip() == verbatim:
+                verbatim = None
+                stack.pop()
+            continue
+
+        if match.group("comment") is not None:
+            continue
+
+        if begin is not None:
+            name = begin.strip()
+            if name == "frame" and frame_start is not None:
+                # Frames do not nest: the open frame is missing its \end{frame}.
+                # Drop it, with anything left open inside it, and start over here
+                del stack[frame_depth - 1:]
+                frame_start = None
+                unclosed += 1
+            stack.append(name)
+            if name in VERBATIM_ENVIRONMENTS:
+                verbatim = name
+            elif name == "frame" and frame_start is None:
+                frame_start = match.start()
+                frame_depth = len(stack)
+                if first_begin is None:
+                    first_begin = frame_start
+            continue
+
+        name = end.strip()
+        if name not in stack:
+            # Stray \end; ignore it rather than unwinding the stack
+            continue
+        # Close the environment, dropping any environments left open inside it
+        while stack and stack.pop() != name:
+            pass
+        if name == "frame" and frame_start is not None and len(stack) < frame_depth:
+            text = source[frame_start:match.end()]
+            options = _frame_header(text)[0]
+            frames.append({
+                "text": text,
+                "start": frame_start,
+                "end": match.end(),
+                "content": text[text.index("}") + 1:len(text) - len(match.group(0))],
+                "options": options,
+                "title": frame_title(text)
+            })
+            frame_start = None
+            frame_depth = None
+
+    if frame_start is not None:
+        unclosed += 1
+    if not frames:
+        return {"prefix": source, "frames": [], "suffix": "", "unclosed": unclosed}
+    return {
+        # A dropped frame before the first one is not part of the preamble
+        "prefix": source[:first_begin],
+        "frames": frames,
+        "suffix": source[frames[-1]["end"]:],
+        "unclosed": unclosed
+    }
+
+
+def extract_frames(source: str) -> List[str]:
+    """Get the text of every complete frame in a LaTeX source"""
+    return [frame["text"] for frame in parse_beamer(source)["frames"]]
@@ -1,13 +1,41 @@
 import os
+import re
+import json
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
 
+from src.beamer import parse_beamer
+from src.tracing import in_context, span
+
+# Frame that replaces a frame which does not compile on its own
+PLACEHOLDER_FRAME = r"""\begin{frame}
+\frametitle{Frame %d omitted}
+This frame could not be compiled and was left out of the deck.
+\end{frame}"""
+
+# Timeout for compiling a single frame in recovery mode
+FRAME_TIMEOUT = 120
+
 class LaTeXCompiler:
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, recover=True, repair_frame=None, max_workers=4):
+        """
+        Args:
+            output_dir: Directory searched recursively for .tex files
+            recover: When a document fails to compile, compile its frames one by
+                one to find the broken frames, replace them and compile the rest
+            repair_frame: Optional function (frame, errors) -> repaired frame or
+                None, tried on each broken frame before it is replaced by a
+                placeholder. errors is a list of {"line", "message"}
+            max_workers: Number of frames compiled concurrently in recovery mode
+        """
         self.output_dir = Path(output_dir)
         self.cache_dir = self.output_dir / ".cache"
+        self.recover = recover
+        self.repair_frame = repair_frame
+        self.max_workers = max_workers
         
         # Set up logging
         logging.basicConfig(
@@ -68,21 +96,43 @@ class LaTeXCompiler:
             self.logger.error(f"Failed to copy {tex_file.name} to cache directory")
             return None
         
+        compilation_logs = self.run_pdflatex(cached_tex_file.name, cache_dir)
+        pdf_file = cache_dir / f"{tex_file.stem}.pdf"
+        
+        # Save comprehensive compilation log
+        log_file = cache_dir / f"{tex_file.stem}_compilation.log"
+        with open(log_file, 'w', encoding='utf-8') as f:
+            f.writelines(compilation_logs)
+        
+        # Also save the LaTeX log file if it exists
+        latex_log = cache_dir / f"{tex_file.stem}.log"
+        if latex_log.exists():
+            saved_latex_log = cache_dir / f"{tex_file.stem}_pdflatex.log"
+            shutil.copy2(latex_log, saved_latex_log)
+        
+        # Return PDF file if it exists and has content
+        if pdf_file.exists() and pdf_file.stat().st_size > 0:
+            return pdf_file
+        else:
+            return None
+    
+    def run_pdflatex(self, tex_name, cache_dir):
+        """Run pdflatex (up to 3 passes) in the cache directory and return the compilation logs."""
         # pdflatex command - run in the cache directory without output-directory flag
         cmd = [
             "pdflatex",
             "-interaction=nonstopmode",  # Don't stop on errors
             "-halt-on-error",           # But halt on major errors
-            cached_tex_file.name        # Input file (just filename since we're in the right directory)
+            tex_name                    # Input file (just filename since we're in the right directory)
         ]
         
         compilation_logs = []
-        pdf_file = cache_dir / f"{tex_file.stem}.pdf"
+        pdf_file = cache_dir / f"{Path(tex_name).stem}.pdf"
         
         # Run pdflatex multiple times to resolve cross-references and bibliography
         for attempt in range(3):
             try:
-                self.logger.info(f"Running pdflatex (attempt {attempt + 1}/3) for {tex_file.name}")
+                self.logger.info(f"Running pdflatex (attempt {attempt + 1}/3) for {tex_name}")
                 
                 print(f"Running command: {' '.join(cmd)}")
                 result = subprocess.run(
@@ -105,44 +155,185 @@ class LaTeXCompiler:
                 
                 # Check if PDF exists and has content
                 if pdf_file.exists() and pdf_file.stat().st_size > 0:
-                    self.logger.info(f"PDF generated successfully for {tex_file.name} (size: {pdf_file.stat().st_size} bytes)")
+                    self.logger.info(f"PDF generated successfully for {tex_name} (size: {pdf_file.stat().st_size} bytes)")
                     break
                 elif result.returncode == 0:
                     # pdflatex reported success but no PDF or empty PDF
-                    self.logger.warning(f"pdflatex completed but PDF is missing or empty for {tex_file.name}")
+                    self.logger.warning(f"pdflatex completed but PDF is missing or empty for {tex_name}")
                 else:
-                    self.logger.warning(f"pdflatex failed with return code {result.returncode} for {tex_file.name}")
+                    self.logger.warning(f"pdflatex failed with return code {result.returncode} for {tex_name}")
                 
                 # If this is the last attempt and still no valid PDF, log more details
                 if attempt == 2:
                     if not pdf_file.exists():
-                        self.logger.error(f"No PDF file generated for {tex_file.name}")
+                        self.logger.error(f"No PDF file generated for {tex_name}")
                     elif pdf_file.stat().st_size == 0:
-                        self.logger.error(f"Empty PDF file generated for {tex_file.name}")
+                        self.logger.error(f"Empty PDF file generated for {tex_name}")
                         
             except subprocess.TimeoutExpired:
-                self.logger.error(f"Compilation timeout for {tex_file.name}")
+                self.logger.error(f"Compilation timeout for {tex_name}")
                 compilation_logs.append(f"TIMEOUT after 3000 seconds\n")
             except Exception as e:
-                self.logger.error(f"Error compiling {tex_file.name}: {str(e)}")
+                self.logger.error(f"Error compiling {tex_name}: {str(e)}")
                 compilation_logs.append(f"EXCEPTION: {str(e)}\n")
             
-        # Save comprehensive compilation log
-        log_file = cache_dir / f"{tex_file.stem}_compilation.log"
-        with open(log_file, 'w', encoding='utf-8') as f:
+        return compilation_logs
+    
+    @staticmethod
+    def parse_errors(output, line_offset=0):
+        """
+        Extract the errors from pdflatex output.
+        
+        Args:
+            output: pdflatex stdout
+            line_offset: Number of document lines before the part of interest;
+                subtracted from the reported line numbers
+        
+        Returns:
+            List of {"line", "message"}; line is None when pdflatex gives none
+        """
+        errors = []
+        lines = output.splitlines()
+        for idx, line in enumerate(lines):
+            if not line.startswith("!"):
+                continue
+            error = {"line": None, "message": line[1:].strip()}
+            for follow in lines[idx + 1:idx + 8]:
+                match = re.match(r"l\.(\d+)\s?(.*)", follow)
+                if match:
+                    error["line"] = max(int(match.group(1)) - line_offset, 1)
+                    if match.group(2):
+                        error["message"] += f" (at: {match.group(2).strip()})"
+                    break
+            errors.append(error)
+        return errors
+    
+    def compile_frame(self, prefix, frame, suffix, work_dir, source_dir):
+        """
+        Compile one frame on its own against the document preamble.
+        
+        Args:
+            prefix: Document text before the frames
+            frame: Frame to check
+            suffix: Document text after the frames
+            work_dir: Directory for this compilation
+            source_dir: Directory searched for included files (images etc.)
+        
+        Returns:
+            Tuple of (compiles, errors)
+        """
+        work_dir.mkdir(parents=True, exist_ok=True)
+        (work_dir / "frame.tex").write_text(prefix + "\n" + frame + "\n" + suffix, encoding="utf-8")
+        env = dict(os.environ, TEXINPUTS=f"{source_dir}{os.pathsep}")
+        try:
+            with span("compile_frame", "compile", frame=work_dir.name) as frame_span:
+                result = subprocess.run(
+                    ["pdflatex", "-interaction=nonstopmode", "-halt-on-error", "-draftmode", "frame.tex"],
+                    cwd=work_dir,
+                    capture_output=True,
+                    text=True,
+                    timeout=FRAME_TIMEOUT,
+                    env=env
+                )
+                frame_span.set(compiles=result.returncode == 0)
+        except subprocess.TimeoutExpired:
+            return False, [{"line": None, "message": f"Compilation timed out after {FRAME_TIMEOUT} seconds"}]
+        if result.returncode == 0:
+            return True, []
+        errors = self.parse_errors(result.stdout, line_offset=prefix.count("\n") + 1)
+        return False, errors or [{"line": None, "message": f"pdflatex exited with code {result.returncode}"}]
+    
+    def recover_latex(self, tex_file, cache_dir):
+        """
+        Compile a document that failed to compile, leaving out its broken frames.
+        
+        Every frame is compiled on its own, in parallel, against the document's
+        preamble. Frames that fail are passed to repair_frame (if set); frames
+        that still fail are replaced by a placeholder frame. The remaining
+        document is compiled and a report is written next to the source as
+        <name>_recovery.json.
+        
+        Returns:
+            Path of the PDF in the cache directory, or None
+        """
+        source = tex_file.read_text(encoding="utf-8")
+        document = parse_beamer(source)
+        frames = document["frames"]
+        if not frames:
+            self.logger.error(f"No frames found in {tex_file.name}; cannot recover")
+            return None
+        
+        if document["unclosed"]:
+            self.logger.warning(f"Leaving out {document['unclosed']} frames of {tex_file.name} without \\end{{frame}}")
+        prefix = document["prefix"]
+        suffix = document["suffix"]
+        if "\\end{document}" not in suffix:
+            # Truncated document
+            suffix += "\n\\end{document}\n"
+        
+        self.logger.info(f"Recovering {tex_file.name}: compiling {len(frames)} frames separately")
+        frames_dir = cache_dir / "frames"
+        
+        # The preamble and title page have to compile on their own
+        compiles, errors = self.compile_frame(prefix, "", suffix, frames_dir / "preamble", cache_dir)
+        if not compiles:
+            self.logger.error(f"The preamble of {tex_file.name} does not compile: {errors[0]['message']}")
+            return None
+        
+        def check(idx):
+            frame = frames[idx]["text"]
+            compiles, errors = self.compile_frame(prefix, frame, suffix, frames_dir / f"frame_{idx + 1:03d}", cache_dir)
+            if compiles:
+                return frame, None
+            
+            report = {"index": idx + 1, "title": frames[idx]["title"], "errors": errors, "action": "placeholder"}
+            if self.repair_frame:
+                try:
+                    repaired = self.repair_frame(frame, errors)
+                except Exception as e:
+                    self.logger.warning(f"Repairing frame {idx + 1} of {tex_file.name} failed: {str(e)}")
+                    repaired = None
+                if repaired:
+                    compiles, _ = self.compile_frame(prefix, repaired, suffix,
+                                                     frames_dir / f"frame_{idx + 1:03d}_repaired", cache_dir)
+                    if compiles:
+                        report["action"] = "repaired"
+                        return repaired, report
+            return PLACEHOLDER_FRAME % (idx + 1), report
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            outcomes = list(executor.map(in_context(check), range(len(frames))))
+        
+        broken = [report for _, report in outcomes if report]
+        for report in broken:
+            first_error = report["errors"][0]["message"] if report["errors"] else "unknown error"
+            self.logger.warning(f"Frame {report['index']} of {tex_file.name} ({report['action']}): {first_error}")
+        
+        # Compile the document with the broken frames replaced
+        recovered_tex = cache_dir / tex_file.name
+        recovered_tex.write_text(prefix + "\n\n".join(frame for frame, _ in outcomes) + suffix, encoding="utf-8")
+        pdf_file = cache_dir / f"{tex_file.stem}.pdf"
+        if pdf_file.exists():
+            pdf_file.unlink()
+        compilation_logs = self.run_pdflatex(recovered_tex.name, cache_dir)
+        with open(cache_dir / f"{tex_file.stem}_recovery_compilation.log", 'w', encoding='utf-8') as f:
             f.writelines(compilation_logs)
         
-        # Also save the LaTeX log file if it exists
-        latex_log = cache_dir / f"{tex_file.stem}.log"
-        if latex_log.exists():
-            saved_latex_log = cache_dir / f"{tex_file.stem}_pdflatex.log"
-            shutil.copy2(latex_log, saved_latex_log)
+        compiled = pdf_file.exists() and pdf_file.stat().st_size > 0
+        with open(tex_file.parent / f"{tex_file.stem}_recovery.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "frames": len(frames),
+                "broken_frames": broken,
+                "repaired": sum(1 for report in broken if report["action"] == "repaired"),
+                "replaced": sum(1 for report in broken if report["action"] == "placeholder"),
+                "compiled": compiled
+            }, f, indent=2)
         
-        # Return PDF file if it exists and has content
-        if pdf_file.exists() and pdf_file.stat().st_size > 0:
-            return pdf_file
-        else:
+        if not compiled:
+            self.logger.error(f"Recovered document {tex_file.name} still does not compile")
             return None
+        self.logger.info(f"Recovered {tex_file.name}: {len(broken)} of {len(frames)} frames repaired or replaced")
+        return pdf_file
     
     def move_pdf_to_source_location(self, pdf_file, tex_file):
         """Move the compiled PDF to the same directory as the source .tex file."""
@@ -210,7 +401,15 @@ class LaTeXCompiler:
                 cache_dir = self.create_cache_directory(tex_file)
                 
                 # Compile the LaTeX file
-                pdf_file = self.compile_latex(tex_file, cache_dir)
+                with span("compile_file", "compile", file=tex_file.name) as file_span:
+                    pdf_file = self.compile_latex(tex_file, cache_dir)
+                    file_span.set(compiled=pdf_file is not None)
+                
+                # Localize broken frames and compile the rest
+                if not pdf_file and self.recover:
+                    with span("recover", "compile", file=tex_file.name) as recover_span:
+                        pdf_file = self.recover_latex(tex_file, cache_dir)
+                        recover_span.set(compiled=pdf_file is not None)
                 
                 if pdf_file:
                     # Move PDF to source location
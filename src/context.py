@@ -0,0 +1,181 @@
+"""
+Context Builder
+Selects and compresses prior deliberation results into a token budget
+"""
+
+import re
+import math
+from functools import lru_cache
+from typing import List, Dict, Tuple, Any, Optional
+
+from src.lazy import optional_import
+
+# Rough characters-per-token ratio for English text when tiktoken is missing
+CHARS_PER_TOKEN = 4
+
+TRUNCATION_MARKER = "\n[... truncated to fit context budget ...]"
+
+
+@lru_cache(maxsize=8)
+def _get_encoder(model_name: str):
+    """Get (and cache) the tiktoken encoder for a model"""
+    tiktoken = optional_import("tiktoken")
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model_name: str = "gpt-4o-mini") -> int:
+    """
+    Count the tokens in a piece of text
+
+    Uses tiktoken when it is installed and falls back to a character-based
+    estimate otherwise.
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder(model_name)
+    if encoder is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = "gpt-4o-mini") -> str:
+    """Cut text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoder = _get_encoder(model_name)
+    if encoder is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoder.encode(text, disallowed_special=())
+    return encoder.decode(tokens[:max_tokens])
+
+
+def compress_text(text: str, max_tokens: int, model_name: str = "gpt-4o-mini") -> str:
+    """
+    Compress a deliberation result so that it fits into max_tokens
+
+    Compression is extractive and deterministic:
+    1. Collapse redundant whitespace
+    2. Keep structural lines (headings, list items, table rows) and the
+       first sentence of each prose paragraph
+    3. Truncate whatever is still over budget
+
+    Args:
+        text: Text to compress
+        max_tokens: Token budget for the text
+        model_name: Model whose tokenizer is used for counting
+
+    Returns:
+        Compressed text
+    """
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+
+    # Step 1: whitespace
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+
+    # Step 2: structure-preserving extraction
+    structural = re.compile(r"^\s*(#{1,6}\s|[-*+]\s|\d+[.)]\s|\|)")
+    kept = []
+    for paragraph in text.split("\n\n"):
+        lines = paragraph.split("\n")
+        if any(structural.match(line) for line in lines):
+            kept.extend(line for line in lines if structural.match(line))
+        else:
+            first_sentence = re.split(r"(?<=[.!?])\s", paragraph.strip(), maxsplit=1)[0]
+            kept.append(first_sentence)
+    text = "\n".join(line for line in kept if line.strip())
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+
+    # Step 3: hard truncation
+    marker_tokens = count_tokens(TRUNCATION_MARKER, model_name)
+    return truncate_to_tokens(text, max_tokens - marker_tokens, model_name) + TRUNCATION_MARKER
+
+
+class ContextBuilder:
+    """
+    Builds the "Current Context" section of deliberation prompts
+
+    Only the results a deliberation declares as inputs are included, and the
+    total is kept within a token budget. Sections that fit their share are
+    passed through unchanged; the leftover budget is redistributed to the
+    larger sections, which are compressed to their final share.
+    """
+
+    def __init__(self, token_budget: int = 6000, model_name: str = "gpt-4o-mini"):
+        """
+        Initialize ContextBuilder
+
+        Args:
+            token_budget: Maximum number of tokens for the assembled context
+            model_name: Model whose tokenizer is used for counting
+        """
+        self.token_budget = token_budget
+        self.model_name = model_name
+
+    @staticmethod
+    def _allocate(sizes: List[int], budget: int) -> List[int]:
+        """Water-fill a token budget across sections of the given sizes"""
+        allocation = [0] * len(sizes)
+        remaining_budget = budget
+        pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+
+        while pending:
+            share = remaining_budget // len(pending)
+            idx = pending.pop(0)
+            allocation[idx] = min(sizes[idx], share)
+            remaining_budget -= allocation[idx]
+
+        return allocation
+
+    def build(self, sections: List[Tuple[str, str]], baseline: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Assemble labelled sections into a context string within the budget
+
+        Args:
+            sections: List of (label, text) in the order they should appear
+            baseline: The context that would have been sent without this
+                builder, used to report the tokens saved
+
+        Returns:
+            Tuple of (context string, report dictionary)
+        """
+        sections = [(label, text) for label, text in sections if text]
+        # Account for the "### label" header lines
+        overhead = sum(count_tokens(f"### {label}\n\n\n", self.model_name) for label, _ in sections)
+        sizes = [count_tokens(text, self.model_name) for _, text in sections]
+
+        allocation = self._allocate(sizes, max(0, self.token_budget - overhead))
+
+        parts = []
+        section_reports = []
+        for (label, text), size, limit in zip(sections, sizes, allocation):
+            compressed = compress_text(text, limit, self.model_name) if size > limit else text
+            parts.append(f"### {label}\n{compressed}")
+            section_reports.append({
+                "label": label,
+                "raw_tokens": size,
+                "context_tokens": count_tokens(compressed, self.model_name),
+                "compressed": size > limit
+            })
+
+        context = "\n\n".join(parts)
+        context_tokens = count_tokens(context, self.model_name)
+        baseline_tokens = count_tokens(baseline, self.model_name) if baseline is not None else sum(sizes)
+
+        report = {
+            "token_budget": self.token_budget,
+            "baseline_tokens": baseline_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": max(0, baseline_tokens - context_tokens),
+            "sections": section_reports
+        }
+        return context, report
@@ -0,0 +1,115 @@
+"""
+Evaluation Cache
+Persists evaluation scores and validation reports keyed on the hash of the
+evaluated artifact, so that repeated evaluations of an experiment only
+re-evaluate the files that changed.
+
+Score keys combine the content hash, file type, metric (name and rubric
+text), evaluator model and scoring mode; validation report keys combine the
+content hash, file type, validator and model. Changing any of these
+invalidates the entry.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.metrics import cache_lookups
+
+CACHE_VERSION = 1
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 of an artifact's text content"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """
+    JSON-file store of per-file evaluation results
+
+    Lookups and updates are thread-safe; call save() to persist updates.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize EvaluationCache
+
+        Args:
+            path: JSON file holding the cache; created on the first save
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.scores = {}
+        self.reports = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self.scores = data.get("scores", {})
+                    self.reports = data.get("reports", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable evaluation cache {self.path}: {e}")
+
+    @staticmethod
+    def _score_key(content: str, file_type: str, metric: str, description: str, model: str, mode: str) -> str:
+        rubric = hashlib.sha256(f"{metric}: {description}".encode("utf-8")).hexdigest()[:16]
+        return "|".join((content_hash(content), file_type, metric, rubric, model, mode))
+
+    @staticmethod
+    def _report_key(content: str, file_type: str, agent_name: str, model: str) -> str:
+        return "|".join((content_hash(content), file_type, agent_name, model))
+
+    def _get(self, table: Dict[str, Any], key: str) -> Any:
+        with self.lock:
+            value = table.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        cache_lookups.inc(cache="evaluation", result="miss" if value is None else "hit")
+        return value
+
+    def _put(self, table: Dict[str, Any], key: str, value: Any):
+        with self.lock:
+            table[key] = value
+            self.dirty = True
+
+    def get_score(self, content: str, file_type: str, metric: str, description: str,
+                  model: str, mode: str) -> Optional[float]:
+        """Get a cached metric score, or None"""
+        return self._get(self.scores, self._score_key(content, file_type, metric, description, model, mode))
+
+    def put_score(self, content: str, file_type: str, metric: str, description: str,
+                  model: str, mode: str, score: float):
+        """Store a metric score"""
+        self._put(self.scores, self._score_key(content, file_type, metric, description, model, mode), score)
+
+    def get_report(self, content: str, file_type: str, agent_name: str, model: str) -> Optional[str]:
+        """Get a cached validation report, or None"""
+        return self._get(self.reports, self._report_key(content, file_type, agent_name, model))
+
+    def put_report(self, content: str, file_type: str, agent_name: str, model: str, report: str):
+        """Store a validation report"""
+        self._put(self.reports, self._report_key(content, file_type, agent_name, model), report)
+
+    def save(self):
+        """Write the cache atomically if it changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {"version": CACHE_VERSION, "scores": self.scores, "reports": self.reports}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
@@ -1,11 +1,17 @@
+import contextlib
 import os
 import json
-from typing import List, Dict, Optional
-from openai import OpenAI
+from typing import Callable, List, Dict, Optional
 from pathlib import Path
-import pandas as pd
-from src.agents import LLM
-import argparse
+from datetime import datetime
+from src.agents import LLM, LLMError
+from src.router import ModelRouter
+from src.batch import BatchExecutor
+from src.eval_cache import EvaluationCache
+from src.structured import ParseError, parse_json, parse_stats
+from src.tracing import in_context
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 class ValidationAgent:
     """
@@ -35,18 +41,8 @@ class ValidationAgent:
             }
         }
     
-    def evaluate_content(self, file_type: str, filename: str, content: str) -> str:
-        """
-        Evaluate content based on the agent's role
-        
-        Args:
-            file_type: Type of file (Learning Objectives, Syllabus, Assessment, Slide Content, Slide Scripts)
-            filename: Name of the file being evaluated
-            content: Content to evaluate
-            
-        Returns:
-            Evaluation report in markdown format
-        """
+    def build_messages(self, file_type: str, filename: str, content: str) -> List[Dict[str, str]]:
+        """Build the chat messages for evaluating a file"""
         system_prompt = self.prompts[self.role]["system"]
         
         user_prompt = f"""
@@ -69,16 +65,48 @@ class ValidationAgent:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
+        return messages
+    
+    def evaluate_content(self, file_type: str, filename: str, content: str) -> str:
+        """
+        Evaluate content based on the agent's role
         
-        response, elapsed_time, token_usage = self.llm.generate_response(messages, stream=False)
+        Args:
+            file_type: Type of file (Learning Objectives, Syllabus, Assessment, Slide Content, Slide Scripts)
+            filename: Name of the file being evaluated
+            content: Content to evaluate
+            
+        Returns:
+            Evaluation report in markdown format
+        """
+        messages = self.build_messages(file_type, filename, content)
+        
+        response, elapsed_time, token_usage = self.llm.generate_response(messages, stream=False, step="evaluation_validation")
         return response
 
 class EvaluationAgent:
     """
     Evaluation agent for scoring course materials based on specific metrics
     """
-    def __init__(self, llm: LLM):
+    SCORING_MODES = ("per_metric", "multi_metric")
+    # Score reported for a metric whose scoring calls failed or could not be parsed;
+    # applied only when summarizing, never cached
+    DEFAULT_SCORE = 3.0
+
+    def __init__(self, llm: LLM, scoring_mode: str = "per_metric"):
+        """
+        Initialize EvaluationAgent
+        
+        Args:
+            llm: LLM (or ModelRouter) used for scoring
+            scoring_mode: "per_metric" sends one request per (file, metric);
+                "multi_metric" scores all metrics of a file in one request and
+                re-scores only the metrics whose result could not be parsed
+        """
+        if scoring_mode not in self.SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {scoring_mode}")
         self.llm = llm
+        self.scoring_mode = scoring_mode
         self.metrics = {
             "learning_objectives": {
                 "clarity": "Learning objectives are stated clearly in understandable language.",
@@ -114,19 +142,8 @@ class EvaluationAgent:
         }
 
     
-    def score_single_metric(self, file_type: str, filename: str, content: str, metric: str) -> int:
-        """
-        Score a single metric for a file (returns only a number 1-5)
-        
-        Args:
-            file_type: Type of file
-            filename: Name of the file
-            content: Content to evaluate
-            metric: Specific metric to score
-            
-        Returns:
-            Score (1-5)
-        """
+    def build_score_messages(self, file_type: str, filename: str, content: str, metric: str) -> List[Dict[str, str]]:
+        """Build the chat messages for scoring a single metric"""
         cot_prompt = """Your output should be format as JSON like:
         {"THOUGHT": "Your thought process here", "SCORE": 2.0}
 
@@ -155,40 +172,383 @@ class EvaluationAgent:
         {content}
         """
         
-        messages = [
+        return [
             {"role": "system", "content": "You are an educational content evaluator. Provide only numerical scores."},
             {"role": "user", "content": prompt}
         ]
+    
+    def parse_score(self, response: str, file_type: str, metric: str) -> Optional[float]:
+        """Parse a scoring response, returning None if it holds no valid score"""
+        try:
+            result = parse_json(response, expect="object", name="evaluation_score")
+            score = float(result.get("SCORE", 3.0))
+            if 1.0 <= score <= 5.0:
+                return score
+            print(f"Invalid score {score} for {metric} in {file_type}. Retrying...")
+        except Exception as e:
+            print(f"Failed to parse score from response: {response}. Error: {e}. Retrying...")
+        return None
+    
+    def build_multi_score_messages(self, file_type: str, filename: str, content: str) -> List[Dict[str, str]]:
+        """Build the chat messages for scoring all metrics of a file in one request"""
+        metrics = self.metrics.get(file_type, {})
+        metric_list = "\n".join(f"        - {metric}: {description}" for metric, description in metrics.items())
+        example = json.dumps({metric: {"THOUGHT": "...", "SCORE": 2.0} for metric in metrics})
+        prompt = f"""
+        Evaluate the following {file_type} content from file "{filename}" on each of these metrics:
+{metric_list}
+        
+        Rate the content on every metric independently using a scale of 1.0 ~ 5.0 (you can use decimal values).
+        - 5.0: Perfect
+        - 4.0: Excellent
+        - 3.0: Good
+        - 2.0: Fair
+        - 1.0: Poor
+
+        Your output should be format as a JSON object with one entry per metric, like:
+        {example}
+
+        In THOUGHT, briefly discuss your intuitions and reasoning for that metric only.
+        Be specific to this content, not generic.
+
+        In SCORE, respond with ONLY the rating number (1.0 ~ 5.0). No other text or explanation.
+
+        NOTE: Don't always give it a high score, try to think how much time you spend on this content to polish it for use if you are a faculty.
+
+        Content:
+        {content}
+        """
+        
+        return [
+            {"role": "system", "content": "You are an educational content evaluator. Provide only numerical scores."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def parse_multi_scores(self, response: str, file_type: str) -> Dict[str, float]:
+        """Parse a multi-metric scoring response, returning only the metrics with a valid score"""
+        try:
+            result = parse_json(response, expect="object", name="evaluation_multi_score")
+        except ParseError as e:
+            print(f"Failed to parse multi-metric scores for {file_type}. Error: {e}")
+            return {}
+        
+        scores = {}
+        for metric in self.metrics.get(file_type, {}):
+            entry = result.get(metric)
+            try:
+                score = float(entry.get("SCORE") if isinstance(entry, dict) else entry)
+            except (TypeError, ValueError):
+                print(f"Missing score for {metric} in {file_type}")
+                continue
+            if 1.0 <= score <= 5.0:
+                scores[metric] = score
+            else:
+                print(f"Invalid score {score} for {metric} in {file_type}")
+        return scores
+    
+    def score_file(self, file_type: str, filename: str, content: str) -> Dict[str, Optional[float]]:
+        """
+        Score all metrics of a file with one request
+        
+        Metrics missing from the response or holding an invalid score are
+        re-scored individually with score_single_metric.
+        
+        Args:
+            file_type: Type of file
+            filename: Name of the file
+            content: Content to evaluate
+            
+        Returns:
+            Dictionary of metric -> score, None for metrics that could not be scored
+        """
+        metrics = self.metrics.get(file_type, {})
+        messages = self.build_multi_score_messages(file_type, filename, content)
+        try:
+            response, elapsed_time, token_usage = self.llm.generate_response(
+                messages, stream=False, step="evaluation_scoring", json_mode=True
+            )
+            scores = self.parse_multi_scores(response, file_type)
+        except LLMError as e:
+            print(f"Multi-metric scoring call failed for {filename}: {e}")
+            scores = {}
+        
+        for metric in metrics:
+            if metric not in scores:
+                print(f"Falling back to single-metric scoring for {filename} - {metric}")
+                scores[metric] = self.score_single_metric(file_type, filename, content, f"{metric}: {metrics[metric]}")
+        return scores
+
+    def score_single_metric(self, file_type: str, filename: str, content: str, metric: str) -> Optional[float]:
+        """
+        Score a single metric for a file (returns only a number 1-5)
+        
+        Args:
+            file_type: Type of file
+            filename: Name of the file
+            content: Content to evaluate
+            metric: Specific metric to score
+            
+        Returns:
+            Score (1-5), or None if the calls failed or no valid score was returned
+        """
+        messages = self.build_score_messages(file_type, filename, content, metric)
         
         max_retries = 3  # 最多重试3次
         retries = 0
 
         while retries < max_retries:
-            response, elapsed_time, token_usage = self.llm.generate_response(messages, stream=False)
-
             try:
-                result = json.loads(response)
-                score = float(result.get("SCORE", 3.0))
-                if 1.0 <= score <= 5.0:
-                    return score
-                else:
-                    print(f"Invalid score {score} for {metric} in {file_type}. Retrying...")
-            except Exception as e:
-                print(f"Failed to parse score from response: {response}. Error: {e}. Retrying...")
+                response, elapsed_time, token_usage = self.llm.generate_response(
+                    messages, stream=False, step="evaluation_scoring", json_mode=True
+                )
+            except LLMError as e:
+                # 调用本身失败（限流重试已用尽），不再重试
+                print(f"Scoring call failed for {metric} in {file_type}: {e}. Leaving it unscored.")
+                return None
+
+            score = self.parse_score(response, file_type, metric)
+            if score is not None:
+                return score
 
             retries += 1
 
-        # 如果重试后仍然失败，默认返回3.0
-        print(f"Max retries reached. Defaulting to 3.0 for {metric} in {file_type}.")
-        return 3.0
+        # 如果重试后仍然失败，返回None；汇总时才使用默认分数，且不写入缓存
+        print(f"Max retries reached without a valid score for {metric} in {file_type}. Leaving it unscored.")
+        return None
+
+
+    def batch_scores(self, file_data: Dict[str, List[Dict]], batch_executor, scores: Dict[tuple, float] = None) -> Dict[tuple, float]:
+        """
+        Score all (file, metric) pairs as one batch
+        
+        In multi_metric mode the batch holds one request per file.
+        
+        Args:
+            file_data: Dictionary with file types as keys and list of file info as values
+            batch_executor: BatchExecutor to submit the requests with
+            scores: Scores already known (e.g. from the cache), which are not re-scored
+            
+        Returns:
+            Dictionary of (file_type, filename, metric) -> score for the
+            responses that held a valid score
+        """
+        known = scores or {}
+        jobs = []
+        keys = {}
+        for file_type, files in file_data.items():
+            metrics = self.metrics.get(file_type, {})
+            for file_info in files:
+                missing = [metric for metric in metrics if (file_type, file_info['filename'], metric) not in known]
+                if self.scoring_mode == "multi_metric" and missing and len(missing) == len(metrics):
+                    job_id = f"score_{len(jobs)}"
+                    keys[job_id] = (file_type, file_info['filename'], None)
+                    jobs.append({
+                        "id": job_id,
+                        "llm": self.llm,
+                        "step": "evaluation_scoring",
+                        "json_mode": True,
+                        "messages": self.build_multi_score_messages(file_type, file_info['filename'], file_info['content'])
+                    })
+                    continue
+                for metric in missing:
+                    job_id = f"score_{len(jobs)}"
+                    keys[job_id] = (file_type, file_info['filename'], metric)
+                    jobs.append({
+                        "id": job_id,
+                        "llm": self.llm,
+                        "step": "evaluation_scoring",
+                        "json_mode": True,
+                        "messages": self.build_score_messages(
+                            file_type, file_info['filename'], file_info['content'], f"{metric}: {metrics[metric]}"
+                        )
+                    })
+        
+        scores = {}
+        for job_id, output in batch_executor.run(jobs).items():
+            file_type, filename, metric = keys[job_id]
+            if metric is None:
+                for metric, score in self.parse_multi_scores(output["content"], file_type).items():
+                    scores[(file_type, filename, metric)] = score
+                continue
+            score = self.parse_score(output["content"], file_type, metric)
+            if score is not None:
+                scores[keys[job_id]] = score
+        return scores
 
+    def score_all(self, file_data: Dict[str, List[Dict]], max_workers: int = 8, scores: Dict[tuple, float] = None) -> Dict[tuple, float]:
+        """
+        Score every (file, metric) pair concurrently on a bounded pool
+        
+        In multi_metric mode each file without any known score is scored with
+        one request; metrics left over (e.g. by a partially parsed batch
+        response) are scored individually.
+        
+        Args:
+            file_data: Dictionary with file types as keys and list of file info as values
+            max_workers: Maximum number of concurrent scoring calls
+            scores: Scores already known (e.g. from a batch), which are not re-scored
+            
+        Returns:
+            Dictionary of (file_type, filename, metric) -> score; the score is
+            None for pairs that could not be scored
+        """
+        scores = dict(scores or {})
+        futures = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for file_type, files in file_data.items():
+                metrics = self.metrics.get(file_type, {})
+                for file_info in files:
+                    filename = file_info['filename']
+                    missing = [metric for metric in metrics if (file_type, filename, metric) not in scores]
+                    if not missing:
+                        continue
+                    if self.scoring_mode == "multi_metric" and len(missing) == len(metrics):
+                        futures[executor.submit(
+                            in_context(self.score_file, "score_file", "task", file=filename),
+                            file_type, filename, file_info['content']
+                        )] = (file_type, filename, None)
+                        continue
+                    for metric in missing:
+                        futures[executor.submit(
+                            in_context(self.score_single_metric, "score_metric", "task", file=filename, metric=metric),
+                            file_type, filename, file_info['content'], f"{metric}: {metrics[metric]}"
+                        )] = (file_type, filename, metric)
+            
+            for future in as_completed(futures):
+                file_type, filename, metric = futures[future]
+                result = future.result()
+                file_scores = result if metric is None else {metric: result}
+                for metric, score in file_scores.items():
+                    scores[(file_type, filename, metric)] = score
+                    print(f"Scored {filename} - {metric}: {score}")
+        return scores
 
-    def evaluate_files(self, file_data: Dict[str, List[Dict]]) -> Dict:
+    def cached_scores(self, file_data: Dict[str, List[Dict]], cache: EvaluationCache) -> Dict[tuple, float]:
+        """
+        Look up the cached scores of the current file contents
+        
+        Returns:
+            Dictionary of (file_type, filename, metric) -> score for cache hits
+        """
+        model = _model_for(self.llm, "evaluation_scoring")
+        scores = {}
+        total = 0
+        for file_type, files in file_data.items():
+            metrics = self.metrics.get(file_type, {})
+            for file_info in files:
+                for metric, description in metrics.items():
+                    total += 1
+                    score = cache.get_score(file_info['content'], file_type, metric, description, model, self.scoring_mode)
+                    if score is not None:
+                        scores[(file_type, file_info['filename'], metric)] = score
+        print(f"Reusing {len(scores)} of {total} scores from the evaluation cache")
+        return scores
+    
+    def with_defaults(self, scores: Dict[tuple, Optional[float]]) -> Dict[tuple, float]:
+        """Replace the scores of pairs that could not be scored with DEFAULT_SCORE"""
+        defaulted = sum(score is None for score in scores.values())
+        if defaulted:
+            print(f"{defaulted} scores could not be obtained and default to {self.DEFAULT_SCORE}")
+        return {key: self.DEFAULT_SCORE if score is None else score for key, score in scores.items()}
+
+    def store_scores(self, file_data: Dict[str, List[Dict]], cache: EvaluationCache, scores: Dict[tuple, Optional[float]]):
+        """Store new scores in the cache and persist it; pairs that could not be scored are not stored"""
+        model = _model_for(self.llm, "evaluation_scoring")
+        contents = {(file_type, file_info['filename']): file_info['content']
+                    for file_type, files in file_data.items() for file_info in files}
+        for (file_type, filename, metric), score in scores.items():
+            if score is None:
+                continue
+            cache.put_score(contents[(file_type, filename)], file_type, metric,
+                            self.metrics[file_type][metric], model, self.scoring_mode, score)
+        cache.save()
+
+    def _scoring_usage(self) -> Dict[str, float]:
+        """Usage accounted for the scoring step so far (zeros if the LLM does not track cost)"""
+        usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+        if hasattr(self.llm, "cost_report"):
+            usage.update(self.llm.cost_report()["steps"].get("evaluation_scoring", {}))
+        return {key: usage[key] for key in ("calls", "prompt_tokens", "completion_tokens", "cost")}
+
+    def calibrate(self, file_data: Dict[str, List[Dict]], max_workers: int = 8) -> Dict:
+        """
+        Score the same files in both scoring modes and compare the results
+        
+        Args:
+            file_data: Dictionary with file types as keys and list of file info as values
+            max_workers: Maximum number of concurrent scoring calls
+            
+        Returns:
+            Dictionary with per-mode usage, score agreement and per-metric means
+        """
+        modes = {}
+        mode_scores = {}
+        for mode in self.SCORING_MODES:
+            agent = EvaluationAgent(self.llm, scoring_mode=mode)
+            agent.metrics = self.metrics
+            print(f"Calibration: scoring in {mode} mode...")
+            before = self._scoring_usage()
+            start_time = time.time()
+            mode_scores[mode] = self.with_defaults(agent.score_all(file_data, max_workers=max_workers))
+            elapsed_time = time.time() - start_time
+            after = self._scoring_usage()
+            modes[mode] = {key: after[key] - before[key] for key in after}
+            modes[mode]["elapsed_time"] = elapsed_time
+            values = list(mode_scores[mode].values())
+            modes[mode]["average_score"] = sum(values) / len(values) if values else 0
+        
+        keys = sorted(mode_scores["per_metric"])
+        pairs = [(mode_scores["per_metric"][key], mode_scores["multi_metric"][key]) for key in keys]
+        differences = [multi - single for single, multi in pairs]
+        
+        metrics = {}
+        for (file_type, filename, metric), (single, multi) in zip(keys, pairs):
+            entry = metrics.setdefault(file_type, {}).setdefault(metric, {"per_metric": [], "multi_metric": []})
+            entry["per_metric"].append(single)
+            entry["multi_metric"].append(multi)
+        for file_type, type_metrics in metrics.items():
+            for metric, entry in type_metrics.items():
+                type_metrics[metric] = {
+                    "files": len(entry["per_metric"]),
+                    "per_metric_mean": sum(entry["per_metric"]) / len(entry["per_metric"]),
+                    "multi_metric_mean": sum(entry["multi_metric"]) / len(entry["multi_metric"]),
+                    "mean_absolute_difference": sum(
+                        abs(m - p) for p, m in zip(entry["per_metric"], entry["multi_metric"])
+                    ) / len(entry["per_metric"])
+                }
+        
+        return {
+            "scored_pairs": len(pairs),
+            "modes": modes,
+            "agreement": {
+                "mean_difference": sum(differences) / len(differences) if differences else 0,
+                "mean_absolute_difference": sum(abs(d) for d in differences) / len(differences) if differences else 0,
+                "within_0_5": sum(abs(d) <= 0.5 for d in differences) / len(differences) if differences else 0,
+                "pearson": _pearson(pairs)
+            },
+            "metrics": metrics,
+            "scores": [
+                {"file_type": file_type, "filename": filename, "metric": metric,
+                 "per_metric": single, "multi_metric": multi}
+                for (file_type, filename, metric), (single, multi) in zip(keys, pairs)
+            ]
+        }
+
+    def evaluate_files(self, file_data: Dict[str, List[Dict]], batch_executor=None, max_workers: int = 8,
+                       cache: EvaluationCache = None) -> Dict:
         """
         Evaluate all files and generate summary statistics
         
+        All scoring calls run first (as a batch and/or on a bounded thread
+        pool); the summaries are aggregated once every score is known.
+        
         Args:
             file_data: Dictionary with file types as keys and list of file info as values
+            batch_executor: Optional BatchExecutor to score all metrics as one batch;
+                responses without a valid score are re-scored synchronously
+            max_workers: Maximum number of concurrent scoring calls
+            cache: Optional EvaluationCache; only (file, metric) pairs without a
+                cached score for the current content are scored
             
         Returns:
             Dictionary containing scores and statistics
@@ -199,6 +559,13 @@ class EvaluationAgent:
         print("Starting evaluation of course materials...")
         print(f"Total file types to evaluate: {[ len(files) for file_type, files in file_data.items() if files]}")
 
+        cached = self.cached_scores(file_data, cache) if cache else {}
+        batched = self.batch_scores(file_data, batch_executor, scores=cached) if batch_executor else {}
+        scores = self.score_all(file_data, max_workers=max_workers, scores={**cached, **batched})
+        if cache:
+            self.store_scores(file_data, cache, {key: score for key, score in scores.items() if key not in cached})
+        scores = self.with_defaults(scores)
+
         for file_type, files in file_data.items():
             if not files:  # Skip empty file lists
                 continue
@@ -208,13 +575,7 @@ class EvaluationAgent:
 
             for file_info in files:
                 filename = file_info['filename']
-                content = file_info['content']
-
-                file_scores = {}
-                for metric in metrics.keys():
-                    score = self.score_single_metric(file_type, filename, content, f"{metric}: {metrics[metric]}")
-                    file_scores[metric] = score
-                    print(f"Scored {filename} - {metric}: {score}")
+                file_scores = {metric: scores[(file_type, filename, metric)] for metric in metrics.keys()}
 
                 type_results.append({
                     'filename': filename,
@@ -256,21 +617,87 @@ class EvaluationAgent:
         return results
 
 
+def _model_for(llm, step: str) -> str:
+    """Model a step runs on, for LLM clients with and without routing"""
+    return llm.model_for(step) if hasattr(llm, "model_for") else llm.model_name
+
+
+def check_exp_name(exp_name: str):
+    """
+    Reject experiment names that are not a single directory name
+
+    Raises:
+        ValueError: If the name is empty or contains a path (e.g. "../..")
+    """
+    if not exp_name or exp_name in (".", "..") or Path(exp_name).name != exp_name:
+        raise ValueError(f"Invalid experiment name: {exp_name!r}")
+
+
+def _pearson(pairs: List[tuple]) -> Optional[float]:
+    """Pearson correlation of (x, y) pairs, None if undefined"""
+    if len(pairs) < 2:
+        return None
+    n = len(pairs)
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    var_x = sum((x - mean_x) ** 2 for x, _ in pairs)
+    var_y = sum((y - mean_y) ** 2 for _, y in pairs)
+    if var_x == 0 or var_y == 0:
+        return None
+    return cov / (var_x * var_y) ** 0.5
+
+
 class CourseEvaluationSystem:
     """
     Main system for evaluating course materials
     """
-    def __init__(self, model_name: str, exp_name: str):
-        self.llm = LLM(model_name=model_name)
+    # Artifacts evaluated in an experiment directory, by file type
+    ROOT_FILES = ['result_instructional_goals.md', 'result_syllabus_design.md']
+    CHAPTER_FILES = ['slides.tex', 'assessment.md', 'script.md']
+    FILE_TYPES = {
+        'result_instructional_goals.md': 'learning_objectives',
+        'result_syllabus_design.md': 'syllabus',
+        'slides.tex': 'slide_content',
+        'assessment.md': 'assessment',
+        'script.md': 'slide_scripts'
+    }
+
+    def __init__(self, model_name: str, exp_name: str, routing=None, batch: str = None, scoring_mode: str = "per_metric",
+                 use_cache: bool = True, llm=None, batch_executor=None, exp_root: str = "exp", eval_root: str = "eval"):
+        """
+        Initialize CourseEvaluationSystem
+        
+        Args:
+            model_name: Default evaluator model
+            exp_name: Experiment to evaluate (directory under exp_root)
+            routing: Model routing config, used when no llm is given
+            batch: Batch mode, used when no llm is given
+            scoring_mode: "per_metric" or "multi_metric"
+            use_cache: Whether to reuse results of unchanged files
+            llm: Shared LLM/ModelRouter (e.g. from an EvaluationEngine)
+            batch_executor: Shared BatchExecutor, used together with llm
+            exp_root: Directory holding the experiments
+            eval_root: Directory for evaluation outputs
+        """
+        if llm is None:
+            llm = ModelRouter.from_config(model_name, routing)
+            batch_executor = BatchExecutor.create(batch, llm=llm)
+        self.llm = llm
+        self.batch_executor = batch_executor
         self.program_chair = ValidationAgent("Program Chair", self.llm)
         self.test_student = ValidationAgent("Test Student", self.llm)
-        self.evaluator = EvaluationAgent(self.llm)
+        self.evaluator = EvaluationAgent(self.llm, scoring_mode=scoring_mode)
+        check_exp_name(exp_name)
         self.exp_name = exp_name
+        self.exp_dir = Path(exp_root) / exp_name
 
-        self.eval_dir = Path(f"eval/{model_name}-Evaluation_{self.exp_name}/evaluation_results")
+        output_dir = Path(eval_root) / f"{model_name}-Evaluation_{self.exp_name}"
+        self.eval_dir = output_dir / "evaluation_results"
         self.eval_dir.mkdir(parents=True, exist_ok=True)
-        self.valid_dir = Path(f"eval/{model_name}-Evaluation_{self.exp_name}/validation_reports")
+        self.valid_dir = output_dir / "validation_reports"
         self.valid_dir.mkdir(parents=True, exist_ok=True)
+        self.cache = EvaluationCache(str(output_dir / "evaluation_cache.json")) if use_cache else None
 
     def read_file_content(self, filepath: str) -> str:
         """Read content from file"""
@@ -283,14 +710,37 @@ class CourseEvaluationSystem:
     
     def map_file_to_type(self, filename: str) -> str:
         """Map filename to content type"""
-        mapping = {
-            'result_instructional_goals.md': 'learning_objectives',
-            'result_syllabus_design.md': 'syllabus',
-            'slides.tex': 'slide_content',
-            'assessment.md': 'assessment',
-            'script.md': 'slide_scripts'
-        }
-        return mapping.get(filename, 'Unknown')
+        return self.FILE_TYPES.get(filename, 'Unknown')
+    
+    def collect_files(self) -> Dict[str, List[Dict]]:
+        """
+        Collect the artifacts of the experiment
+        
+        Returns:
+            Dictionary with file types as keys and lists of
+            {"filename", "content", "filepath"} as values
+        """
+        file_data = {file_type: [] for file_type in self.evaluator.metrics}
+        
+        candidates = [(filename, self.exp_dir / filename) for filename in self.ROOT_FILES]
+        for chapter_dir in sorted(self.exp_dir.glob("chapter_*")):
+            if chapter_dir.is_dir():
+                candidates.extend(
+                    (f"{chapter_dir.name}_{filename}", chapter_dir / filename) for filename in self.CHAPTER_FILES
+                )
+        
+        for filename, filepath in candidates:
+            if not filepath.exists():
+                continue
+            content = self.read_file_content(str(filepath))
+            file_type = self.map_file_to_type(filepath.name)
+            if content and file_type != 'Unknown':
+                file_data[file_type].append({
+                    'filename': filename,
+                    'content': content,
+                    'filepath': str(filepath)
+                })
+        return file_data
     
     def save_validation_report(self, agent_name: str, file_type: str, filename: str, evaluation: str):
         """Save validation report to markdown file"""
@@ -303,7 +753,7 @@ class CourseEvaluationSystem:
             f.write(f"# {agent_name} Validation Report\n\n")
             f.write(f"**File Type:** {file_type}\n\n")
             f.write(f"**File Name:** {filename}\n\n")
-            f.write(f"**Evaluation Date:** {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            f.write(f"**Evaluation Date:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
             f.write("---\n\n")
             f.write(evaluation)
         
@@ -321,13 +771,13 @@ class CourseEvaluationSystem:
         # Save JSON results
         json_path = output_dir / "evaluation_scores_overall.json"
         with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(results['overall_summary'], f, indent=2, ensure_ascii=False)
+            json.dump(results.get('overall_summary', {}), f, indent=2, ensure_ascii=False)
         
         # Save markdown summary
         md_path = output_dir / "evaluation_summary.md"
         with open(md_path, 'w', encoding='utf-8') as f:
             f.write("# Course Material Evaluation Summary\n\n")
-            f.write(f"**Evaluation Date:** {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            f.write(f"**Evaluation Date:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
             
             for file_type, data in results.items():
                 f.write(f"## {file_type}\n\n")
@@ -335,6 +785,9 @@ class CourseEvaluationSystem:
                 f.write(f"- **Average Score:** {data['summary']['average_score']:.2f}\n")
                 f.write(f"- **Score Range:** {data['summary']['min_score']} - {data['summary']['max_score']}\n\n")
                 
+                # The overall summary has no per-file scores
+                if 'files' not in data:
+                    continue
                 f.write("### Individual File Scores\n\n")
                 for file_result in data['files']:
                     f.write(f"**{file_result['filename']}** (Avg: {file_result['average']:.2f})\n")
@@ -344,118 +797,270 @@ class CourseEvaluationSystem:
         
         print(f"Saved evaluation results: {json_path}")
 
-def main(model_name, exp_name):
-    """
-    Main function to process course materials
-    """
-    print("Starting Course Material Evaluation System...")
+    def run_validations(self, file_data: Dict[str, List[Dict]], max_workers: int = 8):
+        """
+        Run the Program Chair and Test Student validations and save their reports
+        
+        (file, validator) pairs with a cached report for the current content
+        are not re-run.
+        
+        Args:
+            file_data: Dictionary with file types as keys and list of file info as values
+            max_workers: Maximum number of concurrent validation calls
+        """
+        validation_model = _model_for(self.llm, "evaluation_validation")
+        pending = []
+        cached_reports = 0
+        for file_type, files in file_data.items():
+            for file_info in files:
+                if not file_info['content']:
+                    continue
+                for agent_name, agent in (("Program_Chair", self.program_chair), ("Test_Student", self.test_student)):
+                    report = self.cache.get_report(
+                        file_info['content'], file_type, agent_name, validation_model
+                    ) if self.cache else None
+                    if report is not None:
+                        self.save_validation_report(agent_name, file_type, file_info['filename'], report)
+                        cached_reports += 1
+                    else:
+                        pending.append((agent_name, agent, file_type, file_info))
+        print(f"Reusing {cached_reports} validation reports from the evaluation cache, {len(pending)} to run")
 
-    system = CourseEvaluationSystem(model_name, exp_name)
-    root_dir = Path(f"exp/{exp_name}")
+        def store_report(agent_name, file_type, file_info, evaluation):
+            self.save_validation_report(agent_name, file_type, file_info['filename'], evaluation)
+            if self.cache:
+                self.cache.put_report(file_info['content'], file_type, agent_name, validation_model, evaluation)
 
-    # Collect all files to process
-    file_data = {
-        'learning_objectives': [],
-        'syllabus': [],
-        'assessment': [],
-        'slide_content': [],
-        'slide_scripts': []
-    }
-    
-    # Process root level files
-    root_files = ['result_instructional_goals.md', 'result_syllabus_design.md']
-    for filename in root_files:
-        filepath = root_dir / filename
-        if filepath.exists():
-            content = system.read_file_content(str(filepath))
-            file_type = system.map_file_to_type(filename)
+        try:
+            if self.batch_executor:
+                jobs = [{
+                    "id": f"validation_{idx}",
+                    "llm": self.llm,
+                    "step": "evaluation_validation",
+                    "messages": agent.build_messages(file_type, file_info['filename'], file_info['content'])
+                } for idx, (agent_name, agent, file_type, file_info) in enumerate(pending)]
+                outputs = self.batch_executor.run(jobs)
+                for job, (agent_name, agent, file_type, file_info) in zip(jobs, pending):
+                    store_report(agent_name, file_type, file_info, outputs[job["id"]]["content"])
+            else:
+                # Each (file, validator) pair is independent; a failed call skips
+                # only its report, which is run again next time
+                def validate(agent_name, agent, file_type, file_info):
+                    print(f"{agent_name.replace('_', ' ')} validating {file_info['filename']}...")
+                    try:
+                        evaluation = agent.evaluate_content(file_type, file_info['filename'], file_info['content'])
+                    except LLMError as e:
+                        print(f"Validation of {file_info['filename']} by {agent_name.replace('_', ' ')} failed: {e}")
+                        return
+                    store_report(agent_name, file_type, file_info, evaluation)
+                
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(in_context(validate, "validate", "task", validator=args[0],
+                                                          file=args[3]['filename']), *args)
+                               for args in pending]
+                    for future in futures:
+                        future.result()
+        finally:
+            # Keep the reports finished so far, even if the run fails
+            if self.cache:
+                self.cache.save()
+
+    def calibrate(self, file_data: Dict[str, List[Dict]], max_workers: int = 8) -> Dict:
+        """Compare the scoring modes on the experiment and save the report"""
+        calibration = self.evaluator.calibrate(file_data, max_workers=max_workers)
+        calibration_path = self.eval_dir / "scoring_calibration.json"
+        with open(calibration_path, 'w', encoding='utf-8') as f:
+            json.dump(calibration, f, indent=2, ensure_ascii=False)
+        
+        print("\n" + "="*50)
+        print("SCORING CALIBRATION")
+        print("="*50)
+        for mode, usage in calibration["modes"].items():
+            print(f"{mode}: {usage['calls']} calls, {usage['prompt_tokens']} prompt tokens, "
+                  f"average score {usage['average_score']:.2f}, {usage['elapsed_time']:.1f}s")
+        agreement = calibration["agreement"]
+        print(f"Mean difference (multi - per): {agreement['mean_difference']:+.2f}")
+        print(f"Mean absolute difference: {agreement['mean_absolute_difference']:.2f}")
+        print(f"Within 0.5: {agreement['within_0_5']:.0%}")
+        print(f"Saved calibration report: {calibration_path}")
+        return calibration
+
+    def run(self, max_workers: int = 8, calibrate: bool = False) -> Dict:
+        """
+        Evaluate the experiment: score, validate and save all results
+        
+        Args:
+            max_workers: Maximum number of concurrent scoring and validation calls
+            calibrate: Only compare the scoring modes; no results or
+                validation reports are written
             
-            if content and file_type != 'Unknown':
-                file_data[file_type].append({
-                    'filename': filename,
-                    'content': content,
-                    'filepath': str(filepath)
-                })
-    
-    # Process chapter folders
-    for chapter_dir in root_dir.glob("chapter_*"):
-        if chapter_dir.is_dir():
-            chapter_files = ['slides.tex', 'assessment.md', 'script.md']
-            for filename in chapter_files:
-                filepath = chapter_dir / filename
-                if filepath.exists():
-                    content = system.read_file_content(str(filepath))
-                    file_type = system.map_file_to_type(filename)
-                    
-                    if content and file_type != 'Unknown':
-                        file_data[file_type].append({
-                            'filename': f"{chapter_dir.name}_{filename}",
-                            'content': content,
-                            'filepath': str(filepath)
-                        })
-
-    print("Files collected. Starting evaluation...")
-
-    # Run evaluation agent
-    evaluation_results = system.evaluator.evaluate_files(file_data)
-    system.save_evaluation_results(evaluation_results)
-    
-    print("Evaluation complete!")
-    
-    # Run validation agents
-    for file_type, files in file_data.items():
-        for file_info in files:
-            if file_info['content']:
-                # Program Chair validation
-                print(f"Program Chair validating {file_info['filename']}...")
-                pc_evaluation = system.program_chair.evaluate_content(
-                    file_type, file_info['filename'], file_info['content']
-                )
-                system.save_validation_report(
-                    "Program_Chair", file_type, file_info['filename'], pc_evaluation
+        Returns:
+            Dictionary with the experiment name, output directory, per-type
+            summaries (or the calibration report) and the cost of the run
+        """
+        print(f"Evaluating experiment: {self.exp_name}")
+        # Costs of this experiment only; the client may be shared with other runs
+        accounting = self.llm.collect() if hasattr(self.llm, "collect") else contextlib.nullcontext()
+        with accounting as usage:
+            file_data = self.collect_files()
+            print("Files collected. Starting evaluation...")
+            
+            result = {"exp_name": self.exp_name, "eval_dir": str(self.eval_dir.parent)}
+            if calibrate:
+                result["calibration"] = self.calibrate(file_data, max_workers=max_workers)
+            else:
+                evaluation_results = self.evaluator.evaluate_files(
+                    file_data, batch_executor=self.batch_executor, max_workers=max_workers, cache=self.cache
                 )
+                self.save_evaluation_results(evaluation_results)
+                print("Evaluation complete!")
                 
-                # Test Student validation
-                print(f"Test Student validating {file_info['filename']}...")
-                ts_evaluation = system.test_student.evaluate_content(
-                    file_type, file_info['filename'], file_info['content']
-                )
-                system.save_validation_report(
-                    "Test_Student", file_type, file_info['filename'], ts_evaluation
-                )
+                self.run_validations(file_data, max_workers=max_workers)
+                print("Validation complete.")
+                
+                result["summary"] = {file_type: data['summary'] for file_type, data in evaluation_results.items()}
+        
+        if usage is not None:
+            costs = self.llm.cost_report(usage)
+            with open(self.eval_dir / "costs.json", 'w', encoding='utf-8') as f:
+                json.dump(costs, f, indent=2)
+            result["total_cost"] = costs["total_cost"]
+        return result
+
+
+class EvaluationEngine:
+    """
+    Evaluates any number of experiments with one shared client pool
     
-    print("Validation complete.")
+    The router (one client per model), batch executor and process-wide rate
+    limiter are created once and reused for every experiment, so grading
+    many runs does not pay for a new process and new clients per run.
+    Experiments are evaluated one after another; the calls within an
+    experiment run concurrently.
+    """
+
+    def __init__(self, model_name: str = "gpt-4o-mini", routing=None, batch: str = None,
+                 scoring_mode: str = "per_metric", use_cache: bool = True, max_workers: int = 8,
+                 exp_root: str = "exp", eval_root: str = "eval"):
+        """
+        Initialize EvaluationEngine
+        
+        Args:
+            model_name: Default evaluator model
+            routing: Model routing config (dict, JSON string or file path)
+            batch: Batch mode ("openai", "local" or None)
+            scoring_mode: "per_metric" or "multi_metric"
+            use_cache: Whether to reuse results of unchanged files
+            max_workers: Maximum number of concurrent calls per experiment
+            exp_root: Directory holding the experiments
+            eval_root: Directory for evaluation outputs
+        """
+        self.model_name = model_name
+        self.scoring_mode = scoring_mode
+        self.use_cache = use_cache
+        self.max_workers = max_workers
+        self.exp_root = exp_root
+        self.eval_root = eval_root
+        self.llm = ModelRouter.from_config(model_name, routing)
+        self.batch_executor = BatchExecutor.create(batch, llm=self.llm)
+
+    def system_for(self, exp_name: str) -> CourseEvaluationSystem:
+        """Create the evaluation system of an experiment on the shared clients"""
+        return CourseEvaluationSystem(
+            self.model_name, exp_name,
+            scoring_mode=self.scoring_mode,
+            use_cache=self.use_cache,
+            llm=self.llm,
+            batch_executor=self.batch_executor,
+            exp_root=self.exp_root,
+            eval_root=self.eval_root
+        )
+
+    def evaluate(self, exp_name: str, calibrate: bool = False) -> Dict:
+        """
+        Evaluate one experiment
+        
+        Raises:
+            ValueError: If the name is not a single directory name
+            FileNotFoundError: If the experiment directory does not exist
+        """
+        check_exp_name(exp_name)
+        exp_dir = Path(self.exp_root) / exp_name
+        if not exp_dir.is_dir():
+            raise FileNotFoundError(f"Experiment directory not found: {exp_dir}")
+        return self.system_for(exp_name).run(max_workers=self.max_workers, calibrate=calibrate)
+
+    def evaluate_many(self, exp_names: List[str], calibrate: bool = False,
+                      on_complete: Callable[[str, Dict], None] = None) -> Dict[str, Dict]:
+        """
+        Evaluate several experiments
+        
+        A failing experiment is reported with an "error" entry and does not
+        stop the others.
+        
+        Args:
+            exp_names: Experiments to evaluate
+            calibrate: Only compare the scoring modes
+            on_complete: Optional callback with (exp_name, result) after each experiment
+            
+        Returns:
+            Dictionary of experiment name -> result of evaluate()
+        """
+        results = {}
+        for exp_name in exp_names:
+            try:
+                results[exp_name] = self.evaluate(exp_name, calibrate=calibrate)
+            except Exception as e:
+                print(f"Evaluation of {exp_name} failed: {e}")
+                results[exp_name] = {"exp_name": exp_name, "error": str(e)}
+            if on_complete:
+                on_complete(exp_name, results[exp_name])
+        return results
+
+
+def main(model_name, exp_names, routing=None, batch=None, max_workers=8, scoring_mode="per_metric", calibrate=False,
+         use_cache=True) -> Dict[str, Dict]:
+    """
+    Evaluate one or more experiments and print a summary
     
-    # Print summary
-    print("\n" + "="*50)
-    print("EVALUATION SUMMARY")
-    print("="*50)
-    for file_type, data in evaluation_results.items():
-        print(f"\n{file_type}:")
-        print(f"  Files: {data['summary']['total_files']}")
-        print(f"  Average Score: {data['summary']['average_score']:.2f}")
-        print(f"  Score Range: {data['summary']['min_score']} - {data['summary']['max_score']}")
-
-if __name__ == "__main__":
-    with open("config.json", "r") as f:
-        config = json.load(f)
-    os.environ["OPENAI_API_KEY"] = config.get("OPENAI_API_KEY", "")
-
-    # Set up command line arguments
-    parser = argparse.ArgumentParser(description="Run evaluation ......")
-    parser.add_argument(
-        "--model", 
-        type=str,
-        default="gpt-4o-mini",
-        help="Model name to use for evaluation"
-    )
+    Args:
+        model_name: Default evaluator model
+        exp_names: Experiment name or list of experiment names
+        
+    Returns:
+        Dictionary of experiment name -> evaluation result
+    """
+    print("Starting Course Material Evaluation System...")
+    if isinstance(exp_names, str):
+        exp_names = [exp_names]
 
-    parser.add_argument(
-        "--exp", 
-        type=str,
-        default="test",
-        help="Experiment name for logging"
+    engine = EvaluationEngine(
+        model_name, routing=routing, batch=batch, scoring_mode=scoring_mode,
+        use_cache=use_cache, max_workers=max_workers
     )
+    with parse_stats.collect() as run_parse_stats:
+        results = engine.evaluate_many(exp_names, calibrate=calibrate)
+    
+    # Print summary
+    for exp_name, result in results.items():
+        print("\n" + "="*50)
+        print(f"EVALUATION SUMMARY: {exp_name}")
+        print("="*50)
+        if "error" in result:
+            print(f"  Failed: {result['error']}")
+            continue
+        for file_type, summary in result.get("summary", {}).items():
+            print(f"\n{file_type}:")
+            print(f"  Files: {summary['total_files']}")
+            print(f"  Average Score: {summary['average_score']:.2f}")
+            print(f"  Score Range: {summary['min_score']} - {summary['max_score']}")
+        if "total_cost" in result:
+            print(f"\nEstimated API cost: ${result['total_cost']:.4f}")
+    
+    for name, counts in run_parse_stats.report().items():
+        print(f"JSON parsing [{name}]: {counts['repaired']} repaired, {counts['failed']} failed of {counts['total']}")
     
-    args = parser.parse_args()
-    main(model_name=args.model, exp_name=args.exp)
\ No newline at end of file
+    if len(exp_names) > 1:
+        total_cost = engine.llm.cost_report()["total_cost"]
+        print(f"\nEstimated API cost for {len(exp_names)} experiments: ${total_cost:.4f}")
+    return results
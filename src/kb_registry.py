@@ -0,0 +1,252 @@
+"""
+Knowledge Base Registry
+Process-wide cache of open knowledge bases, their vector-store clients and
+their metadata.
+
+Building a SlideKnowledgeBase opens a chromadb PersistentClient or loads
+chunks.json and embeddings.pkl from disk; listing knowledge bases reads every
+metadata.json. The registry keeps one chromadb client per storage path,
+keeps recently used knowledge bases loaded (least recently used first out
+once their estimated size exceeds the memory budget) and indexes metadata by
+file modification time, so repeated optimizations, LaTeX generation, listing
+and search work on warm indexes.
+
+A loaded knowledge base is reloaded when its metadata.json changes on disk,
+e.g. after another process rebuilt it. Shared instances are only read: a
+knowledge base is rebuilt on a new instance from build() and swapped in with
+register(). They hold no API key; embedding calls take the caller's key.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.lazy import optional_import
+from src.metrics import cache_lookups, registry as metrics_registry
+from src.slide_knowledge_base import SlideKnowledgeBase
+from src.tracing import span
+
+DEFAULT_KB_DIR = "knowledge_base"
+
+# Estimated bytes per embedding value held as a Python float in a list
+FLOAT_BYTES = 32
+
+kb_resident = metrics_registry.gauge("knowledge_base_resident", "Knowledge bases loaded in memory")
+kb_resident_bytes = metrics_registry.gauge("knowledge_base_resident_bytes",
+                                           "Estimated memory of the loaded knowledge bases")
+kb_evictions = metrics_registry.counter("knowledge_base_evictions_total",
+                                        "Knowledge bases unloaded to stay within the memory budget")
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def estimate_size(kb: SlideKnowledgeBase) -> int:
+    """Rough number of bytes a loaded knowledge base keeps in memory"""
+    if kb.use_chromadb:
+        # Vectors stay in chromadb; only the collection handle is resident
+        return 4096
+    size = sum(len(embedding) for embedding in kb.embeddings.values()) * FLOAT_BYTES
+    size += sum(len(chunk.get("title") or "") + len(chunk.get("content") or "") + 512 for chunk in kb.chunks)
+    if kb._index is not None:
+        size += kb._index[1].nbytes
+    return size
+
+
+class KnowledgeBaseRegistry:
+    """Thread-safe LRU of loaded knowledge bases with per-path chromadb clients and a metadata index"""
+
+    def __init__(self, memory_budget: int):
+        """
+        Args:
+            memory_budget: Estimated bytes of loaded knowledge bases to keep;
+                the most recently used one is always kept
+        """
+        self.memory_budget = memory_budget
+        self.lock = threading.RLock()
+        self.loaded = OrderedDict()     # Knowledge base path -> [kb, metadata mtime, estimated size]
+        self.resident_bytes = 0
+        self.clients = {}               # chroma_db path -> chromadb client
+        self.metadata = {}              # metadata.json path -> (mtime, metadata)
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0}
+        metrics_registry.add_collector(self._collect)
+
+    @staticmethod
+    def _key(name: str, kb_dir: str) -> str:
+        return str((Path(kb_dir) / name).resolve())
+
+    def chroma_client(self, path: Path):
+        """
+        The chromadb client of a storage path, opened once per process
+
+        Returns:
+            The client, or None if chromadb is not installed
+        """
+        chromadb = optional_import("chromadb")
+        if chromadb is None:
+            return None
+        key = str(Path(path).resolve())
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = chromadb.PersistentClient(path=key)
+            return client
+
+    def get(self, name: str, kb_dir: str = DEFAULT_KB_DIR) -> SlideKnowledgeBase:
+        """
+        A knowledge base, loaded from disk only if it is not resident or changed
+
+        Args:
+            name: Knowledge base name
+            kb_dir: Directory holding the knowledge bases
+
+        Returns:
+            Shared SlideKnowledgeBase instance
+        """
+        key = self._key(name, kb_dir)
+        metadata_mtime = _mtime(Path(key) / "metadata.json")
+        with self.lock:
+            entry = self.loaded.get(key)
+            if entry is not None and entry[1] == metadata_mtime:
+                self.loaded.move_to_end(key)
+                self.stats["hits"] += 1
+                cache_lookups.inc(cache="knowledge_base", result="hit")
+                return entry[0]
+            self.stats["reloads" if entry is not None else "misses"] += 1
+        cache_lookups.inc(cache="knowledge_base", result="miss")
+
+        # Loaded outside the lock so that hits on other knowledge bases do not wait
+        kb = self.build(name, kb_dir)
+        with self.lock:
+            self._store(key, kb, metadata_mtime)
+        return kb
+
+    def build(self, name: str, kb_dir: str = DEFAULT_KB_DIR) -> SlideKnowledgeBase:
+        """
+        A new, unshared instance loaded from disk, using the cached chromadb client
+
+        Rebuild a knowledge base (create_from_extracted_data) on such an
+        instance and then register() it, so that searches running on the
+        shared instance never see it half-built.
+        """
+        with span("load_knowledge_base", "step", kb=name):
+            chroma_client = self.chroma_client(Path(kb_dir) / name / "chroma_db")
+            return SlideKnowledgeBase(name, kb_dir=kb_dir, chroma_client=chroma_client)
+
+    def register(self, kb: SlideKnowledgeBase):
+        """Make a knowledge base built with build() the shared instance"""
+        key = str(kb.kb_dir.resolve())
+        with self.lock:
+            self._store(key, kb, _mtime(kb.kb_dir / "metadata.json"))
+
+    def invalidate(self, name: str, kb_dir: str = DEFAULT_KB_DIR):
+        """Unload a knowledge base, e.g. after it was deleted"""
+        key = self._key(name, kb_dir)
+        with self.lock:
+            entry = self.loaded.pop(key, None)
+            if entry is not None:
+                self.resident_bytes -= entry[2]
+            self.metadata.pop(str(Path(key) / "metadata.json"), None)
+
+    def _store(self, key: str, kb: SlideKnowledgeBase, metadata_mtime: Optional[float]):
+        previous = self.loaded.pop(key, None)
+        if previous is not None:
+            self.resident_bytes -= previous[2]
+        size = estimate_size(kb)
+        self.loaded[key] = [kb, metadata_mtime, size]
+        self.resident_bytes += size
+        while self.resident_bytes > self.memory_budget and len(self.loaded) > 1:
+            _, (_, _, evicted_size) = self.loaded.popitem(last=False)
+            self.resident_bytes -= evicted_size
+            self.stats["evictions"] += 1
+            kb_evictions.inc()
+
+    def list(self, kb_dir: str = DEFAULT_KB_DIR) -> List[Dict[str, Any]]:
+        """
+        Metadata of all knowledge bases in a directory
+
+        Only metadata files that changed since they were last read are read
+        again.
+
+        Returns:
+            List of metadata dictionaries
+        """
+        root = Path(kb_dir)
+        if not root.exists():
+            return []
+        result = []
+        for folder in sorted(root.iterdir()):
+            if not folder.is_dir():
+                continue
+            metadata_file = folder / "metadata.json"
+            mtime = _mtime(metadata_file)
+            if mtime is None:
+                continue
+            key = str(metadata_file.resolve())
+            with self.lock:
+                cached = self.metadata.get(key)
+            if cached is not None and cached[0] == mtime:
+                result.append(cached[1])
+                continue
+            try:
+                with open(metadata_file, 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except Exception as e:
+                print(f"Warning: Could not load metadata for {folder.name}: {e}")
+                continue
+            with self.lock:
+                self.metadata[key] = (mtime, metadata)
+            result.append(metadata)
+        return result
+
+    def search(self, name: str, query: str, top_k: int = 5, kb_dir: str = DEFAULT_KB_DIR,
+               api_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Semantic search in a knowledge base, loading it if it is not resident
+
+        Args:
+            api_key: Key of the caller, used to embed the query (default: OPENAI_API_KEY)
+
+        Returns:
+            Results of SlideKnowledgeBase.search
+        """
+        kb = self.get(name, kb_dir)
+        indexed = kb.use_chromadb or kb._index is not None
+        with span("kb_search", "step", kb=name, top_k=top_k):
+            results = kb.search(query, top_k=top_k, api_key=api_key)
+        if not indexed and kb._index is not None:
+            # The first search built the vector index; account for its memory
+            self.register(kb)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hits, misses, reloads and evictions, and what is resident"""
+        with self.lock:
+            return dict(self.stats, resident=len(self.loaded), resident_bytes=self.resident_bytes,
+                        memory_budget=self.memory_budget, chroma_clients=len(self.clients))
+
+    def _collect(self):
+        with self.lock:
+            kb_resident.set(len(self.loaded))
+            kb_resident_bytes.set(self.resident_bytes)
+
+
+_kb_registry = None
+_kb_registry_lock = threading.Lock()
+
+
+def get_kb_registry() -> KnowledgeBaseRegistry:
+    """Get the process-wide knowledge base registry, with its memory budget from KB_CACHE_MB (default 512)"""
+    global _kb_registry
+    if _kb_registry is None:
+        with _kb_registry_lock:
+            if _kb_registry is None:
+                _kb_registry = KnowledgeBaseRegistry(int(float(os.environ.get("KB_CACHE_MB", 512)) * 1024 * 1024))
+    return _kb_registry
@@ -0,0 +1,419 @@
+"""
+LaTeX Lint
+Fast, local checks and mechanical repairs for LLM-generated beamer frames.
+
+A single scan of each frame finds the errors that most often make pdflatex
+fail on generated slides and repairs the ones with an unambiguous fix:
+
+- unescaped &, _, # and percent signs after numbers ("50%") in text; & and
+  _ are left alone in alignment, math and TikZ environments and in file
+  names, and reported instead of escaped inside unknown environments or
+  where _ looks like a subscript missing its math delimiters
+- stray or unclosed braces and \\begin/\\end environments
+- verbatim, lstlisting and \\verb in frames without the [fragile] option
+
+Problems without a mechanical fix (unbalanced math delimiters, unclosed
+verbatim blocks, nested frames, ambiguous special characters) are reported
+as errors, so the caller can regenerate the frame instead of losing the
+whole document at compile time.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.beamer import VERBATIM_ENVIRONMENTS, parse_beamer
+
+# Environments in which & separates columns
+ALIGNMENT_ENVIRONMENTS = {
+    "tabular", "tabular*", "tabularx", "longtable", "array", "align", "align*", "alignat", "alignat*",
+    "aligned", "alignedat", "split", "eqnarray", "eqnarray*", "cases", "matrix", "pmatrix", "bmatrix",
+    "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix"
+}
+
+# Environments whose content is math
+MATH_ENVIRONMENTS = {
+    "equation", "equation*", "align", "align*", "alignat", "alignat*", "gather", "gather*",
+    "multline", "multline*", "eqnarray", "eqnarray*", "math", "displaymath", "flalign", "flalign*"
+}
+
+# Environments whose content is drawing code, where &, _ and # are syntax (e.g. \\matrix rows)
+PICTURE_ENVIRONMENTS = {"tikzpicture", "tikzcd", "pgfpicture", "circuitikz", "axis", "scope"}
+
+# Environments whose content is plain text; & and _ in other, unknown
+# environments are reported instead of escaped
+TEXT_ENVIRONMENTS = {
+    "itemize", "enumerate", "description", "block", "alertblock", "exampleblock", "columns", "column",
+    "center", "flushleft", "flushright", "quote", "quotation", "minipage", "figure", "table", "onlyenv",
+    "overlayarea", "overprint", "uncoverenv", "visibleenv", "invisibleenv", "altenv", "theorem",
+    "definition", "example", "proof", "lemma", "corollary", "abstract", "tabular", "tabular*", "tabularx",
+    "longtable"
+}
+
+# Commands whose arguments are names, paths or URLs rather than text, with
+# the number of such arguments
+LITERAL_ARGUMENT_COMMANDS = {
+    "url": 1, "href": 1, "label": 1, "ref": 1, "eqref": 1, "pageref": 1, "cite": 1, "includegraphics": 1,
+    "input": 1, "include": 1, "usepackage": 1, "usetheme": 1, "usecolortheme": 1, "hyperlink": 1,
+    "hypertarget": 1, "lstinputlisting": 1, "graphicspath": 1, "bibliography": 1, "inputminted": 2
+}
+
+# Commands that make a frame need the [fragile] option
+FRAGILE_COMMANDS = {"verb", "lstinline", "mintinline"}
+
+FRAME_BEGIN_PATTERN = re.compile(r"\\begin\s*\{frame\}(\s*<[^>]*>)?(\s*\[)?")
+ENVIRONMENT_NAME_PATTERN = re.compile(r"\s*\{([^{}]*)\}")
+
+
+def _group_end(text: str, pos: int) -> Optional[int]:
+    """Index after the {...} group opening at pos, or None if it is not closed"""
+    depth = 0
+    i = pos
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return None
+
+
+def _lint_body(body: str) -> Dict[str, Any]:
+    """
+    Scan the text between \\begin{frame} and \\end{frame}
+
+    Returns:
+        Dictionary with the edits to apply (position, length to delete, text to
+        insert), the fixes and errors found and whether the frame is fragile
+    """
+    edits = []
+    fixes = []
+    errors = []
+    stack = []          # ("{", pos) for groups, (name, pos) for environments
+    math = None         # Open inline/display math delimiter
+    math_start = 0
+    fragile = False
+    i = 0
+    n = len(body)
+    newlines = [match.start() for match in re.finditer("\n", body)]
+
+    def issue(code, message, pos):
+        return {"code": code, "message": message, "line": bisect.bisect_left(newlines, pos) + 1}
+
+    def escape(pos, char):
+        edits.append((pos, 0, "\\"))
+        fixes.append(issue("unescaped_char", f"Escaped '{char}'", pos))
+
+    def close_above(index, pos):
+        """Close the groups and environments opened after stack[index]"""
+        for item, _ in reversed(stack[index + 1:]):
+            insert = "}" if item == "{" else f"\\end{{{item}}}"
+            edits.append((pos, 0, insert))
+            fixes.append(issue("unclosed_" + ("brace" if item == "{" else "environment"),
+                                f"Inserted {insert}", pos))
+        del stack[index + 1:]
+
+    while i < n:
+        char = body[i]
+
+        if char == "\\":
+            if i + 1 >= n:
+                break
+            nxt = body[i + 1]
+            if not nxt.isalpha():
+                if nxt in "([":
+                    if math is None:
+                        math, math_start = "\\" + nxt, i
+                    else:
+                        errors.append(issue("unbalanced_math", f"'\\{nxt}' inside math", i))
+                elif nxt in ")]":
+                    if math == "\\" + {")": "(", "]": "["}[nxt]:
+                        math = None
+                    else:
+                        errors.append(issue("unbalanced_math", f"Unmatched '\\{nxt}'", i))
+                i += 2
+                continue
+
+            j = i + 1
+            while j < n and body[j].isalpha():
+                j += 1
+            name = body[i + 1:j]
+
+            if name in ("begin", "end"):
+                match = ENVIRONMENT_NAME_PATTERN.match(body, j)
+                if not match:
+                    i = j
+                    continue
+                env = match.group(1).strip()
+                token_end = match.end()
+
+                if name == "begin":
+                    if env == "frame":
+                        errors.append(issue("nested_frame", "\\begin{frame} inside a frame", i))
+                    elif env in VERBATIM_ENVIRONMENTS:
+                        fragile = True
+                        end = re.compile(r"\\end\s*\{" + re.escape(env) + r"\}").search(body, token_end)
+                        if not end:
+                            errors.append(issue("unclosed_verbatim", f"\\begin{{{env}}} is never closed", i))
+                            i = n
+                            continue
+                        i = end.end()
+                        continue
+                    stack.append((env, i))
+                    i = token_end
+                    continue
+
+                # \end{env}
+                index = next((k for k in range(len(stack) - 1, -1, -1) if stack[k][0] == env), None)
+                if index is None:
+                    edits.append((i, token_end - i, ""))
+                    fixes.append(issue("stray_end", f"Removed unmatched \\end{{{env}}}", i))
+                else:
+                    close_above(index, i)
+                    stack.pop()
+                i = token_end
+                continue
+
+            if name in FRAGILE_COMMANDS:
+                fragile = True
+                k = j + 1 if j < n and body[j] == "*" else j
+                if name != "verb" and k < n and body[k] == "[":
+                    close = body.find("]", k)
+                    k = close + 1 if close != -1 else k
+                if k < n and body[k] == "{" and name != "verb":
+                    end = _group_end(body, k)
+                else:
+                    close = body.find(body[k], k + 1) if k < n else -1
+                    end = close + 1 if close != -1 and "\n" not in body[k:close] else None
+                if end is None:
+                    errors.append(issue("unclosed_verbatim", f"Unterminated \\{name}", i))
+                    i = n
+                    continue
+                i = end
+                continue
+
+            if name in LITERAL_ARGUMENT_COMMANDS:
+                k = j
+                while k < n and body[k] in " \t*":
+                    k += 1
+                if k < n and body[k] == "[":
+                    close = body.find("]", k)
+                    k = close + 1 if close != -1 else k
+                for _ in range(LITERAL_ARGUMENT_COMMANDS[name]):
+                    end = _group_end(body, k) if k < n and body[k] == "{" else None
+                    if end is None:
+                        break
+                    i = k = end
+                if i > j:
+                    continue
+            i = j
+            continue
+
+        if char == "%":
+            if i > 0 and body[i - 1].isdigit():
+                # "50%" is meant as a percent sign, not a comment
+                escape(i, "%")
+                i += 1
+                continue
+            newline = body.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+
+        if char == "{":
+            stack.append(("{", i))
+        elif char == "}":
+            index = next((k for k in range(len(stack) - 1, -1, -1) if stack[k][0] == "{"), None)
+            if index is None:
+                edits.append((i, 1, ""))
+                fixes.append(issue("stray_brace", "Removed unmatched '}'", i))
+            else:
+                close_above(index, i)
+                stack.pop()
+        elif char == "$":
+            delimiter = "$$" if body.startswith("$$", i) else "$"
+            if math is None:
+                math, math_start = delimiter, i
+            elif math == delimiter:
+                math = None
+            else:
+                errors.append(issue("unbalanced_math", f"'{delimiter}' does not close '{math}'", i))
+            i += len(delimiter)
+            continue
+        elif char in "&_#":
+            envs = [env for env, _ in stack if env != "{"]
+            if char == "&":
+                syntax = any(env in ALIGNMENT_ENVIRONMENTS for env in envs)
+            elif char == "_":
+                syntax = math is not None or any(env in MATH_ENVIRONMENTS for env in envs)
+            else:
+                # Macro parameter, e.g. #1
+                syntax = i + 1 < n and body[i + 1].isdigit()
+            unknown = next((env for env in reversed(envs) if env not in TEXT_ENVIRONMENTS), None)
+            if syntax or any(env in PICTURE_ENVIRONMENTS for env in envs):
+                pass
+            elif char == "_" and i + 1 < n and body[i + 1] in "{\\":
+                # x_{i} or x_\alpha: a subscript missing its $...$, not a literal underscore
+                errors.append(issue("ambiguous_char", "'_' outside math looks like a subscript", i))
+            elif unknown is not None:
+                errors.append(issue("ambiguous_char", f"Unescaped '{char}' inside \\begin{{{unknown}}}", i))
+            else:
+                escape(i, char)
+        i += 1
+
+    if math is not None:
+        errors.append(issue("unbalanced_math", f"Math opened with '{math}' is never closed", math_start))
+    if stack:
+        close_above(-1, n)
+
+    return {"edits": edits, "fixes": fixes, "errors": errors, "fragile": fragile}
+
+
+def _apply_edits(text: str, edits: List[tuple]) -> str:
+    """Apply (position, delete length, insertion) edits; insertions at one position keep their order"""
+    parts = []
+    last = 0
+    for pos, length, insert in sorted(edits, key=lambda edit: edit[0]):
+        parts.append(text[last:pos])
+        parts.append(insert)
+        last = max(last, pos + length)
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def lint_frame(frame: str) -> Dict[str, Any]:
+    """
+    Check a beamer frame and repair what can be repaired mechanically
+
+    Args:
+        frame: LaTeX source of one frame (\\begin{frame} ... \\end{frame})
+
+    Returns:
+        Dictionary with:
+            "frame": the repaired frame
+            "fixes": repairs applied, each {"code", "message", "line"}
+            "errors": problems left unrepaired; a frame with errors should be
+                regenerated
+    """
+    document = parse_beamer(frame)
+    frames = document["frames"]
+    if len(frames) != 1 or document["unclosed"]:
+        if document["unclosed"]:
+            message = "\\begin{frame} without a matching \\end{frame}"
+        elif not frames:
+            message = "No complete frame found"
+        else:
+            message = f"Expected one frame, found {len(frames)}"
+        return {"frame": frame, "fixes": [], "errors": [{"code": "not_a_frame", "message": message, "line": 1}]}
+
+    parsed = frames[0]
+    text = parsed["text"]
+    body_start = text.index("}") + 1
+    body = parsed["content"]
+    result = _lint_body(body)
+    fixes = result["fixes"]
+
+    header = text[:body_start]
+    if result["fragile"] and "fragile" not in parsed["options"]:
+        match = FRAME_BEGIN_PATTERN.match(text)
+        if match and match.group(2):
+            # Existing options: \begin{frame}[t] -> \begin{frame}[fragile,t]
+            edits = [(match.end() - body_start, 0, "fragile,")] + result["edits"]
+        elif match and match.group(1):
+            edits = [(match.end(1) - body_start, 0, "[fragile]")] + result["edits"]
+        else:
+            header += "[fragile]"
+            edits = result["edits"]
+        fixes = fixes + [{"code": "fragile", "message": "Added the [fragile] frame option", "line": 1}]
+    else:
+        edits = result["edits"]
+
+    repaired = header + _apply_edits(body, edits) + text[body_start + len(body):]
+    return {"frame": repaired, "fixes": fixes, "errors": result["errors"]}
+
+
+def format_issues(issues: List[Dict[str, Any]]) -> str:
+    """Render lint issues (or compile errors) as a bullet list, e.g. for a regeneration prompt"""
+    return "\n".join(
+        f"- Line {issue['line']}: {issue['message']}" if issue.get("line") else f"- {issue['message']}"
+        for issue in issues
+    )
+
+
+class LintStats:
+    """
+    Thread-safe counts of lint outcomes
+
+    lint_stats counts the frames of the whole process; collect() also counts
+    those of one run on a separate instance.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"frames": 0, "clean": 0, "repaired": 0, "regenerated": 0, "flagged": 0}
+        self.issues = {}
+        # Instances collecting the frames of the current context, see collect()
+        self._collectors = contextvars.ContextVar("lint_stats_collectors", default=())
+
+    def record(self, result: Dict[str, Any], regenerated: bool = False):
+        """
+        Record the final lint result of a frame
+
+        Args:
+            result: lint_frame() result
+            regenerated: Whether the frame was regenerated because of lint errors
+        """
+        if result["errors"]:
+            outcome = "flagged"
+        elif regenerated:
+            outcome = "regenerated"
+        elif result["fixes"]:
+            outcome = "repaired"
+        else:
+            outcome = "clean"
+        for stats in (self,) + self._collectors.get():
+            with stats.lock:
+                stats.counts["frames"] += 1
+                stats.counts[outcome] += 1
+                for issue in result["fixes"] + result["errors"]:
+                    stats.issues[issue["code"]] = stats.issues.get(issue["code"], 0) + 1
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Also count the frames linted inside the block on a new LintStats
+
+        Only frames of the current context are counted, including those on
+        worker threads whose tasks were submitted through
+        src.tracing.in_context, so concurrent runs each count only their own.
+
+        Yields:
+            The new LintStats
+        """
+        run = LintStats()
+        token = self._collectors.set(self._collectors.get() + (run,))
+        try:
+            yield run
+        finally:
+            self._collectors.reset(token)
+
+    def report(self) -> Dict[str, Any]:
+        """Lint outcome counts and issue codes"""
+        with self.lock:
+            return dict(self.counts, issues=dict(sorted(self.issues.items())))
+
+
+lint_stats = LintStats()
+
+
+def get_lint_stats() -> Dict[str, Any]:
+    """Lint outcome counts of this process"""
+    return lint_stats.report()
@@ -0,0 +1,45 @@
+"""
+Lazy Imports
+Heavy and optional dependencies are imported on first use rather than at
+module load.
+
+Importing the API server or starting a CLI then does not pay for chromadb,
+pdfplumber, PyPDF2, numpy or tiktoken (seconds of startup and a large
+share of a worker's idle memory) until a code path actually needs them.
+benchmarks/import_time.py checks that the entry points stay within their
+import-time budget.
+"""
+
+import importlib
+import threading
+from types import ModuleType
+from typing import Optional
+
+_modules = {}
+_lock = threading.Lock()
+
+
+def optional_import(name: str, warning: Optional[str] = None) -> Optional[ModuleType]:
+    """
+    Import an optional dependency the first time it is needed
+
+    Args:
+        name: Module name, e.g. "pdfplumber"
+        warning: Message printed (once) when the module is not installed
+
+    Returns:
+        The module, or None if it cannot be imported
+    """
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _modules:
+            try:
+                _modules[name] = importlib.import_module(name)
+            except ImportError:
+                _modules[name] = None
+                if warning:
+                    print(warning)
+        return _modules[name]
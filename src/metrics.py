@@ -0,0 +1,313 @@
+"""
+Metrics
+Process-wide counters, gauges and histograms in the Prometheus text format.
+
+The pipeline metrics (LLM requests, tokens, retries and latency, embeddings,
+LaTeX compilation, PDF extraction, pipeline steps) are derived from the
+spans of src.tracing: enable_metrics() registers a span listener, so the
+instrumented code paths need no metrics calls of their own. Rate limiter
+saturation is read when the metrics are rendered. Other components (the API
+server, caches) register their own metrics on the shared registry.
+
+Updating a metric takes one lock and a dictionary lookup per label set.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from src.rate_limit import get_rate_limiter
+from src.tracing import Span, add_span_listener
+
+# Latency buckets in seconds, from sub-second frames to multi-minute chapters
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# Buckets for counts (embedding batch sizes, pages)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# Span categories reported as pipeline step durations
+PIPELINE_CATEGORIES = {"deliberation", "chapter", "slide", "step", "wait"}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class of metrics with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}    # Label values -> metric state
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def replace(self, values: Dict[Tuple[str, ...], float]):
+        """Replace all label sets at once, e.g. with counts kept elsewhere and read at render time"""
+        with self.lock:
+            self.values = dict(values)
+
+    def _samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                    for key, value in sorted(self.values.items())]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _samples(self) -> List[str]:
+        with self.lock:
+            items = [(key, list(counts), total) for key, (counts, total) in sorted(self.values.items())]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics of the process and the collectors refreshing them at render time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+
+    def _get_or_create(self, cls, name: str, documentation: str, labels: Sequence[str], **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Register a function updating gauges right before the metrics are rendered"""
+        with self.lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format (version 0.0.4)
+
+        Returns:
+            Exposition text
+        """
+        with self.lock:
+            collectors = list(self.collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+llm_requests = registry.counter("llm_requests_total", "LLM chat requests by outcome", ["model", "step", "status"])
+llm_request_duration = registry.histogram(
+    "llm_request_duration_seconds", "LLM call latency including rate limiting and retries", ["model", "step"])
+llm_ttft = registry.histogram("llm_time_to_first_token_seconds", "Time to the first streamed token", ["model", "step"])
+llm_queue_wait = registry.histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for the rate limiter before their first attempt", ["model"])
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens by kind (prompt, completion, cached)",
+                              ["model", "step", "kind"])
+llm_retries = registry.counter("llm_retries_total", "Retried LLM attempts", ["model", "step"])
+llm_prompt_cache_hits = registry.counter(
+    "llm_prompt_cache_hits_total", "LLM requests with prompt tokens served from the provider cache", ["model", "step"])
+
+embedding_requests = registry.counter("embedding_requests_total", "Embedding requests by outcome", ["model", "status"])
+embedding_duration = registry.histogram("embedding_request_duration_seconds", "Embedding request latency", ["model"])
+embedding_batch_size = registry.histogram("embedding_batch_size", "Inputs per embedding request", ["model"],
+                                          buckets=SIZE_BUCKETS)
+
+compile_duration = registry.histogram("latex_compile_duration_seconds",
+                                      "LaTeX compilation time by stage (compile_file, recover, compile_frame)",
+                                      ["stage", "result"])
+pdf_extraction_duration = registry.histogram("pdf_extraction_duration_seconds", "PDF text extraction time")
+pdf_pages = registry.histogram("pdf_extraction_pages", "Pages per extracted PDF", buckets=SIZE_BUCKETS)
+
+pipeline_step_duration = registry.histogram(
+    "pipeline_step_duration_seconds", "Duration of deliberations, chapters, slides, steps and waits",
+    ["category", "name"])
+
+cache_lookups = registry.counter("cache_lookups_total", "Cache lookups by cache and result (hit, miss)",
+                                 ["cache", "result"])
+
+rate_limiter_in_flight = registry.gauge("rate_limiter_in_flight", "API requests in flight")
+rate_limiter_waiting = registry.gauge("rate_limiter_waiting", "API requests waiting for a concurrency slot")
+rate_limiter_limit = registry.gauge("rate_limiter_concurrency_limit", "Current adaptive concurrency limit")
+rate_limiter_events = registry.counter("rate_limiter_events_total",
+                                       "Rate limiter calls, retries, throttled and failed calls", ["event"])
+
+
+def observe_span(span: Span):
+    """Update the pipeline metrics from a finished span"""
+    attributes = span.attributes
+    status = "error" if "error" in attributes else "ok"
+    category = span.category
+
+    if category == "llm":
+        model = attributes.get("model", "")
+        step = attributes.get("step") or "unnamed"
+        llm_requests.inc(model=model, step=step, status=status)
+        llm_request_duration.observe(span.duration, model=model, step=step)
+        if "ttft" in attributes:
+            llm_ttft.observe(attributes["ttft"], model=model, step=step)
+        if "queue_wait" in attributes:
+            llm_queue_wait.observe(attributes["queue_wait"], model=model)
+        for kind in ("prompt", "completion", "cached"):
+            tokens = attributes.get(f"{kind}_tokens")
+            if tokens:
+                llm_tokens.inc(tokens, model=model, step=step, kind=kind)
+        if attributes.get("retries"):
+            llm_retries.inc(attributes["retries"], model=model, step=step)
+        if attributes.get("cache_hit"):
+            llm_prompt_cache_hits.inc(model=model, step=step)
+    elif category == "embedding":
+        model = attributes.get("model", "")
+        embedding_requests.inc(model=model, status=status)
+        embedding_duration.observe(span.duration, model=model)
+        embedding_batch_size.observe(attributes.get("inputs", 1), model=model)
+    elif category == "compile":
+        failed = status == "error" or attributes.get("compiled", attributes.get("compiles")) is False
+        result = "failed" if failed else "ok"
+        compile_duration.observe(span.duration, stage=span.name, result=result)
+    elif category == "pdf":
+        pdf_extraction_duration.observe(span.duration)
+        if "pages" in attributes:
+            pdf_pages.observe(attributes["pages"])
+    elif category in PIPELINE_CATEGORIES:
+        pipeline_step_duration.observe(span.duration, category=category, name=span.name)
+
+
+def _collect_rate_limiter():
+    limiter = get_rate_limiter()
+    concurrency = limiter.concurrency
+    rate_limiter_in_flight.set(concurrency.in_flight)
+    rate_limiter_waiting.set(concurrency.waiting)
+    rate_limiter_limit.set(int(concurrency.limit))
+    with limiter.stats_lock:
+        stats = dict(limiter.stats)
+    rate_limiter_events.replace({(event,): count for event, count in stats.items()})
+
+
+_enabled = False
+_enabled_lock = threading.Lock()
+
+
+def enable_metrics() -> MetricsRegistry:
+    """
+    Start deriving metrics from spans; safe to call more than once
+
+    Returns:
+        The shared registry
+    """
+    global _enabled
+    with _enabled_lock:
+        if not _enabled:
+            add_span_listener(observe_span)
+            registry.add_collector(_collect_rate_limiter)
+            _enabled = True
+    return registry
+
+
+def render_metrics() -> str:
+    """Metrics of this process in the Prometheus text format"""
+    return registry.render()
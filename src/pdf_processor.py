@@ -11,19 +11,17 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional, Set
 from datetime import datetime
 
-try:
-    import PyPDF2
-    PYPDF2_AVAILABLE = True
-except ImportError:
-    PYPDF2_AVAILABLE = False
-    print("Warning: PyPDF2 not available")
+from src.lazy import optional_import
+from src.tracing import span
 
-try:
-    import pdfplumber
-    PDFPLUMBER_AVAILABLE = True
-except ImportError:
-    PDFPLUMBER_AVAILABLE = False
-    print("Warning: pdfplumber not available")
+
+# PDF解析库在首次使用时才导入，以加快启动
+def _pypdf2():
+    return optional_import("PyPDF2", "Warning: PyPDF2 not available")
+
+
+def _pdfplumber():
+    return optional_import("pdfplumber", "Warning: pdfplumber not available")
 
 
 class PDFSlideProcessor:
@@ -167,7 +165,8 @@ class PDFSlideProcessor:
                     continue
                 
                 # 检查前几页的标题
-                if PDFPLUMBER_AVAILABLE:
+                pdfplumber = _pdfplumber()
+                if pdfplumber:
                     with pdfplumber.open(pdf_file) as pdf:
                         for page_num in range(min(3, len(pdf.pages))):
                             page = pdf.pages[page_num]
@@ -259,7 +258,9 @@ class PDFSlideProcessor:
         pdf_name = pdf_file.stem
         
         # 提取文本内容
-        text_content = self.extract_text(pdf_path)
+        with span("pdf_extract", "pdf", file=pdf_file.name) as extract_span:
+            text_content = self.extract_text(pdf_path)
+            extract_span.set(pages=len(text_content["pages"]))
         
         # 识别幻灯片结构
         slide_structure = self.identify_slide_structure(pdf_path, text_content)
@@ -337,8 +338,9 @@ class PDFSlideProcessor:
     def extract_text(self, pdf_path: str) -> Dict[str, Any]:
         """提取PDF中的文本内容"""
         text_by_page = []
+        pdfplumber = _pdfplumber()
         
-        if PDFPLUMBER_AVAILABLE:
+        if pdfplumber:
             try:
                 # 使用pdfplumber提取文本（更准确）
                 with pdfplumber.open(pdf_path) as pdf:
@@ -353,7 +355,8 @@ class PDFSlideProcessor:
             except Exception as e:
                 print(f"Warning: pdfplumber failed: {e}")
         
-        if not text_by_page and PYPDF2_AVAILABLE:
+        PyPDF2 = _pypdf2() if not text_by_page else None
+        if PyPDF2:
             # 备用方案：使用PyPDF2
             try:
                 with open(pdf_path, 'rb') as file:
@@ -429,7 +432,8 @@ class PDFSlideProcessor:
             "modification_date": None
         }
         
-        if PYPDF2_AVAILABLE:
+        PyPDF2 = _pypdf2()
+        if PyPDF2:
             try:
                 with open(pdf_path, 'rb') as file:
                     pdf_reader = PyPDF2.PdfReader(file)
@@ -0,0 +1,222 @@
+"""
+Prompt Assembly
+Shared prompt fragments and prefix-stable prompt layout.
+
+Providers cache the longest prefix a request shares with recent requests
+(OpenAI does so automatically for prompts of 1024 tokens and more), so only
+the text after the first difference is paid for and processed in full. A
+prompt is therefore laid out as static sections first (instructions, catalog,
+outline, user feedback) and per-call sections last, and the shared fragments
+are serialized once instead of on every call, so they are byte-identical
+across calls.
+
+PrefixStats measures, for every LLM call, how much of the prompt it shares
+with the previous call of the same step, i.e. the part a provider-side
+prefix cache can serve.
+"""
+
+import contextlib
+import contextvars
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from src.context import count_tokens
+
+# Shortest prefix OpenAI caches; shorter shared prefixes are not cacheable
+MIN_CACHED_PREFIX_TOKENS = 1024
+
+
+def render_fragment(value: Any) -> str:
+    """Serialize a prompt fragment: strings as they are, anything else as indented JSON"""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, indent=2)
+
+
+class PromptFragments:
+    """
+    Thread-safe store of serialized prompt fragments
+
+    Fragments (user feedback, slides outline, catalog entries) are rendered
+    once when they are set and reused by every prompt that embeds them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fragments = {}
+
+    def set(self, name: str, value: Any, render: Callable[[Any], str] = render_fragment) -> str:
+        """
+        Render and store a fragment, replacing any earlier value
+
+        Args:
+            name: Fragment name, e.g. "outline" or "feedback.slides"
+            value: Value to serialize
+            render: Serializer (render_fragment by default)
+
+        Returns:
+            The rendered fragment
+        """
+        text = render(value)
+        with self.lock:
+            self.fragments[name] = text
+        return text
+
+    def get(self, name: str, default: str = "") -> str:
+        with self.lock:
+            return self.fragments.get(name, default)
+
+    def __contains__(self, name: str) -> bool:
+        with self.lock:
+            return name in self.fragments
+
+
+def build_prompt(static: List[str], dynamic: List[str]) -> str:
+    """
+    Join prompt sections with the static ones first
+
+    Args:
+        static: Sections identical across the calls of a step (instructions,
+            shared fragments), most widely shared first
+        dynamic: Sections specific to this call
+
+    Returns:
+        Prompt text; empty sections are left out
+    """
+    return "\n\n".join(section for section in static + dynamic if section)
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """Length of the common prefix of two strings (binary search over slice comparisons)"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _messages_text(messages: List[Dict[str, str]]) -> str:
+    """Flatten chat messages in request order"""
+    return "".join(f"<{m['role']}>\n{m['content']}\n" for m in messages)
+
+
+class PrefixStats:
+    """
+    Thread-safe per-step statistics of prompt prefixes shared between calls
+
+    Each call is compared with the previous call of the same model and step;
+    the shared prefix is what a provider-side prompt cache can reuse.
+    prefix_stats covers the calls of the whole process; collect() also
+    covers those of one run on a separate instance, which compares each call
+    only with the previous call of that run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_prompt = {}   # (model, step) -> text of the previous request
+        self.steps = {}
+        # Instances collecting the calls of the current context, see collect()
+        self._collectors = contextvars.ContextVar("prefix_stats_collectors", default=())
+
+    def record(self, model_name: str, step: Optional[str], messages: List[Dict[str, str]],
+               cached_tokens: Optional[int] = None, prompt_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Record the prompt of one call
+
+        The prompt is not tokenized again when its token count is given; the
+        shared prefix is then counted in proportion to its share of the
+        characters.
+
+        Args:
+            model_name: Model the request was sent to
+            step: Pipeline step of the call
+            messages: Request messages
+            cached_tokens: Prompt tokens the provider reported as served from its
+                cache, if it reports them
+            prompt_tokens: Prompt tokens of the call, if already known
+
+        Returns:
+            Dictionary with "prefix_tokens" (tokens shared with the previous call
+            of the step, within the innermost collect() block if any) and
+            "prefix_ratio" (their share of the prompt)
+        """
+        step = step or "unnamed"
+        text = _messages_text(messages)
+        exact = prompt_tokens is None
+        if exact:
+            prompt_tokens = count_tokens(text, model_name)
+        for stats in (self,) + self._collectors.get():
+            result = stats._add(model_name, step, text, prompt_tokens, cached_tokens, exact)
+        return result
+
+    def _add(self, model_name: str, step: str, text: str, prompt_tokens: int,
+             cached_tokens: Optional[int], exact: bool) -> Dict[str, Any]:
+        with self.lock:
+            previous = self.last_prompt.get((model_name, step), "")
+            self.last_prompt[(model_name, step)] = text
+
+        prefix = _common_prefix_length(previous, text)
+        if exact:
+            prefix_tokens = count_tokens(text[:prefix], model_name) if prefix else 0
+        else:
+            prefix_tokens = round(prompt_tokens * prefix / len(text)) if text else 0
+        cacheable = prefix_tokens if prefix_tokens >= MIN_CACHED_PREFIX_TOKENS else 0
+
+        with self.lock:
+            counts = self.steps.setdefault(step, {
+                "calls": 0, "prompt_tokens": 0, "prefix_tokens": 0, "cacheable_tokens": 0, "cached_tokens": 0
+            })
+            counts["calls"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["prefix_tokens"] += prefix_tokens
+            counts["cacheable_tokens"] += cacheable
+            counts["cached_tokens"] += cached_tokens or 0
+
+        return {
+            "prefix_tokens": prefix_tokens,
+            "prefix_ratio": prefix_tokens / prompt_tokens if prompt_tokens else 0.0
+        }
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Also record the calls made inside the block on a new PrefixStats
+
+        Only calls of the current context are recorded, including those on
+        worker threads whose tasks were submitted through
+        src.tracing.in_context, so concurrent runs each see only their own.
+
+        Yields:
+            The new PrefixStats
+        """
+        run = PrefixStats()
+        token = self._collectors.set(self._collectors.get() + (run,))
+        try:
+            yield run
+        finally:
+            self._collectors.reset(token)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Counts and prefix ratios per step"""
+        with self.lock:
+            report = {}
+            for step, counts in sorted(self.steps.items()):
+                total = counts["prompt_tokens"]
+                report[step] = dict(
+                    counts,
+                    prefix_ratio=counts["prefix_tokens"] / total if total else 0.0,
+                    cacheable_ratio=counts["cacheable_tokens"] / total if total else 0.0
+                )
+            return report
+
+
+prefix_stats = PrefixStats()
+
+
+def get_prefix_stats() -> Dict[str, Dict[str, Any]]:
+    """Shared-prefix statistics of this process, per step"""
+    return prefix_stats.report()
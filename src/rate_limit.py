@@ -0,0 +1,289 @@
+"""
+Rate Limiting
+Process-wide pacing, retries and adaptive concurrency for OpenAI API calls.
+
+All chat and embedding calls share one RateLimiter, so the process as a whole
+stays under the account's requests-per-minute and tokens-per-minute limits no
+matter how many threads issue calls. Configuration comes from environment
+variables:
+
+    OPENAI_RPM               Requests per minute (default 500)
+    OPENAI_TPM               Tokens per minute (default 200000)
+    OPENAI_MAX_CONCURRENCY   Upper bound for in-flight requests (default 16)
+    OPENAI_MIN_CONCURRENCY   Lower bound for in-flight requests (default 1)
+    OPENAI_MAX_RETRIES       Retries for throttled or transient failures (default 6)
+"""
+
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from src.lazy import optional_import
+
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+
+@lru_cache(maxsize=1)
+def _api_errors() -> tuple:
+    """
+    Error types of the openai package, resolved on the first failed call
+
+    Returns:
+        Tuple of (retryable errors, throttling errors)
+    """
+    openai = optional_import("openai")
+    if openai is None:
+        return (), ()
+    retryable = tuple(
+        getattr(openai, name) for name in
+        ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError")
+        if hasattr(openai, name)
+    )
+    throttle = tuple(getattr(openai, name) for name in ("RateLimitError",) if hasattr(openai, name))
+    return retryable, throttle
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    The bucket refills continuously at `capacity` per minute. Consumption may
+    drive the level negative (e.g. when the actual token usage of a call turns
+    out higher than reserved); later callers then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """Block until `amount` can be taken from the bucket, then take it"""
+        # A single request larger than the bucket could never be admitted
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait_time = (amount - self.level) / self.rate
+            time.sleep(min(wait_time, 1.0))
+
+    def adjust(self, amount: float):
+        """Take (positive) or return (negative) tokens without blocking"""
+        with self.lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+    def pause(self, seconds: float):
+        """Drain the bucket so that nothing is admitted for roughly `seconds`"""
+        with self.lock:
+            self._refill()
+            self.level = min(self.level, 1.0 - seconds * self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the number of in-flight requests
+
+    Every successful call raises the limit by 1/limit (about +1 per round of
+    calls); a throttled call halves it. Decreases are applied at most once per
+    `cooldown` seconds so a burst of 429s from the same overload halves the
+    limit only once.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, cooldown: float = 2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.waiting = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            self.waiting += 1
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self.last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+                    print(f"[Rate limit] Throttled, concurrency limit reduced to {int(self.limit)}")
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+
+class RateLimiter:
+    """
+    Shared pacing and retry policy for API calls
+
+    A call first waits for a request token, its estimated tokens and a
+    concurrency slot. Throttled and transient failures are retried with
+    full-jitter exponential backoff, or after the server's Retry-After delay
+    when one is given.
+    """
+
+    def __init__(self,
+                 requests_per_minute: int = 500,
+                 tokens_per_minute: int = 200000,
+                 max_concurrency: int = 16,
+                 min_concurrency: int = 1,
+                 max_retries: int = 6):
+        """
+        Initialize RateLimiter
+
+        Args:
+            requests_per_minute: Request budget per minute
+            tokens_per_minute: Token budget per minute
+            max_concurrency: Upper bound for in-flight requests
+            min_concurrency: Lower bound the adaptive limit never drops below
+            max_retries: Number of retries for retryable failures
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+
+        self.stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+    def _count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def call(self,
+             fn: Callable[[], Any],
+             estimated_tokens: int = 0,
+             tokens_used: Optional[Callable[[Any], int]] = None,
+             description: str = "API call") -> Any:
+        """
+        Run an API call under the shared limits
+
+        Args:
+            fn: Function performing the call
+            estimated_tokens: Tokens reserved from the token budget up front
+            tokens_used: Optional function returning the actual tokens used
+                by a result, used to settle the reservation
+            description: Name of the call for log messages
+
+        Returns:
+            The result of fn
+
+        Raises:
+            The last exception raised by fn once retries are exhausted or
+            immediately for non-retryable errors
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            self.requests.acquire(1)
+            self.tokens.acquire(estimated_tokens)
+            self.concurrency.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable_errors, throttle_errors = _api_errors()
+                if not isinstance(e, retryable_errors):
+                    self.concurrency.release()
+                    self._count("failed")
+                    raise
+                throttled = isinstance(e, throttle_errors)
+                self.concurrency.release(throttled=throttled)
+                # The reservation was not used
+                self.tokens.adjust(-estimated_tokens)
+
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+
+                retry_after = _retry_after(e)
+                delay = retry_after if retry_after is not None else _backoff(attempt)
+                if throttled:
+                    self._count("throttled")
+                    if retry_after is not None:
+                        self.requests.pause(retry_after)
+                self._count("retries")
+                attempt += 1
+                print(f"[Rate limit] {description} failed ({type(e).__name__}), "
+                      f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.concurrency.release()
+            if tokens_used is not None:
+                try:
+                    self.tokens.adjust(tokens_used(result) - estimated_tokens)
+                except Exception:
+                    pass
+            return result
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the server's requested delay from an API error, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return min(MAX_DELAY, float(value) / 1000.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is not None:
+        try:
+            return min(MAX_DELAY, float(value))
+        except ValueError:
+            pass
+    return None
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter, configured from the environment"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(
+                    requests_per_minute=int(os.environ.get("OPENAI_RPM", 500)),
+                    tokens_per_minute=int(os.environ.get("OPENAI_TPM", 200000)),
+                    max_concurrency=int(os.environ.get("OPENAI_MAX_CONCURRENCY", 16)),
+                    min_concurrency=int(os.environ.get("OPENAI_MIN_CONCURRENCY", 1)),
+                    max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", 6))
+                )
+    return _rate_limiter
@@ -0,0 +1,264 @@
+"""
+Model Router
+Routes each pipeline step to a model tier, so that high-volume mechanical
+steps can run on a fast model while creative steps keep a stronger one.
+
+Routing configuration (JSON), all keys optional:
+
+    {
+        "tiers": {
+            "fast":     {"model": "gpt-4.1-nano", "max_concurrency": 16},
+            "standard": {"model": "gpt-4o", "max_concurrency": 4,
+                         "input_cost_per_1m": 2.5, "output_cost_per_1m": 10.0}
+        },
+        "routes": {"draft": "standard", "latex": "fast"}
+    }
+
+Tiers that are not configured use the default model. Steps without a route
+use the "standard" tier.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from src.agents import LLM
+
+# USD per 1M tokens (input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "o3-mini": (1.10, 4.40),
+    "o4-mini": (1.10, 4.40),
+}
+
+DEFAULT_TIER = "standard"
+
+
+def _empty_usage() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+# Pipeline steps and the tier they use unless configured otherwise
+DEFAULT_ROUTES = {
+    # Foundation deliberations
+    "deliberation": "standard",
+    "deliberation_summary": "standard",
+    # Mechanical extraction and formatting
+    "syllabus_processing": "fast",
+    "outline": "fast",
+    "latex_template": "fast",
+    "script_template": "fast",
+    "assessment_template": "fast",
+    "latex": "fast",
+    # Long-form content
+    "draft": "standard",
+    "script": "standard",
+    "assessment": "standard",
+    "enhancement": "standard",
+    "analysis": "standard",
+    # Evaluation
+    "evaluation_scoring": "fast",
+    "evaluation_validation": "standard",
+}
+
+
+class ModelRouter:
+    """
+    LLM-compatible client that dispatches each call to the tier of its step
+
+    ModelRouter can be passed anywhere an LLM is expected. Calls pass their
+    step name through Agent.generate_response(step=...); each tier has its own
+    LLM client and concurrency limit, and token usage and cost are accounted
+    per tier and per step.
+    """
+
+    def __init__(self,
+                 model_name: str = "gpt-4o-mini",
+                 tiers: Optional[Dict[str, Dict[str, Any]]] = None,
+                 routes: Optional[Dict[str, str]] = None):
+        """
+        Initialize ModelRouter
+
+        Args:
+            model_name: Default model for tiers without a configured model
+            tiers: Tier name -> {"model", "max_concurrency", "input_cost_per_1m", "output_cost_per_1m"}
+            routes: Step name -> tier name, merged over DEFAULT_ROUTES
+        """
+        self.model_name = model_name
+        self.routes = dict(DEFAULT_ROUTES)
+        self.routes.update(routes or {})
+
+        tier_configs = {tier: {} for tier in set(self.routes.values()) | {DEFAULT_TIER}}
+        for tier, config in (tiers or {}).items():
+            tier_configs[tier] = dict(config)
+
+        # Tiers sharing a model share one client
+        clients = {}
+        self.tiers = {}
+        for tier, config in tier_configs.items():
+            model = config.get("model", model_name)
+            if model not in clients:
+                clients[model] = LLM(model_name=model)
+            default_prices = MODEL_PRICES.get(model, (0.0, 0.0))
+            max_concurrency = config.get("max_concurrency")
+            self.tiers[tier] = {
+                "model": model,
+                "llm": clients[model],
+                "semaphore": threading.BoundedSemaphore(max_concurrency) if max_concurrency else None,
+                "input_cost_per_1m": config.get("input_cost_per_1m", default_prices[0]),
+                "output_cost_per_1m": config.get("output_cost_per_1m", default_prices[1]),
+            }
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._usage = defaultdict(_empty_usage)
+        # Usage of the collect() blocks of the current context
+        self._collectors = contextvars.ContextVar("router_usage_collectors", default=())
+
+    @classmethod
+    def from_config(cls, model_name: str, config: Union[str, Dict[str, Any], None] = None) -> "ModelRouter":
+        """
+        Create a router from a config dictionary, JSON string or JSON file path
+
+        Args:
+            model_name: Default model
+            config: Routing configuration (see module docstring)
+
+        Returns:
+            ModelRouter instance
+        """
+        if isinstance(config, str):
+            if os.path.exists(config):
+                with open(config, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            else:
+                config = json.loads(config)
+        config = config or {}
+        return cls(model_name=model_name, tiers=config.get("tiers"), routes=config.get("routes"))
+
+    def tier_for(self, step: Optional[str]) -> str:
+        """Get the tier a step is routed to"""
+        tier = self.routes.get(step, DEFAULT_TIER)
+        return tier if tier in self.tiers else DEFAULT_TIER
+
+    def model_for(self, step: Optional[str]) -> str:
+        """Get the model a step is routed to"""
+        return self.tiers[self.tier_for(step)]["model"]
+
+    @property
+    def last_call_stats(self) -> Optional[Dict[str, Any]]:
+        """Statistics of the most recent call made by the current thread"""
+        return getattr(self._local, "stats", None)
+
+    def generate_response(self, messages: List[Dict[str, str]], stream: bool = True, step: str = None,
+                          json_mode: bool = False, listener: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Generate a response with the model of the step's tier
+
+        Args:
+            messages: List of messages with role and content
+            stream: Whether to stream the response
+            step: Pipeline step name used for routing
+            json_mode: Request a JSON object response where the model supports it
+            listener: Optional callback receiving this call's streamed output
+
+        Returns:
+            Tuple of (response text, elapsed time, total tokens)
+        """
+        tier_name = self.tier_for(step)
+        tier = self.tiers[tier_name]
+
+        semaphore = tier["semaphore"]
+        if semaphore:
+            semaphore.acquire()
+        try:
+            response, elapsed_time, token_usage = tier["llm"].generate_response(
+                messages, stream, step=step, json_mode=json_mode, listener=listener
+            )
+        finally:
+            if semaphore:
+                semaphore.release()
+
+        stats = dict(tier["llm"].last_call_stats or {})
+        cost = (stats.get("prompt_tokens", 0) * tier["input_cost_per_1m"]
+                + stats.get("completion_tokens", 0) * tier["output_cost_per_1m"]) / 1_000_000
+        stats.update({"tier": tier_name, "cost": cost})
+        self._local.stats = stats
+        self._add_usage(tier_name, step, stats.get("prompt_tokens", 0), stats.get("completion_tokens", 0), cost)
+
+        return response, elapsed_time, token_usage
+
+    def record_usage(self, step: Optional[str], prompt_tokens: int, completion_tokens: int, price_factor: float = 1.0):
+        """
+        Account usage of a call made outside generate_response (e.g. a batch request)
+
+        Args:
+            step: Pipeline step of the call
+            prompt_tokens: Prompt tokens used
+            completion_tokens: Completion tokens used
+            price_factor: Multiplier on the tier's prices (0.5 for batch requests)
+        """
+        tier_name = self.tier_for(step)
+        tier = self.tiers[tier_name]
+        cost = (prompt_tokens * tier["input_cost_per_1m"]
+                + completion_tokens * tier["output_cost_per_1m"]) / 1_000_000 * price_factor
+        self._add_usage(tier_name, step, prompt_tokens, completion_tokens, cost)
+
+    def _add_usage(self, tier_name: str, step: Optional[str], prompt_tokens: int, completion_tokens: int, cost: float):
+        with self._lock:
+            for accounted in (self._usage,) + self._collectors.get():
+                for key in (("tier", tier_name), ("step", step or "unspecified")):
+                    usage = accounted[key]
+                    usage["calls"] += 1
+                    usage["prompt_tokens"] += prompt_tokens
+                    usage["completion_tokens"] += completion_tokens
+                    usage["cost"] += cost
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Also account the calls made inside the block separately
+
+        Only calls of the current context are accounted, including those on
+        worker threads whose tasks were submitted through
+        src.tracing.in_context, so runs sharing the router (e.g. evaluations
+        on a shared engine) each get their own usage.
+
+        Yields:
+            The usage of the block, to pass to cost_report()
+        """
+        usage = defaultdict(_empty_usage)
+        token = self._collectors.set(self._collectors.get() + (usage,))
+        try:
+            yield usage
+        finally:
+            self._collectors.reset(token)
+
+    def cost_report(self, usage: Optional[Dict[tuple, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Summarize token usage and cost per tier and per step
+
+        Args:
+            usage: Usage yielded by collect(); default: all calls of the router
+
+        Returns:
+            Dictionary with "tiers", "steps" and "total_cost"
+        """
+        usage_by_key = self._usage if usage is None else usage
+        with self._lock:
+            tiers = {name: dict(usage, model=self.tiers[name]["model"])
+                     for (kind, name), usage in usage_by_key.items() if kind == "tier"}
+            steps = {name: dict(usage, tier=self.tier_for(name), model=self.model_for(name))
+                     for (kind, name), usage in usage_by_key.items() if kind == "step"}
+        return {
+            "tiers": tiers,
+            "steps": steps,
+            "total_cost": sum(usage["cost"] for usage in tiers.values())
+        }
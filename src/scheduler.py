@@ -0,0 +1,219 @@
+"""
+Deliberation Scheduler
+Runs deliberations as a dependency graph built from their declared inputs,
+so that deliberations which do not depend on each other run concurrently.
+
+ChapterScheduler runs per-chapter work as chapters become known, so chapter
+generation can start while the chapter list is still being produced.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Callable, Optional
+
+from src.tracing import in_context
+
+
+class DeliberationScheduler:
+    """
+    DAG scheduler for deliberations
+
+    Every deliberation depends on the deliberations named in its `inputs`.
+    A deliberation without declared inputs (inputs=None) depends on all
+    deliberations listed before it, which reproduces sequential execution.
+    Input keys that are not deliberation IDs (e.g. the course name) must be
+    present in the initial results.
+    """
+
+    def __init__(self, deliberations: List[Any], results: Dict[str, str], max_workers: int = 4):
+        """
+        Initialize DeliberationScheduler
+
+        Args:
+            deliberations: Deliberations in their canonical (list) order
+            results: Results already available, keyed by ID. Completed
+                deliberation results are added to this dictionary.
+            max_workers: Maximum number of deliberations running at once
+        """
+        self.deliberations = deliberations
+        self.results = results
+        self.max_workers = max_workers
+
+        ids = [d.id for d in deliberations]
+        self.dependencies = {}
+        for idx, deliberation in enumerate(deliberations):
+            if deliberation.inputs is None:
+                self.dependencies[deliberation.id] = ids[:idx]
+                continue
+            deps = []
+            for key in deliberation.inputs:
+                if key in ids:
+                    deps.append(key)
+                elif key not in results:
+                    raise ValueError(f"Deliberation '{deliberation.id}' declares unknown input '{key}'")
+            self.dependencies[deliberation.id] = deps
+
+        self.levels = self._compute_levels()
+
+    def _compute_levels(self) -> List[List[str]]:
+        """Group deliberation IDs into levels that can run concurrently"""
+        levels = []
+        placed = set()
+        pending = [d.id for d in self.deliberations]
+
+        while pending:
+            level = [i for i in pending if all(dep in placed for dep in self.dependencies[i])]
+            if not level:
+                raise ValueError(f"Circular dependency between deliberations: {', '.join(pending)}")
+            levels.append(level)
+            placed.update(level)
+            pending = [i for i in pending if i not in placed]
+
+        return levels
+
+    def upstream_results(self, deliberation) -> Dict[str, str]:
+        """Get the available results a deliberation reads, in canonical order"""
+        wanted = set(self.dependencies[deliberation.id])
+        if deliberation.inputs is not None:
+            wanted.update(deliberation.inputs)
+        else:
+            wanted.update(key for key in self.results if key not in self.dependencies)
+        return {key: value for key, value in self.results.items() if key in wanted}
+
+    def run(self,
+            run_fn: Callable[[Any, Dict[str, str]], tuple],
+            on_complete: Optional[Callable[[Any, tuple], None]] = None) -> Dict[str, tuple]:
+        """
+        Run all deliberations, each as soon as its dependencies have finished
+
+        Args:
+            run_fn: Called in a worker thread with (deliberation, upstream results);
+                must return a tuple whose first element is the result text
+            on_complete: Called in the calling thread with (deliberation, output)
+                as each deliberation finishes
+
+        Returns:
+            Dictionary of deliberation ID -> run_fn output
+        """
+        print("Deliberation schedule: " + " -> ".join(
+            "[" + ", ".join(level) + "]" for level in self.levels
+        ))
+
+        by_id = {d.id: d for d in self.deliberations}
+        order = {d.id: idx for idx, d in enumerate(self.deliberations)}
+        outputs = {}
+        done = set()
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(done) < len(self.deliberations):
+                # Submit every deliberation whose dependencies are satisfied,
+                # snapshotting its inputs in this thread
+                for deliberation in self.deliberations:
+                    if deliberation.id in done or deliberation.id in running.values():
+                        continue
+                    if all(dep in done for dep in self.dependencies[deliberation.id]):
+                        upstream = self.upstream_results(deliberation)
+                        running[executor.submit(in_context(run_fn), deliberation, upstream)] = deliberation.id
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                # Handle completions in canonical order for reproducible logs
+                for future in sorted(finished, key=lambda f: order[running[f]]):
+                    deliberation = by_id[running.pop(future)]
+                    output = future.result()
+                    self.results[deliberation.id] = output[0]
+                    outputs[deliberation.id] = output
+                    done.add(deliberation.id)
+                    if on_complete:
+                        on_complete(deliberation, output)
+
+        return outputs
+
+
+class ChapterScheduler:
+    """
+    Runs chapter generation as chapters arrive
+
+    Chapters are added one at a time (e.g. as the syllabus processor streams
+    the chapter list). They are held until the scheduler is opened, i.e. until
+    the foundation results chapters read are available, and then run
+    concurrently.
+    """
+
+    def __init__(self, run_fn: Callable[[int, Dict[str, str]], Any], max_workers: int = 4):
+        """
+        Initialize ChapterScheduler
+
+        Args:
+            run_fn: Called in a worker thread with (chapter index, chapter)
+            max_workers: Maximum number of chapters generated at once
+        """
+        self.run_fn = run_fn
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.opened = False
+        self.cancelled = False
+        self.pending = []   # (index, chapter) added before the scheduler opened
+        self.futures = {}   # Chapter index -> future
+
+    def add(self, chapter_idx: int, chapter: Dict[str, str]):
+        """Schedule a chapter; chapters added twice run once"""
+        with self.lock:
+            if self.cancelled or chapter_idx in self.futures or any(idx == chapter_idx for idx, _ in self.pending):
+                return
+            if self.opened:
+                self.futures[chapter_idx] = self._submit(chapter_idx, chapter)
+            else:
+                self.pending.append((chapter_idx, chapter))
+
+    def _submit(self, chapter_idx: int, chapter: Dict[str, str]):
+        """Start a chapter in a span of the calling context"""
+        task = in_context(self.run_fn, "chapter", "chapter", index=chapter_idx + 1, title=chapter.get("title"))
+        return self.executor.submit(task, chapter_idx, chapter)
+
+    def open(self):
+        """Start the chapters added so far and run later chapters as they are added"""
+        with self.lock:
+            if self.opened or self.cancelled:
+                return
+            self.opened = True
+            for chapter_idx, chapter in self.pending:
+                self.futures[chapter_idx] = self._submit(chapter_idx, chapter)
+            self.pending = []
+
+    def cancel(self):
+        """
+        Drop the chapters that have not started and ignore chapters added later
+
+        Chapters already running finish in the background; their results are
+        not collected.
+        """
+        with self.lock:
+            self.cancelled = True
+            self.pending = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def wait(self) -> Dict[int, Any]:
+        """
+        Wait for all scheduled chapters
+
+        Returns:
+            Dictionary of chapter index -> run_fn output
+
+        Raises:
+            The error of the first failed chapter, after all chapters finished
+        """
+        self.open()
+        self.executor.shutdown(wait=True)
+
+        outputs = {}
+        errors = []
+        for chapter_idx in sorted(self.futures):
+            try:
+                outputs[chapter_idx] = self.futures[chapter_idx].result()
+            except Exception as e:
+                print(f"Chapter {chapter_idx + 1} failed: {e}")
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return outputs
@@ -75,7 +75,8 @@ Format your response clearly with sections and bullet points.
         analysis_response, _, _ = self.content_analyst.generate_response(
             analysis_prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="analysis"
         )
         
         return {
@@ -132,7 +133,8 @@ Format your response clearly with sections and bullet points.
         recommendations, _, _ = self.improvement_advisor.generate_response(
             recommendation_prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="analysis"
         )
         
         return {
@@ -11,6 +11,7 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 from src.agents import Agent, LLM
+from src.kb_registry import get_kb_registry
 from src.slide_knowledge_base import SlideKnowledgeBase
 from src.slides import SlideUtils  # 复用slides.py中的工具函数
 
@@ -76,12 +77,12 @@ class SlideEnhancer:
             }
         print(f"\n{'='*60}\nStarting Slide Enhancement and LaTeX Generation\n{'='*60}\n")
         
-        # 加载知识库获取原始内容
+        # 加载知识库获取原始内容（已加载的知识库从注册表复用）
         if kb_dir:
             print(f"DEBUG: Loading knowledge base from exp directory: {kb_dir}")
-            kb = SlideKnowledgeBase(knowledge_base_name, kb_dir=kb_dir)
+            kb = get_kb_registry().get(knowledge_base_name, kb_dir=kb_dir)
         else:
-            kb = SlideKnowledgeBase(knowledge_base_name)
+            kb = get_kb_registry().get(knowledge_base_name)
         summary = kb.get_all_content_summary()
         
         # 获取所有原始幻灯片内容
@@ -276,7 +277,8 @@ Format your response as:
         enhanced_response, _, _ = self.content_enhancer.generate_response(
             enhancement_prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="enhancement"
         )
         
         # 解析响应
@@ -326,6 +328,16 @@ Format your response as:
         
         return title, content
     
+    def _regenerate_frame(self, prompt: str) -> str:
+        """让LaTeX Generator修复无法机械修复的frame"""
+        response, _, _ = self.latex_generator.generate_response(
+            prompt,
+            stream=True,
+            save_to_history=False,
+            step="latex"
+        )
+        return response
+    
     def _generate_latex_frames(
         self,
         enhanced_content: Dict[str, Any],
@@ -357,11 +369,16 @@ Format your response as:
         latex_response, _, _ = self.latex_generator.generate_response(
             generation_prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="latex"
         )
         
-        # 使用工具函数提取frames
-        frames = SlideUtils.extract_latex_frames(latex_response)
+        # 使用工具函数提取frames，本地检查修复后仅对无法修复的frame重新生成
+        frames = [
+            result["frame"] for result in SlideUtils.repair_latex_frames(
+                SlideUtils.extract_latex_frames(latex_response), self._regenerate_frame
+            )
+        ]
         
         if not frames:
             # 如果没有找到frame，创建一个简单的fallback
@@ -369,6 +386,7 @@ Format your response as:
     \\frametitle{{{title}}}
     {content[:500]}
 \\end{{frame}}"""]
+            frames = [SlideUtils.repair_latex_frames(frames)[0]["frame"]]
         
         return frames
     
@@ -6,52 +6,83 @@ Slide Knowledge Base
 import os
 import json
 import pickle
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-import numpy as np
 
-# 可以选择使用chromadb或简单的embedding存储
-try:
-    import chromadb
-    CHROMADB_AVAILABLE = True
-except ImportError:
-    CHROMADB_AVAILABLE = False
-    print("Warning: chromadb not available, using simple storage")
+from src.context import count_tokens
+from src.lazy import optional_import
+from src.rate_limit import get_rate_limiter
+from src.tracing import span
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    print("Warning: OpenAI not available")
+
+# 可以选择使用chromadb或简单的embedding存储；chromadb、openai和numpy在首次使用时才导入
+def _chromadb():
+    return optional_import("chromadb", "Warning: chromadb not available, using simple storage")
+
+
+def _openai():
+    return optional_import("openai", "Warning: OpenAI not available")
+
+
+EMBEDDING_MODEL = "text-embedding-3-small"  # 或 "text-embedding-ada-002"
+
+
+@lru_cache(maxsize=16)
+def _embedding_client(api_key: str):
+    # 重试由全局限流器处理
+    return _openai().OpenAI(api_key=api_key, max_retries=0)
+
+
+def get_embedding_client(api_key: Optional[str] = None):
+    """
+    获取生成embedding的OpenAI客户端（按API key复用）
+    
+    Args:
+        api_key: 调用方的API key，默认为调用时的OPENAI_API_KEY
+        
+    Returns:
+        OpenAI客户端，没有openai或API key时返回None
+    """
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    if not api_key or not _openai():
+        return None
+    return _embedding_client(api_key)
 
 
 class SlideKnowledgeBase:
-    """幻灯片知识库，存储和检索PDF内容"""
+    """
+    幻灯片知识库，存储和检索PDF内容
+    
+    实例只保存与API key无关的状态（chromadb集合、chunks、embedding索引），
+    可以由src.kb_registry在请求之间共享；embedding客户端按调用方的API key在每次调用时获取。
+    """
     
-    def __init__(self, knowledge_base_name: str, kb_dir: str = "knowledge_base"):
+    def __init__(self, knowledge_base_name: str, kb_dir: str = "knowledge_base", chroma_client=None):
+        """
+        Args:
+            knowledge_base_name: 知识库名称
+            kb_dir: 知识库根目录
+            chroma_client: 已打开的chromadb客户端（可选，由src.kb_registry按路径复用）
+        """
         self.kb_name = knowledge_base_name
         self.kb_dir = Path(kb_dir) / knowledge_base_name
         self.kb_dir.mkdir(parents=True, exist_ok=True)
         
-        if OPENAI_AVAILABLE:
-            self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-            self.embedding_model = "text-embedding-3-small"  # 或 "text-embedding-ada-002"
-        else:
-            self.client = None
-            self.embedding_model = None
+        self.embedding_model = EMBEDDING_MODEL
         
         # 初始化向量数据库
-        if CHROMADB_AVAILABLE:
-            self._init_chromadb()
+        if _chromadb():
+            self._init_chromadb(chroma_client)
         else:
             self._init_simple_storage()
     
-    def _init_chromadb(self):
+    def _init_chromadb(self, chroma_client=None):
         """初始化ChromaDB向量数据库"""
-        chroma_dir = self.kb_dir / "chroma_db"
-        self.chroma_client = chromadb.PersistentClient(path=str(chroma_dir))
+        if chroma_client is None:
+            chroma_client = _chromadb().PersistentClient(path=str(self.kb_dir / "chroma_db"))
+        self.chroma_client = chroma_client
         self.collection = self.chroma_client.get_or_create_collection(
             name=self.kb_name,
             metadata={"description": "Slide deck knowledge base"}
@@ -65,6 +96,7 @@ class SlideKnowledgeBase:
         self.embeddings = {}
         self.chunks = []
         self.use_chromadb = False
+        self._index = None  # (chunk ids, 归一化的embedding矩阵)，首次搜索时构建
         
         # 加载已有数据
         if self.data_file.exists():
@@ -77,7 +109,8 @@ class SlideKnowledgeBase:
     def create_from_extracted_data(
         self, 
         extracted_data: Dict[str, Any],
-        chapter_filter: Optional[str] = None
+        chapter_filter: Optional[str] = None,
+        api_key: Optional[str] = None
     ):
         """
         从按需提取的数据创建知识库
@@ -85,6 +118,7 @@ class SlideKnowledgeBase:
         Args:
             extracted_data: PDF处理器返回的提取数据
             chapter_filter: 章节过滤器（用于标记）
+            api_key: 生成embedding使用的API key（可选，默认为OPENAI_API_KEY）
         """
         print(f"Creating knowledge base from {extracted_data['total_extracted_files']} extracted files...")
         
@@ -124,13 +158,14 @@ class SlideKnowledgeBase:
         
         # 生成embeddings并存储
         print(f"Generating embeddings for {len(chunks)} chunks...")
+        client = get_embedding_client(api_key)
         for i, chunk in enumerate(chunks):
             if (i + 1) % 10 == 0:
                 print(f"  Progress: {i + 1}/{len(chunks)}")
             
             # 生成embedding
             text_to_embed = f"{chunk['title']}\n{chunk['content']}"
-            embedding = self._generate_embedding(text_to_embed)
+            embedding = self._generate_embedding(text_to_embed, client)
             
             if embedding is None:
                 continue
@@ -149,6 +184,7 @@ class SlideKnowledgeBase:
             else:
                 self.embeddings[chunk["id"]] = embedding
                 self.chunks.append(chunk)
+                self._index = None
         
         # 保存数据
         if not self.use_chromadb:
@@ -180,40 +216,50 @@ class SlideKnowledgeBase:
         print(f"✓ Knowledge base created with {len(chunks)} chunks")
         return metadata
     
-    def _generate_embedding(self, text: str) -> Optional[List[float]]:
-        """生成文本的embedding"""
-        if not self.client or not self.embedding_model:
+    def _generate_embedding(self, text: str, client) -> Optional[List[float]]:
+        """用给定的客户端生成文本的embedding"""
+        if not client:
             # 如果没有OpenAI客户端，返回None或使用简单的方法
             print("Warning: OpenAI client not available, skipping embedding generation")
             return None
         
         try:
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=text[:8000]  # 限制长度
-            )
+            text = text[:8000]  # 限制长度
+            estimated_tokens = count_tokens(text)
+            with span("embedding", "embedding", model=self.embedding_model, inputs=1, tokens=estimated_tokens):
+                response = get_rate_limiter().call(
+                    lambda: client.embeddings.create(
+                        model=self.embedding_model,
+                        input=text
+                    ),
+                    estimated_tokens=estimated_tokens,
+                    tokens_used=lambda r: r.usage.total_tokens if getattr(r, "usage", None) else estimated_tokens,
+                    description=f"{self.embedding_model} embedding"
+                )
             return response.data[0].embedding
         except Exception as e:
             print(f"Error generating embedding: {e}")
             return None
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def search(self, query: str, top_k: int = 5, api_key: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         语义搜索相关内容
         
         Args:
             query: 搜索查询
             top_k: 返回前k个结果
+            api_key: 生成查询embedding使用的API key（可选，默认为OPENAI_API_KEY）
             
         Returns:
             相关内容的列表
         """
-        if not self.client:
-            # 如果没有embedding能力，返回空列表或使用关键词搜索
+        client = get_embedding_client(api_key)
+        if not client:
+            # 如果没有embedding能力，使用关键词搜索
             return self._keyword_search(query, top_k)
         
         # 生成查询的embedding
-        query_embedding = self._generate_embedding(query)
+        query_embedding = self._generate_embedding(query, client)
         
         if query_embedding is None:
             return self._keyword_search(query, top_k)
@@ -240,11 +286,8 @@ class SlideKnowledgeBase:
                 print(f"Error searching chromadb: {e}")
                 return self._keyword_search(query, top_k)
         else:
-            # 简单的余弦相似度搜索
-            similarities = []
-            for chunk_id, embedding in self.embeddings.items():
-                similarity = self._cosine_similarity(query_embedding, embedding)
-                similarities.append((similarity, chunk_id))
+            # 余弦相似度搜索
+            similarities = self._similarities(query_embedding)
             
             # 排序并返回top_k
             similarities.sort(reverse=True, key=lambda x: x[0])
@@ -283,9 +326,33 @@ class SlideKnowledgeBase:
         results.sort(reverse=True, key=lambda x: x["similarity"])
         return results[:top_k]
     
+    def _similarities(self, query_embedding: List[float]) -> List[tuple]:
+        """查询与所有embedding的余弦相似度，返回(similarity, chunk_id)列表"""
+        np = optional_import("numpy")
+        if np is None or not self.embeddings:
+            return [(self._cosine_similarity(query_embedding, embedding), chunk_id)
+                    for chunk_id, embedding in self.embeddings.items()]
+        
+        # 常驻知识库只构建一次归一化矩阵，之后每次搜索只需一次矩阵乘法
+        index = self._index
+        if index is None:
+            ids = list(self.embeddings)
+            matrix = np.array([self.embeddings[chunk_id] for chunk_id in ids], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            index = self._index = (ids, matrix / norms)
+        ids, matrix = index
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return [(0.0, chunk_id) for chunk_id in ids]
+        scores = matrix @ (query / norm)
+        return list(zip(scores.tolist(), ids))
+    
     def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """计算余弦相似度"""
         try:
+            import numpy as np
             vec1 = np.array(vec1)
             vec2 = np.array(vec2)
             dot_product = np.dot(vec1, vec2)
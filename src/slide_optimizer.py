@@ -8,13 +8,8 @@ import re
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
-try:
-    import pdfplumber
-    PDFPLUMBER_AVAILABLE = True
-except ImportError:
-    PDFPLUMBER_AVAILABLE = False
-
-from src.slide_knowledge_base import SlideKnowledgeBase
+from src.lazy import optional_import
+from src.kb_registry import get_kb_registry
 from src.pdf_processor import PDFSlideProcessor
 from src.slide_analysis_agent import SlideAnalysisAgent
 from src.slide_enhancer import SlideEnhancer
@@ -24,7 +19,12 @@ from src.agents import LLM
 class SlideOptimizer:
     """协调幻灯片优化流程"""
     
-    def __init__(self):
+    def __init__(self, api_key: Optional[str] = None):
+        """
+        Args:
+            api_key: 生成embedding使用的API key（可选，默认为OPENAI_API_KEY）
+        """
+        self.api_key = api_key
         self.processor = PDFSlideProcessor()
         self.llm = LLM()
         self.analysis_agent = SlideAnalysisAgent(self.llm)
@@ -72,8 +72,11 @@ class SlideOptimizer:
             print(f"DEBUG: Creating knowledge base in exp directory: {kb_dir}")
         else:
             kb_dir = "knowledge_base"
-        kb = SlideKnowledgeBase(kb_name, kb_dir=kb_dir)
-        kb.create_from_extracted_data(extracted_data, chapter_filter=chapter_name)
+        # 在新实例上重建（复用chromadb客户端），完成后替换注册表中共享的实例
+        kb_registry = get_kb_registry()
+        kb = kb_registry.build(kb_name, kb_dir=kb_dir)
+        kb.create_from_extracted_data(extracted_data, chapter_filter=chapter_name, api_key=self.api_key)
+        kb_registry.register(kb)
         
         # 3. 分析内容
         summary = kb.get_all_content_summary()
@@ -83,7 +86,7 @@ class SlideOptimizer:
         )
         
         # 4. 搜索相关内容
-        search_results = kb.search(user_requirements, top_k=10)
+        search_results = kb.search(user_requirements, top_k=10, api_key=self.api_key)
         
         # 5. 生成建议
         recommendations = self.analysis_agent.generate_improvement_recommendations(
@@ -205,7 +208,8 @@ class SlideOptimizer:
                     
                 try:
                     # 快速扫描前几页提取章节信息
-                    if PDFPLUMBER_AVAILABLE:
+                    pdfplumber = optional_import("pdfplumber")
+                    if pdfplumber:
                         with pdfplumber.open(pdf_file) as pdf:
                             for page_num in range(min(5, len(pdf.pages))):
                                 page = pdf.pages[page_num]
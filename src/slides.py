@@ -1,13 +1,57 @@
 import os
 import json
 import re
-from typing import List, Dict, Any, Tuple, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional, Callable
 from pathlib import Path
 
 from src.agents import (
     LLM,
     Agent,
 )
+from src.structured import ArrayStreamListener, ParseError, parse_json
+from src.beamer import extract_frames, parse_beamer
+from src.latex_lint import format_issues, lint_frame, lint_stats
+from src.prompts import PromptFragments, build_prompt
+from src.tracing import in_context, span
+
+# Schemas of the JSON the slide pipeline asks the agents for
+OUTLINE_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "required": ["title", "description"],
+        "properties": {"title": {"type": "string"}, "description": {"type": "string"}}
+    }
+}
+
+SCRIPT_TEMPLATE_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "required": ["slide_id"],
+        "properties": {"slide_id": {"type": "integer", "minimum": 1}}
+    }
+}
+
+ASSESSMENT_TEMPLATE_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "required": ["slide_id", "assessment"],
+        "properties": {"slide_id": {"type": "integer", "minimum": 1}, "assessment": {"type": "object"}}
+    }
+}
+
+SLIDE_ASSESSMENT_SCHEMA = {
+    "type": "object",
+    "required": ["assessment"],
+    "properties": {"assessment": {"type": "object"}}
+}
 
 
 class SlideUtils:
@@ -108,10 +152,8 @@ frame=single
     
     @staticmethod
     def extract_latex_frames(latex_source: str) -> List[str]:
-        """从LaTeX源代码中提取所有frame"""
-        frame_pattern = re.compile(r'\\begin{frame}.*?\\end{frame}', re.DOTALL)
-        frames = frame_pattern.findall(latex_source)
-        return frames
+        """从LaTeX源代码中提取所有frame（单遍扫描，支持嵌套环境和注释）"""
+        return extract_frames(latex_source)
     
     @staticmethod
     def compile_latex_document(
@@ -136,39 +178,35 @@ frame=single
         description: Optional[str] = None,
         current_frames: Optional[str] = None,
         user_feedback: Optional[Dict] = None,
-        max_frames: int = 3
+        max_frames: int = 3,
+        feedback_text: Optional[str] = None
     ) -> str:
-        """生成LaTeX frame的提示词"""
-        feedback_text = ""
-        if user_feedback:
-            feedback_text = f"""
-User Feedback:
+        """
+        生成LaTeX frame的提示词
+
+        指令和用户反馈在前、幻灯片内容在后，使各张幻灯片的提示词共享同一前缀。
+        feedback_text 为预先序列化的用户反馈段落（优先于 user_feedback）。
+        """
+        if feedback_text is None:
+            feedback_text = ""
+            if user_feedback:
+                feedback_text = f"""User Feedback:
 [For slides]{json.dumps(user_feedback.get('slides', {}), indent=2)}
-[For overall]{json.dumps(user_feedback.get('overall', {}), indent=2)}
-"""
+[For overall]{json.dumps(user_feedback.get('overall', {}), indent=2)}"""
         
         current_frames_text = ""
         if current_frames:
-            current_frames_text = f"""
-Current LaTeX Frames (for reference):
+            current_frames_text = f"""Current LaTeX Frames (for reference):
 ```latex
 {current_frames}
-```
-"""
+```"""
         
         description_text = f"\nSlide Description: {description}" if description else ""
         
-        return f"""
-Based on the following slide content, generate LaTeX code for a presentation slide.
+        instructions = f"""
+Based on the slide content given at the end of this message, generate LaTeX code for a presentation slide.
 You can create multiple frames if the content is too extensive for a single frame.
 
-Slide Title: {title}{description_text}
-
-Detailed Content:
-{content[:2000]}
-
-{current_frames_text}{feedback_text}
-
 Please generate the LaTeX code for this slide using the beamer class format.
 You should first summarize the content and extract key points to A BRIEF SUMMARY.
 
@@ -199,8 +237,16 @@ Use LaTeX features like:
 - \\begin{{equation}} for mathematical formulas
 
 Your response should contain all the frames for this slide, each from \\begin{{frame}}[fragile] to \\end{{frame}}.
-Separate multiple frames with blank lines.
-"""
+Separate multiple frames with blank lines."""
+        
+        return build_prompt(
+            [instructions, feedback_text],
+            [
+                f"Slide Title: {title}{description_text}",
+                f"Detailed Content:\n{content[:2000]}",
+                current_frames_text
+            ]
+        )
     
     @staticmethod
     def generate_latex_frames_from_content(
@@ -226,11 +272,73 @@ Separate multiple frames with blank lines.
         response, _, _ = agent.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="latex"
         )
         
         frames = SlideUtils.extract_latex_frames(response)
-        return frames
+        
+        def regenerate(fix_prompt: str) -> str:
+            return agent.generate_response(prompt=fix_prompt, stream=True, save_to_history=False, step="latex")[0]
+        
+        return [result["frame"] for result in SlideUtils.repair_latex_frames(frames, regenerate)]
+    
+    @staticmethod
+    def generate_latex_fix_prompt(frame: str, errors: List[Dict[str, Any]]) -> str:
+        """生成修复单个frame的提示词"""
+        return f"""
+The following LaTeX beamer frame does not compile. Fix the problems listed below and keep the content unchanged.
+
+Problems:
+{format_issues(errors)}
+
+Frame:
+```latex
+{frame}
+```
+
+Return only the corrected frame, from \\begin{{frame}} to \\end{{frame}}.
+Escape special characters in text (\\&, \\%, \\_, \\#, \\$) and use [fragile] for frames with code.
+"""
+    
+    @staticmethod
+    def repair_latex_frames(
+        frames: List[str],
+        regenerate: Optional[Callable[[str], str]] = None,
+        max_regenerations: int = 1
+    ) -> List[Dict[str, Any]]:
+        """
+        检查并机械修复frames，无法修复的frame交给regenerate重新生成
+        
+        Args:
+            frames: LaTeX frames
+            regenerate: Optional function returning a model response for a fix prompt
+            max_regenerations: Regeneration attempts per frame
+            
+        Returns:
+            lint_frame() results in frame order; frames that still have
+            "errors" could not be repaired
+        """
+        results = []
+        for frame in frames:
+            result = lint_frame(frame)
+            regenerated = False
+            attempts = 0
+            while result["errors"] and regenerate and attempts < max_regenerations:
+                attempts += 1
+                print(f"Regenerating frame with {len(result['errors'])} LaTeX error(s):\n{format_issues(result['errors'])}")
+                candidates = extract_frames(regenerate(SlideUtils.generate_latex_fix_prompt(result["frame"], result["errors"])))
+                if not candidates:
+                    continue
+                retry = lint_frame(candidates[0])
+                if len(retry["errors"]) <= len(result["errors"]):
+                    result = retry
+                    regenerated = True
+            if result["errors"]:
+                print(f"Warning: frame still has LaTeX errors:\n{format_issues(result['errors'])}")
+            lint_stats.record(result, regenerated=regenerated)
+            results.append(result)
+        return results
 
 
 class SlidesDeliberation:
@@ -245,7 +353,9 @@ class SlidesDeliberation:
                  max_rounds: int = 1,
                  output_dir: str = "./outputs/",
                  catalog: bool = False,
-                 catalog_dict: Dict[str, Any] = None
+                 catalog_dict: Dict[str, Any] = None,
+                 batch_executor=None,
+                 draft_workers: int = 4
                  ):
         """
         Initialize SlidesDeliberation
@@ -258,6 +368,9 @@ class SlidesDeliberation:
             max_rounds: Maximum discussion rounds
             latex_template: LaTeX template to use for slides
             output_dir: Directory to save output files
+            batch_executor: Optional BatchExecutor; per-slide steps are then
+                submitted stage by stage as batches instead of one call at a time
+            draft_workers: Maximum number of slide drafts generated at once
         """
         self.id = id
         self.name = name
@@ -267,6 +380,8 @@ class SlidesDeliberation:
         self.output_dir = output_dir
         self.catalog = catalog
         self.catalog_dict = catalog_dict if catalog_dict else {}
+        self.batch_executor = batch_executor
+        self.draft_workers = draft_workers
         
         # Initialize containers for results
         self.slides_outline = []
@@ -274,6 +389,15 @@ class SlidesDeliberation:
         self.slides_script = {}
         self.assessment_template = {}  # New: assessment template
         self.assessment_content = {}   # New: assessment content
+        
+        # Template steps and slide drafts run concurrently with the per-slide steps
+        self.template_futures = {}
+        self.draft_executor = None
+        self.draft_futures = {}  # Slide index -> (context slides, future)
+        self.stats_lock = threading.Lock()
+        
+        # Serialized once per chapter and shared by all prompts that embed them
+        self.fragments = PromptFragments()
     
    
     def run(self, chapter: Dict[str, str], user_feedback: Dict[str, Any]):
@@ -295,40 +419,70 @@ class SlidesDeliberation:
         self.time_assessment, self.token_assessment = 0, 0
 
         self.user_feedback = user_feedback
+        self._set_prompt_fragments()
 
         # Step 0: Get templates
         self._get_templates()
         
-        # Step 1: Generate slides outline
-        self._generate_slides_outline(chapter)
-        
-        # Step 2: Generate initial LaTeX template
-        self._generate_initial_latex(chapter)
-        
-        # Step 3: Generate slides script template
-        self._generate_slides_script_template()
-        
-        # Step 4: Generate assessment template
-        self._generate_assessment_template(chapter)
-        
-        # Step 5: For each slide, generate content, LaTeX, script, and assessment
-        for slide_idx, slide in enumerate(self.slides_outline):
-            print(f"\n{'-'*50}\nProcessing Slide {slide_idx + 1}/{len(self.slides_outline)}: {slide['title']}\n{'-'*50}\n")
-            
-            # Get context window (current slide plus adjacent slides for context)
-            context_slides = self._get_context_slides(slide_idx)
-            
-            # Step 5.1: Generate slide draft content
-            slide_draft = self._generate_slide_draft(slide, context_slides, chapter)
-            
-            # Step 5.2: Generate slide LaTeX code (potentially multiple frames)
-            self._generate_slide_latex(slide_idx, slide, slide_draft)
+        # Drafts depend only on the outline, so they are started while the
+        # outline is still streaming (not in batch mode, which batches drafts)
+        self.draft_futures = {}
+        self.draft_executor = None if self.batch_executor else ThreadPoolExecutor(max_workers=self.draft_workers)
+        try:
+            # Step 1: Generate slides outline
+            with span("outline", "step"):
+                self._generate_slides_outline(chapter)
+        
+            # Steps 2-4: the LaTeX, script and assessment templates depend only on
+            # the outline, so they are generated concurrently while the per-slide
+            # steps start; each per-slide step waits only for the template it uses
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                self.template_futures = {
+                    # Step 2: Generate initial LaTeX template
+                    "latex": executor.submit(in_context(self._generate_initial_latex, "latex_template", "step"), chapter),
+                    # Step 3: Generate slides script template
+                    "script": executor.submit(in_context(self._generate_slides_script_template, "script_template", "step")),
+                    # Step 4: Generate assessment template
+                    "assessment": executor.submit(
+                        in_context(self._generate_assessment_template, "assessment_template", "step"), chapter
+                    )
+                }
             
-            # Step 5.3: Generate slide script
-            self._generate_slide_script(slide_idx, slide, slide_draft)
+                # Step 5: For each slide, generate content, LaTeX, script, and assessment
+                if self.batch_executor:
+                    with span("batched_slides", "step", slides=len(self.slides_outline)):
+                        self._generate_slides_batched(chapter)
+                else:
+                    for slide_idx, slide in enumerate(self.slides_outline):
+                        print(f"\n{'-'*50}\nProcessing Slide {slide_idx + 1}/{len(self.slides_outline)}: {slide['title']}\n{'-'*50}\n")
+                        with span("slide", "slide", index=slide_idx + 1, title=slide["title"]):
+                            # Step 5.1: Generate slide draft content (usually started while the outline streamed)
+                            with span("draft", "step"):
+                                slide_draft = self._get_slide_draft(slide_idx, slide, chapter)
+                
+                            # Step 5.2: Generate slide LaTeX code (potentially multiple frames)
+                            self._wait_for_template("latex")
+                            with span("latex", "step"):
+                                self._generate_slide_latex(slide_idx, slide, slide_draft)
+                
+                            # Step 5.3: Generate slide script
+                            self._wait_for_template("script")
+                            with span("script", "step"):
+                                self._generate_slide_script(slide_idx, slide, slide_draft)
+                
+                            # Step 5.4: Generate slide assessment
+                            self._wait_for_template("assessment")
+                            with span("assessment", "step"):
+                                self._generate_slide_assessment(slide_idx, slide, slide_draft)
             
-            # Step 5.4: Generate slide assessment
-            self._generate_slide_assessment(slide_idx, slide, slide_draft)
+                for name in self.template_futures:
+                    self._wait_for_template(name)
+        finally:
+            if self.draft_executor:
+                for _, future in self.draft_futures.values():
+                    future.cancel()
+                self.draft_executor.shutdown(wait=True)
+                self.draft_executor = None
         
         # Step 6: Compile final LaTeX source
         latex_source = self._compile_latex_source()
@@ -367,12 +521,106 @@ class SlidesDeliberation:
                 "token_assessment": self.token_assessment
             }, f, indent=2)
     
+    def _generate_slides_batched(self, chapter: Dict[str, str]):
+        """
+        Generate the per-slide content in three batches
+        
+        1. Drafts of all slides
+        2. LaTeX frames and assessments of all slides (both need only the draft)
+        3. Scripts of all slides (need the frames)
+        
+        Scripts see the template placeholders of adjacent slides rather than
+        their final scripts, since all scripts are generated together.
+        Drafts do not need the templates, so the first batch is submitted
+        while the templates are still being generated.
+        """
+        teaching_faculty = self.agents.get("teaching_faculty")
+        teaching_assistant = self.agents.get("teaching_assistant")
+        if not teaching_faculty or not teaching_assistant:
+            raise ValueError("Teaching Faculty and Teaching Assistant agents are required")
+        
+        slides = list(enumerate(self.slides_outline))
+        
+        print(f"\n{'-'*50}\nBatch 1/3: drafts for {len(slides)} slides\n{'-'*50}\n")
+        outputs = self.batch_executor.run([
+            {"id": f"draft_{idx}", "agent": teaching_faculty, "step": "draft",
+             "prompt": self._slide_draft_prompt(slide, self._get_context_slides(idx), chapter)}
+            for idx, slide in slides
+        ])
+        drafts = {idx: outputs[f"draft_{idx}"]["content"] for idx, _ in slides}
+        self._add_stats("slides", *self._batch_stats(outputs, "draft_"))
+        
+        self._wait_for_template("latex")
+        self._wait_for_template("assessment")
+        print(f"\n{'-'*50}\nBatch 2/3: LaTeX and assessments for {len(slides)} slides\n{'-'*50}\n")
+        outputs = self.batch_executor.run(
+            [{"id": f"latex_{idx}", "agent": teaching_assistant, "step": "latex",
+              "prompt": self._slide_latex_prompt(idx, slide, drafts[idx])} for idx, slide in slides] +
+            [{"id": f"assessment_{idx}", "agent": teaching_assistant, "step": "assessment", "json_mode": True,
+              "prompt": self._slide_assessment_prompt(idx, slide, drafts[idx])} for idx, slide in slides]
+        )
+        for idx, slide in slides:
+            self._store_slide_latex(idx, slide, outputs[f"latex_{idx}"]["content"])
+            self._store_slide_assessment(idx, slide, outputs[f"assessment_{idx}"]["content"])
+        self._add_stats("slides", *self._batch_stats(outputs, "latex_"))
+        self._add_stats("assessment", *self._batch_stats(outputs, "assessment_"))
+        
+        self._wait_for_template("script")
+        print(f"\n{'-'*50}\nBatch 3/3: scripts for {len(slides)} slides\n{'-'*50}\n")
+        outputs = self.batch_executor.run([
+            {"id": f"script_{idx}", "agent": teaching_assistant, "step": "script",
+             "prompt": self._slide_script_prompt(idx, slide, drafts[idx])}
+            for idx, slide in slides
+        ])
+        for idx, slide in slides:
+            self._store_slide_script(idx, slide, outputs[f"script_{idx}"]["content"])
+        self._add_stats("script", *self._batch_stats(outputs, "script_"))
+    
+    @staticmethod
+    def _batch_stats(outputs: Dict[str, Dict[str, Any]], prefix: str) -> Tuple[float, int]:
+        """Get the wall time and tokens of a batch's requests with the given ID prefix"""
+        selected = [output for job_id, output in outputs.items() if job_id.startswith(prefix)]
+        if not selected:
+            return 0, 0
+        return (max(output["elapsed_time"] for output in selected),
+                sum(output["tokens"] for output in selected))
+    
+    def _add_stats(self, part: str, elapsed_time: float, token_usage: int):
+        """
+        Add a call's time and tokens to the statistics of one output
+        
+        Args:
+            part: "slides", "script" or "assessment"
+            elapsed_time: Time spent on the call(s)
+            token_usage: Tokens used by the call(s)
+        """
+        with self.stats_lock:
+            setattr(self, f"time_{part}", getattr(self, f"time_{part}") + elapsed_time)
+            setattr(self, f"token_{part}", getattr(self, f"token_{part}") + token_usage)
+    
+    def _wait_for_template(self, name: str):
+        """Wait for a concurrently generated template ("latex", "script" or "assessment"), re-raising its error"""
+        future = self.template_futures.get(name)
+        if future is not None:
+            with span(f"wait_{name}_template", "wait", done=future.done()):
+                future.result()
+    
     def _get_templates(self):
         """获取LaTeX模板"""
         self.latex_template = SlideUtils.get_latex_template(
             catalog=self.catalog
         )
     
+    def _set_prompt_fragments(self):
+        """Serialize the user feedback and catalog requirements shared by this chapter's prompts"""
+        self.fragments = PromptFragments()
+        self.fragments.set("feedback", "User Feedback:\n" + json.dumps(self.user_feedback, indent=2))
+        overall = json.dumps(self.user_feedback.get("overall", ""), indent=2)
+        for kind in ("slides", "script", "assessment"):
+            feedback = json.dumps(self.user_feedback.get(kind, ""), indent=2)
+            self.fragments.set(f"feedback.{kind}", f"User Feedback:\n[For {kind}]{feedback}\n[For overall]{overall}")
+        self.fragments.set("assessment_requirements", self.catalog_dict.get("assessment_planning", ""), render=str)
+    
     def _generate_slides_outline(self, chapter: Dict[str, str]):
         """Generate slides outline using Instructional Designer agent"""
         instructional_designer = self.agents.get("instructional_designer")
@@ -393,15 +641,10 @@ class SlidesDeliberation:
             }
             ]"""
         
-        # Create the prompt for the agent
-        prompt = f"""
-        Based on the following chapter information, create a detailed slides outline in JSON format.
-        
-        Chapter Title: {chapter['title']}
-        Chapter Description: {chapter['description']}
-        
-        User Feedback:
-        {json.dumps(self.user_feedback, indent=2)}
+        # Create the prompt for the agent; the chapter comes last so that the
+        # instructions and feedback form a prefix shared by all chapters
+        instructions = f"""
+        Based on the chapter information given at the end of this message, create a detailed slides outline in JSON format.
 
         Please generate a comprehensive slides outline with about {self.catalog_dict['slides_length'] / 3} slides covering all important aspects of this chapter.
         The outline should be in JSON format with the following structure:
@@ -409,36 +652,47 @@ class SlidesDeliberation:
         {outline_template}
         
         Please try to use the simple and common latex grammer to guarantee the LaTeX code can be compiled successfully.
-        Your response must be valid JSON that can be parsed programmatically.
-        """
+        Your response must be valid JSON that can be parsed programmatically."""
+        prompt = build_prompt(
+            [instructions, self.fragments.get("feedback")],
+            [f"Chapter Title: {chapter['title']}\nChapter Description: {chapter['description']}"]
+        )
         
         # Reset agent history to ensure clean context
         instructional_designer.reset_history()
         
+        # Start drafting each slide as soon as it and its successor are outlined
+        listener = None
+        if self.draft_executor:
+            self.slides_outline = []
+            
+            def on_slide(slide):
+                self.slides_outline.append(slide)
+                if len(self.slides_outline) > 1:
+                    self._start_slide_draft(len(self.slides_outline) - 2, chapter)
+            
+            listener = ArrayStreamListener(on_slide, OUTLINE_SCHEMA["items"])
+        
         # Get the response from the agent
         print("Generating slides outline...")
         response, elapsed_time, token_usage = instructional_designer.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="outline",
+            listener=listener
         )
-        self.time_slides += elapsed_time
-        self.token_slides += token_usage
+        self._add_stats("slides", elapsed_time, token_usage)
         
         # Parse the JSON response
         try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                self.slides_outline = json.loads(json_str)
-            else:
-                # If no JSON array pattern is found, try direct parsing
-                self.slides_outline = json.loads(response)
+            outline = parse_json(response, expect="array", schema=OUTLINE_SCHEMA,
+                                 name="slides_outline", drop_invalid_items=True)
+            self.slides_outline = listener.merge(outline) if listener else outline
             
             print(f"Successfully generated outline with {len(self.slides_outline)} slides")
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ParseError as e:
             print(f"Error: Could not parse JSON response from agent: {e}")
             print("Response:", response)
             # Create a minimal outline as fallback
@@ -447,6 +701,38 @@ class SlidesDeliberation:
                 {"slide_id": 2, "title": "Overview", "description": "Overview of key concepts"},
                 {"slide_id": 3, "title": "Conclusion", "description": "Summary and conclusion"}
             ]
+        
+        self.fragments.set("outline", self.slides_outline)
+        
+        # Start the drafts of the remaining slides
+        if self.draft_executor:
+            for slide_idx in range(len(self.slides_outline)):
+                self._start_slide_draft(slide_idx, chapter)
+    
+    def _start_slide_draft(self, slide_idx: int, chapter: Dict[str, str]):
+        """Submit a slide's draft to the draft pool, with the outline known so far as context"""
+        context_slides = self._get_context_slides(slide_idx)
+        previous = self.draft_futures.get(slide_idx)
+        if previous:
+            if previous[0] == context_slides:
+                return
+            previous[1].cancel()
+        future = self.draft_executor.submit(
+            in_context(self._generate_slide_draft, "draft_prefetch", "task", index=slide_idx + 1),
+            self.slides_outline[slide_idx], context_slides, chapter
+        )
+        self.draft_futures[slide_idx] = (context_slides, future)
+    
+    def _get_slide_draft(self, slide_idx: int, slide: Dict[str, str], chapter: Dict[str, str]) -> str:
+        """Get a slide's draft, reusing the one started during outlining if its context still matches"""
+        # Get context window (current slide plus adjacent slides for context)
+        context_slides = self._get_context_slides(slide_idx)
+        started = self.draft_futures.pop(slide_idx, None)
+        if started and started[0] == context_slides:
+            return started[1].result()
+        if started:
+            started[1].cancel()
+        return self._generate_slide_draft(slide, context_slides, chapter)
     
     def _generate_initial_latex(self, chapter: Dict[str, str]):
         """Generate initial LaTeX template using Teaching Assistant agent"""
@@ -454,18 +740,10 @@ class SlidesDeliberation:
         if not teaching_assistant:
             raise ValueError("Teaching Assistant agent not found")
         
-        # Create the prompt for the agent
-        prompt = f"""
-        Based on the following slides outline and LaTeX template, generate initial LaTeX code for a presentation.
-        
-        Chapter Title: {chapter['title']}
-        
-        Slides Outline:
-        {json.dumps(self.slides_outline, indent=2)}
-
-        User Feedback:
-        [For slides]{json.dumps(self.user_feedback['slides'], indent=2)}
-        [For overall]{json.dumps(self.user_feedback['overall'], indent=2)}
+        # Create the prompt for the agent: the template and feedback are the
+        # same for every chapter, the chapter and its outline come last
+        instructions = f"""
+        Based on the LaTeX template and the slides outline given at the end of this message, generate initial LaTeX code for a presentation.
 
         LaTeX Template:
         ```latex
@@ -489,8 +767,11 @@ class SlidesDeliberation:
         1. Don't use non-English characters directly, e.g. use $\gamma$ instead of γ, $\epsilon$ instead of ε
         2. If any of symbols has a special meaning, add a slash. e.g. use \& instead of &
 
-        Your response should be LaTeX code that can be compiled directly.
-        """
+        Your response should be LaTeX code that can be compiled directly."""
+        prompt = build_prompt(
+            [instructions, self.fragments.get("feedback.slides")],
+            [f"Chapter Title: {chapter['title']}", f"Slides Outline:\n{self.fragments.get('outline')}"]
+        )
         
         # Reset agent history to ensure clean context
         teaching_assistant.reset_history()
@@ -500,10 +781,10 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_assistant.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="latex_template"
         )
-        self.time_slides += elapsed_time
-        self.token_slides += token_usage
+        self._add_stats("slides", elapsed_time, token_usage)
         
         # Store the full LaTeX source
         self.full_latex_source = response
@@ -515,20 +796,14 @@ class SlidesDeliberation:
     
     def _parse_latex_frames(self, latex_source: str):
         """Parse LaTeX frames into a dictionary, grouping by slide"""
-        # Find all frames with their content
-        frame_pattern = re.compile(r'\\begin{frame}(.*?)\\end{frame}', re.DOTALL)
-        frametitle_pattern = re.compile(r'\\frametitle{(.*?)}', re.DOTALL)
-        
-        matches = frame_pattern.finditer(latex_source)
+        document = parse_beamer(latex_source)
+        frames = document["frames"]
         
         self.latex_dict = {}
         current_slide_idx = 0
         
-        for i, match in enumerate(matches):
-            frame_content = match.group(1)
-            title_match = frametitle_pattern.search(frame_content)
-            
-            title = title_match.group(1).strip() if title_match else f"Frame {i+1}"
+        for i, frame in enumerate(frames):
+            title = frame["title"] or f"Frame {i+1}"
             
             # Initialize slide entry if it doesn't exist
             if current_slide_idx not in self.latex_dict:
@@ -539,43 +814,26 @@ class SlidesDeliberation:
             
             # Add frame to current slide
             self.latex_dict[current_slide_idx]["frames"].append({
-                "full_frame": match.group(0),
-                "content": frame_content.strip(),
+                "full_frame": frame["text"],
+                "content": frame["content"].strip(),
                 "title": title,
                 "frame_index": len(self.latex_dict[current_slide_idx]["frames"])
             })
             
-            # Simple heuristic: if we have processed enough frames for expected slides
-            if len(self.latex_dict[current_slide_idx]["frames"]) >= 1 and current_slide_idx < len(self.slides_outline) - 1:
-                # Check if next frame title suggests a new slide
-                next_match = None
-                for next_match in frame_pattern.finditer(latex_source):
-                    if next_match.start() > match.end():
-                        break
-                
-                if next_match:
-                    next_content = next_match.group(1)
-                    next_title_match = frametitle_pattern.search(next_content)
-                    next_title = next_title_match.group(1).strip() if next_title_match else ""
-                    
-                    # If title doesn't contain current slide title, it's likely a new slide
-                    current_base_title = self.latex_dict[current_slide_idx]["slide_title"]
-                    if current_base_title not in next_title and not next_title.startswith(current_base_title):
-                        current_slide_idx += 1
+            # Simple heuristic: a following frame whose title does not continue
+            # the current slide title starts a new slide
+            if current_slide_idx < len(self.slides_outline) - 1 and i + 1 < len(frames):
+                next_title = frames[i + 1]["title"]
+                current_base_title = self.latex_dict[current_slide_idx]["slide_title"]
+                if current_base_title not in next_title and not next_title.startswith(current_base_title):
+                    current_slide_idx += 1
         
         # Store the parts before and after the frames
-        all_frames = ''.join([
-            frame["full_frame"] 
-            for slide_data in self.latex_dict.values() 
-            for frame in slide_data["frames"]
-        ])
-        parts = latex_source.split(all_frames)
-        
-        if len(parts) >= 2:
-            self.latex_prefix = parts[0]
-            self.latex_suffix = parts[1]
+        if frames:
+            self.latex_prefix = document["prefix"]
+            self.latex_suffix = document["suffix"]
         else:
-            # Fallback if splitting didn't work as expected
+            # Fallback if no frames were found
             self.latex_prefix = latex_source.split('\\begin{document}')[0] + '\\begin{document}\n\n\\frame{\\titlepage}\n\n'
             self.latex_suffix = '\n\\end{document}'
     
@@ -600,15 +858,8 @@ class SlidesDeliberation:
             ]"""
         
         # Create the prompt for the agent
-        prompt = f"""
-        Based on the following slides outline, create a template for slides scripts in JSON format.
-        
-        Slides Outline:
-        {json.dumps(self.slides_outline, indent=2)}
-
-        User Feedback:
-        [For script]{json.dumps(self.user_feedback['script'], indent=2)}
-        [For overall]{json.dumps(self.user_feedback['overall'], indent=2)}
+        instructions = f"""
+        Based on the slides outline given at the end of this message, create a template for slides scripts in JSON format.
 
         Please generate a script template with placeholders for each slide in the outline.
         The template should be in JSON format with the following structure:
@@ -616,8 +867,11 @@ class SlidesDeliberation:
         {script_template}
         
         Each script entry should include a brief placeholder description of what would be said when presenting that slide.
-        Your response must be valid JSON that can be parsed programmatically.
-        """
+        Your response must be valid JSON that can be parsed programmatically."""
+        prompt = build_prompt(
+            [instructions, self.fragments.get("feedback.script")],
+            [f"Slides Outline:\n{self.fragments.get('outline')}"]
+        )
         
         # Reset agent history to ensure clean context
         teaching_assistant.reset_history()
@@ -627,28 +881,21 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_assistant.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="script_template"
         )
-        self.time_script += elapsed_time
-        self.token_script += token_usage
+        self._add_stats("script", elapsed_time, token_usage)
         
         # Parse the JSON response
         try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                self.slides_script = json.loads(json_str)
-                # Convert to dictionary for easier access
-                self.slides_script = {item["slide_id"]-1: item for item in self.slides_script}
-            else:
-                # If no JSON array pattern is found, try direct parsing
-                script_list = json.loads(response)
-                self.slides_script = {item["slide_id"]-1: item for item in script_list}
+            script_list = parse_json(response, expect="array", schema=SCRIPT_TEMPLATE_SCHEMA,
+                                     name="script_template", drop_invalid_items=True)
+            # Convert to dictionary for easier access
+            self.slides_script = {item["slide_id"]-1: item for item in script_list}
             
             print(f"Successfully generated script template for {len(self.slides_script)} slides")
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ParseError as e:
             print(f"Error: Could not parse JSON response from agent: {e}")
             print("Response:", response)
             # Create a minimal script template as fallback
@@ -688,18 +935,8 @@ class SlidesDeliberation:
             ]"""
         
         # Create the prompt for the agent
-        prompt = f"""
-        Based on the following chapter information and slides outline, create an assessment template in JSON format.
-        
-        Chapter Title: {chapter['title']}
-        Chapter Description: {chapter['description']}
-        
-        Slides Outline:
-        {json.dumps(self.slides_outline, indent=2)}
-
-        User Feedback:
-        [For assessment]{json.dumps(self.user_feedback['assessment'], indent=2)}
-        [For overall]{json.dumps(self.user_feedback['overall'], indent=2)}
+        instructions = f"""
+        Based on the chapter information and slides outline given at the end of this message, create an assessment template in JSON format.
 
         Please generate an assessment template with placeholders for each slide in the outline.
         The template should include questions, activities, and learning objectives for each slide.
@@ -708,15 +945,21 @@ class SlidesDeliberation:
         {assessment_template}
         
         Assessments should meet the following requirements:
-        {self.catalog_dict['assessment_planning']}
+        {self.fragments.get('assessment_requirements')}
 
         Each assessment entry should include:
         1. Multiple choice questions (with options and correct answers)
         2. Practical activities or exercises
         3. Learning objectives for the slide
         
-        Your response must be valid JSON that can be parsed programmatically.
-        """
+        Your response must be valid JSON that can be parsed programmatically."""
+        prompt = build_prompt(
+            [instructions, self.fragments.get("feedback.assessment")],
+            [
+                f"Chapter Title: {chapter['title']}\nChapter Description: {chapter['description']}",
+                f"Slides Outline:\n{self.fragments.get('outline')}"
+            ]
+        )
         
         # Reset agent history to ensure clean context
         teaching_assistant.reset_history()
@@ -726,28 +969,21 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_assistant.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="assessment_template"
         )
-        self.time_assessment += elapsed_time
-        self.token_assessment += token_usage
+        self._add_stats("assessment", elapsed_time, token_usage)
         
         # Parse the JSON response
         try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                assessment_list = json.loads(json_str)
-                # Convert to dictionary for easier access
-                self.assessment_template = {item["slide_id"]-1: item for item in assessment_list}
-            else:
-                # If no JSON array pattern is found, try direct parsing
-                assessment_list = json.loads(response)
-                self.assessment_template = {item["slide_id"]-1: item for item in assessment_list}
+            assessment_list = parse_json(response, expect="array", schema=ASSESSMENT_TEMPLATE_SCHEMA,
+                                         name="assessment_template", drop_invalid_items=True)
+            # Convert to dictionary for easier access
+            self.assessment_template = {item["slide_id"]-1: item for item in assessment_list}
             
             print(f"Successfully generated assessment template for {len(self.assessment_template)} slides")
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ParseError as e:
             print(f"Error: Could not parse JSON response from agent: {e}")
             print("Response:", response)
             # Create a minimal assessment template as fallback
@@ -794,26 +1030,10 @@ class SlidesDeliberation:
         
         return context_slides
     
-    def _generate_slide_draft(self, slide: Dict[str, str], context_slides: List[Dict[str, Any]], chapter: Dict[str, str]):
-        """Generate detailed slide draft using Teaching Faculty agent"""
-        teaching_faculty = self.agents.get("teaching_faculty")
-        if not teaching_faculty:
-            raise ValueError("Teaching Faculty agent not found")
-        
-        # Create the prompt for the agent
-        prompt = f"""
-        Please create detailed educational content for the following slide:
-        
-        Chapter: {chapter['title']}
-        Slide: {slide['title']}
-        Description: {slide['description']}
-        
-        Context (adjacent slides for reference):
-        {json.dumps(context_slides, indent=2)}
-
-        User Feedback:
-        [For slides]{json.dumps(self.user_feedback['slides'], indent=2)}
-        [For overall]{json.dumps(self.user_feedback['overall'], indent=2)}
+    def _slide_draft_prompt(self, slide: Dict[str, str], context_slides: List[Dict[str, Any]], chapter: Dict[str, str]) -> str:
+        """Build the prompt for a slide draft; the parts shared by all slides come first"""
+        instructions = """
+        Please create detailed educational content for the slide given at the end of this message.
         
         Please generate comprehensive, detailed, and easy-to-understand educational content for this slide.
         Your content should include:
@@ -823,8 +1043,22 @@ class SlidesDeliberation:
         4. Any formulas, code snippets, or diagrams that would be helpful, but dont try to include any pictures in the LaTeX code.
         
         Focus on making the content educational, engaging, and aligned with the chapter's learning objectives.
-        Note: Your output length needs to be kept within a reasonable range so that it can fit on a single PPT slide.
-        """
+        Note: Your output length needs to be kept within a reasonable range so that it can fit on a single PPT slide."""
+        return build_prompt(
+            [instructions, self.fragments.get("feedback.slides"), f"Chapter: {chapter['title']}"],
+            [
+                f"Slide: {slide['title']}\nDescription: {slide['description']}",
+                f"Context (adjacent slides for reference):\n{json.dumps(context_slides, indent=2)}"
+            ]
+        )
+    
+    def _generate_slide_draft(self, slide: Dict[str, str], context_slides: List[Dict[str, Any]], chapter: Dict[str, str]):
+        """Generate detailed slide draft using Teaching Faculty agent"""
+        teaching_faculty = self.agents.get("teaching_faculty")
+        if not teaching_faculty:
+            raise ValueError("Teaching Faculty agent not found")
+        
+        prompt = self._slide_draft_prompt(slide, context_slides, chapter)
         
         # Reset agent history to ensure clean context
         teaching_faculty.reset_history()
@@ -834,32 +1068,36 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_faculty.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="draft"
         )
-        self.time_slides += elapsed_time
-        self.token_slides += token_usage
+        self._add_stats("slides", elapsed_time, token_usage)
         
         return response
     
-    def _generate_slide_latex(self, slide_idx: int, slide: Dict[str, str], slide_draft: str):
-        """Generate LaTeX code for a slide using Teaching Assistant agent - can generate multiple frames"""
-        teaching_assistant = self.agents.get("teaching_assistant")
-        if not teaching_assistant:
-            raise ValueError("Teaching Assistant agent not found")
-        
+    def _slide_latex_prompt(self, slide_idx: int, slide: Dict[str, str], slide_draft: str) -> str:
+        """Build the prompt for a slide's LaTeX frames"""
         # Get the current LaTeX frames if they exist
         current_frames = self.latex_dict.get(slide_idx, {}).get("frames", [])
         current_frames_text = "\n\n".join([frame["full_frame"] for frame in current_frames]) if current_frames else None
         
         # 使用工具函数生成prompt
-        prompt = SlideUtils.generate_latex_frame_prompt(
+        return SlideUtils.generate_latex_frame_prompt(
             title=slide['title'],
             content=slide_draft,
             description=slide.get('description'),
             current_frames=current_frames_text,
-            user_feedback=self.user_feedback,
-            max_frames=3
+            max_frames=3,
+            feedback_text=self.fragments.get("feedback.slides")
         )
+    
+    def _generate_slide_latex(self, slide_idx: int, slide: Dict[str, str], slide_draft: str):
+        """Generate LaTeX code for a slide using Teaching Assistant agent - can generate multiple frames"""
+        teaching_assistant = self.agents.get("teaching_assistant")
+        if not teaching_assistant:
+            raise ValueError("Teaching Assistant agent not found")
+        
+        prompt = self._slide_latex_prompt(slide_idx, slide, slide_draft)
         
         # Reset agent history to ensure clean context
         teaching_assistant.reset_history()
@@ -869,13 +1107,19 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_assistant.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="latex"
         )
-        self.time_slides += elapsed_time
-        self.token_slides += token_usage
+        self._add_stats("slides", elapsed_time, token_usage)
         
-        # 使用工具函数提取frames
-        frame_matches = SlideUtils.extract_latex_frames(response)
+        self._store_slide_latex(slide_idx, slide, response)
+    
+    def _store_slide_latex(self, slide_idx: int, slide: Dict[str, str], response: str):
+        """Extract the frames of a LaTeX response into latex_dict"""
+        # 使用工具函数提取frames，并在本地检查和修复LaTeX错误
+        frame_matches = SlideUtils.repair_latex_frames(
+            SlideUtils.extract_latex_frames(response), self._regenerate_latex_frame
+        )
         
         if frame_matches:
             # Initialize slide entry if it doesn't exist
@@ -890,13 +1134,17 @@ class SlidesDeliberation:
                 self.latex_dict[slide_idx]["slide_title"] = slide['title']
             
             # Add all frames for this slide
-            for i, frame_code in enumerate(frame_matches):
-                self.latex_dict[slide_idx]["frames"].append({
-                    "full_frame": frame_code,
-                    "content": frame_code.replace("\\begin{frame}", "").replace("\\end{frame}", "").strip(),
+            for i, result in enumerate(frame_matches):
+                parsed = parse_beamer(result["frame"])["frames"]
+                frame = {
+                    "full_frame": result["frame"],
+                    "content": (parsed[0]["content"] if parsed else result["frame"]).strip(),
                     "title": slide['title'] + (f" - Part {i+1}" if len(frame_matches) > 1 else ""),
                     "frame_index": i
-                })
+                }
+                if result["errors"]:
+                    frame["lint_errors"] = result["errors"]
+                self.latex_dict[slide_idx]["frames"].append(frame)
             
             print(f"Generated {len(frame_matches)} frame(s) for slide: {slide['title']}")
         else:
@@ -905,6 +1153,7 @@ class SlidesDeliberation:
                 \\frametitle{{{slide['title']}}}
                 {slide.get('description', '')}
             \\end{{frame}}"""
+            fallback_frame = SlideUtils.repair_latex_frames([fallback_frame])[0]["frame"]
             
             self.latex_dict[slide_idx] = {
                 "frames": [{
@@ -917,12 +1166,20 @@ class SlidesDeliberation:
             }
             print(f"Generated fallback frame for slide: {slide['title']}")
     
-    def _generate_slide_script(self, slide_idx: int, slide: Dict[str, str], slide_draft: str):
-        """Generate script for a slide using Teaching Assistant agent"""
+    def _regenerate_latex_frame(self, prompt: str) -> str:
+        """Ask the Teaching Assistant to fix a frame the linter could not repair"""
         teaching_assistant = self.agents.get("teaching_assistant")
-        if not teaching_assistant:
-            raise ValueError("Teaching Assistant agent not found")
-        
+        response, elapsed_time, token_usage = teaching_assistant.generate_response(
+            prompt=prompt,
+            stream=True,
+            save_to_history=False,
+            step="latex"
+        )
+        self._add_stats("slides", elapsed_time, token_usage)
+        return response
+    
+    def _slide_script_prompt(self, slide_idx: int, slide: Dict[str, str], slide_draft: str) -> str:
+        """Build the prompt for a slide's speaking script"""
         # Get adjacent slide scripts for context
         prev_script = self.slides_script.get(slide_idx-1, {}).get("script", "") if slide_idx > 0 else ""
         current_script = self.slides_script.get(slide_idx, {}).get("script", "")
@@ -934,29 +1191,11 @@ class SlidesDeliberation:
             for i, frame in enumerate(self.latex_dict[slide_idx]["frames"]):
                 frames_info += f"Frame {i+1}:\n```latex\n{frame['full_frame']}\n```\n\n"
         
-        # Create the prompt for the agent
-        prompt = f"""
-        Based on the following slide content, generate a detailed speaking script for presenting this slide.
+        # Create the prompt for the agent; the parts shared by all slides come first
+        instructions = """
+        Based on the slide content given at the end of this message, generate a detailed speaking script for presenting this slide.
         Note: This slide may have multiple frames, so your script should cover all frames smoothly.
         
-        Slide Title: {slide['title']}
-        Slide Description: {slide['description']}
-        
-        Detailed Content:
-        {slide_draft}
-        
-        LaTeX Frames for this slide:
-        {frames_info}
-        
-        Context (adjacent slides' scripts for smooth transitions):
-        Previous slide script: {prev_script[:200] + "..." if len(prev_script) > 200 else prev_script}
-        Current placeholder: {current_script}
-        Next slide script: {next_script[:200] + "..." if len(next_script) > 200 else next_script}
-
-        User Feedback:
-        [For script]{json.dumps(self.user_feedback['script'], indent=2)}
-        [For overall]{json.dumps(self.user_feedback['overall'], indent=2)}
-        
         Please generate a comprehensive speaking script for this slide that:
         1. Introduces the slide topic
         2. Explains all key points clearly and thoroughly
@@ -966,8 +1205,28 @@ class SlidesDeliberation:
         6. Includes rhetorical questions or engagement points for students
         
         The script should be detailed enough for someone else to present effectively from it.
-        If there are multiple frames, clearly indicate when to advance to the next frame.
-        """
+        If there are multiple frames, clearly indicate when to advance to the next frame."""
+        context = f"""Context (adjacent slides' scripts for smooth transitions):
+Previous slide script: {prev_script[:200] + "..." if len(prev_script) > 200 else prev_script}
+Current placeholder: {current_script}
+Next slide script: {next_script[:200] + "..." if len(next_script) > 200 else next_script}"""
+        return build_prompt(
+            [instructions, self.fragments.get("feedback.script")],
+            [
+                f"Slide Title: {slide['title']}\nSlide Description: {slide['description']}",
+                f"Detailed Content:\n{slide_draft}",
+                f"LaTeX Frames for this slide:\n{frames_info}",
+                context
+            ]
+        )
+    
+    def _generate_slide_script(self, slide_idx: int, slide: Dict[str, str], slide_draft: str):
+        """Generate script for a slide using Teaching Assistant agent"""
+        teaching_assistant = self.agents.get("teaching_assistant")
+        if not teaching_assistant:
+            raise ValueError("Teaching Assistant agent not found")
+        
+        prompt = self._slide_script_prompt(slide_idx, slide, slide_draft)
         
         # Reset agent history to ensure clean context
         teaching_assistant.reset_history()
@@ -977,11 +1236,15 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_assistant.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="script"
         )
-        self.time_script += elapsed_time
-        self.token_script += token_usage
+        self._add_stats("script", elapsed_time, token_usage)
         
+        self._store_slide_script(slide_idx, slide, response)
+    
+    def _store_slide_script(self, slide_idx: int, slide: Dict[str, str], response: str):
+        """Store a slide's speaking script"""
         # Update the slides script dictionary
         self.slides_script[slide_idx] = {
             "slide_id": slide_idx + 1,
@@ -990,31 +1253,15 @@ class SlidesDeliberation:
             "frame_count": len(self.latex_dict.get(slide_idx, {}).get("frames", []))
         }
     
-    def _generate_slide_assessment(self, slide_idx: int, slide: Dict[str, str], slide_draft: str):
-        """Generate assessment for a slide using Teaching Assistant agent"""
-        teaching_assistant = self.agents.get("teaching_assistant")
-        if not teaching_assistant:
-            raise ValueError("Teaching Assistant agent not found")
-        
+    def _slide_assessment_prompt(self, slide_idx: int, slide: Dict[str, str], slide_draft: str) -> str:
+        """Build the prompt for a slide's assessment"""
         # Get the current assessment template for this slide
         template = self.assessment_template.get(slide_idx, {})
         
-        # Create the prompt for the agent
-        prompt = f"""
-        Based on the following slide content and assessment template, generate detailed assessment content for this slide.
-        
-        Slide Title: {slide['title']}
-        Slide Description: {slide['description']}
-        
-        Detailed Content:
-        {slide_draft}
-        
-        Assessment Template:
-        {json.dumps(template, indent=2)}
-
-        User Feedback:
-        [For assessment]{json.dumps(self.user_feedback['assessment'], indent=2)}
-        [For overall]{json.dumps(self.user_feedback['overall'], indent=2)}
+        # Create the prompt for the agent; the parts shared by all slides come
+        # first, the response format names the slide and comes last
+        instructions = """
+        Based on the slide content and assessment template given at the end of this message, generate detailed assessment content for this slide.
         
         Please generate comprehensive assessment content in JSON format that includes:
         1. Multiple choice questions (3-5 questions) with 4 options each, correct answer, and explanation
@@ -1022,8 +1269,8 @@ class SlidesDeliberation:
         3. Clear learning objectives for this slide
         4. Discussion questions for student engagement
         
-        The assessment should test understanding of the key concepts presented in this slide.
-        
+        The assessment should test understanding of the key concepts presented in this slide."""
+        response_format = f"""
         Your response should be in JSON format like:
         {{
             "slide_id": {slide_idx + 1},
@@ -1044,8 +1291,24 @@ class SlidesDeliberation:
             }}
         }}
         
-        Your response must be valid JSON that can be parsed programmatically.
-        """
+        Your response must be valid JSON that can be parsed programmatically."""
+        return build_prompt(
+            [instructions, self.fragments.get("feedback.assessment")],
+            [
+                f"Slide Title: {slide['title']}\nSlide Description: {slide['description']}",
+                f"Detailed Content:\n{slide_draft}",
+                f"Assessment Template:\n{json.dumps(template, indent=2)}",
+                response_format
+            ]
+        )
+    
+    def _generate_slide_assessment(self, slide_idx: int, slide: Dict[str, str], slide_draft: str):
+        """Generate assessment for a slide using Teaching Assistant agent"""
+        teaching_assistant = self.agents.get("teaching_assistant")
+        if not teaching_assistant:
+            raise ValueError("Teaching Assistant agent not found")
+        
+        prompt = self._slide_assessment_prompt(slide_idx, slide, slide_draft)
         
         # Reset agent history to ensure clean context
         teaching_assistant.reset_history()
@@ -1055,26 +1318,25 @@ class SlidesDeliberation:
         response, elapsed_time, token_usage = teaching_assistant.generate_response(
             prompt=prompt,
             stream=True,
-            save_to_history=False
+            save_to_history=False,
+            step="assessment",
+            json_mode=True
         )
-        self.time_assessment += elapsed_time
-        self.token_assessment += token_usage
+        self._add_stats("assessment", elapsed_time, token_usage)
         
+        self._store_slide_assessment(slide_idx, slide, response)
+    
+    def _store_slide_assessment(self, slide_idx: int, slide: Dict[str, str], response: str):
+        """Parse a slide's assessment response into assessment_content"""
         # Parse the JSON response
         try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                assessment_data = json.loads(json_str)
-                self.assessment_content[slide_idx] = assessment_data
-            else:
-                # If no JSON pattern is found, try direct parsing
-                self.assessment_content[slide_idx] = json.loads(response)
+            self.assessment_content[slide_idx] = parse_json(
+                response, expect="object", schema=SLIDE_ASSESSMENT_SCHEMA, name="slide_assessment"
+            )
             
             print(f"Successfully generated assessment for slide: {slide['title']}")
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ParseError as e:
             print(f"Error: Could not parse JSON response from agent: {e}")
             print("Response:", response)
             # Create a minimal assessment as fallback
@@ -0,0 +1,446 @@
+"""
+Structured Output
+Tolerant JSON extraction, repair and validation for LLM responses.
+
+Model output often wraps JSON in prose or markdown fences, or is cut off by
+the token limit. parse_json() finds the JSON value in a response, repairs a
+truncated value by dropping the incomplete tail and closing open brackets,
+validates the result against a small JSON-Schema subset and records the
+outcome per call site, so parse-failure rates can be reported.
+
+JSONStreamParser is the incremental scanner behind parse_json(); it can be
+fed a streamed response chunk by chunk and yields the elements of a
+top-level array as soon as each one is complete. ArrayStreamListener wires
+it to a streaming LLM call, so work on the first items of a list can start
+while the rest is still being generated.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Response format for chat completions whose top-level value is an object
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|\Z)", re.DOTALL)
+
+# Number of cut points tried, newest first, when repairing truncated output
+MAX_REPAIR_ATTEMPTS = 64
+
+# Number of opening brackets tried as the start of the value
+MAX_START_ATTEMPTS = 16
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class ParseError(ValueError):
+    """Raised when no valid JSON value can be extracted from a response"""
+
+
+class JSONStreamParser:
+    """
+    Incremental scanner for one JSON value embedded in text
+
+    Text before the first opening bracket is skipped. While scanning, the
+    parser tracks the bracket stack and string state, and remembers "cut
+    points": positions at which the text so far, followed by the closing
+    brackets of the open containers, is complete JSON. These let a
+    truncated value be repaired, and let complete elements of a top-level
+    array be emitted while the rest is still streaming.
+    """
+
+    def __init__(self, expect: Optional[str] = None):
+        """
+        Initialize JSONStreamParser
+
+        Args:
+            expect: "array", "object" or None (whichever bracket comes first)
+        """
+        self.openers = {"array": "[", "object": "{"}.get(expect, "[{")
+        # Chunks fed so far and their offsets; joined only when the whole text is needed
+        self.chunks = []
+        self.offsets = []
+        self.length = 0
+        self.start = None
+        self.end = None
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.cut_points = []
+        self.element_start = None
+        self.emitted = 0
+
+    @property
+    def complete(self) -> bool:
+        """Whether the value has been closed"""
+        return self.end is not None
+
+    @property
+    def text(self) -> str:
+        """Text fed so far"""
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+            self.offsets = [0]
+        return self.chunks[0] if self.chunks else ""
+
+    def _slice(self, start: int, end: int) -> str:
+        """text[start:end], joining only the chunks it spans"""
+        first = bisect.bisect_right(self.offsets, start) - 1
+        last = bisect.bisect_left(self.offsets, end)
+        joined = "".join(self.chunks[first:last])
+        return joined[start - self.offsets[first]:end - self.offsets[first]]
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Add text to the parser
+
+        Args:
+            chunk: Next piece of the response
+
+        Returns:
+            Elements of a top-level array completed by this chunk
+        """
+        if self.complete or not chunk:
+            return []
+        offset = self.length
+        self.chunks.append(chunk)
+        self.offsets.append(offset)
+        self.length += len(chunk)
+        elements = []
+
+        # Only the new chunk is scanned; the state carries over from earlier chunks
+        for i, char in enumerate(chunk, offset):
+            if self.start is None:
+                if char in self.openers:
+                    self.start = i
+                    self.stack.append(char)
+                    if char == "[":
+                        self.element_start = i + 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.stack.append(char)
+            elif char in "]}":
+                if not self.stack or CLOSERS[self.stack[-1]] != char:
+                    # Mismatched bracket; leave the value to the repair step
+                    continue
+                self.stack.pop()
+                if not self.stack:
+                    self.end = i + 1
+                    if self.element_start is not None:
+                        elements.extend(self._element(self.element_start, i))
+                    break
+                self.cut_points.append((i + 1, tuple(self.stack)))
+            elif char == ",":
+                self.cut_points.append((i, tuple(self.stack)))
+                if len(self.stack) == 1 and self.stack[0] == "[":
+                    elements.extend(self._element(self.element_start, i))
+                    self.element_start = i + 1
+
+        return elements
+
+    def _element(self, start: int, end: int) -> List[Any]:
+        """Parse one element of the top-level array"""
+        raw = self._slice(start, end).strip()
+        if not raw:
+            return []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return []
+        self.emitted += 1
+        return [value]
+
+    def value(self) -> Any:
+        """
+        Get the parsed value, repairing it if it was truncated
+
+        Raises:
+            ParseError: If no value can be recovered
+        """
+        if self.start is None:
+            raise ParseError("No JSON value found in response")
+        if self.complete:
+            return json.loads(self.text[self.start:self.end])
+
+        cut_points = self.cut_points[-MAX_REPAIR_ATTEMPTS:]
+        # The text may end on a complete value (e.g. a number followed by a
+        # newline); a trailing number or literal without a delimiter could
+        # itself be cut off, so it is not trusted
+        if not self.in_string and (self.text[-1].isspace() or self.text[-1] in '"]}'):
+            cut_points = cut_points + [(len(self.text), tuple(self.stack))]
+
+        for cut, stack in reversed(cut_points):
+            candidate = self.text[self.start:cut] + "".join(CLOSERS[b] for b in reversed(stack))
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                continue
+        # Nothing complete inside the value yet: an empty container
+        try:
+            return json.loads(self.text[self.start] + CLOSERS[self.text[self.start]])
+        except ValueError:
+            raise ParseError("Could not repair truncated JSON")
+
+
+class ArrayStreamListener:
+    """
+    Per-call LLM listener that delivers the items of a streamed JSON array
+
+    Streamed tokens are fed to a JSONStreamParser and every complete element
+    that satisfies the item schema is passed to on_item, in order. A retried
+    attempt restarts the parser; items already delivered by an earlier attempt
+    are not delivered again.
+    """
+
+    def __init__(self, on_item: Callable[[Any], None], item_schema: Optional[Dict[str, Any]] = None):
+        """
+        Initialize ArrayStreamListener
+
+        Args:
+            on_item: Called with each valid item as soon as it is complete
+            item_schema: Optional JSON-Schema subset items must satisfy
+        """
+        self.on_item = on_item
+        self.item_schema = item_schema
+        self.parser = JSONStreamParser("array")
+        self.valid = 0      # Valid items seen in the current attempt
+        self.items = []     # Items delivered so far
+
+    def __call__(self, event: Dict[str, Any]):
+        if event["type"] == "attempt":
+            self.parser = JSONStreamParser("array")
+            self.valid = 0
+        elif event["type"] == "token":
+            for item in self.parser.feed(event["text"]):
+                if self.item_schema and validate(item, self.item_schema):
+                    continue
+                self.valid += 1
+                if self.valid > len(self.items):
+                    self.items.append(item)
+                    self.on_item(item)
+
+    def merge(self, items: List[Any]) -> List[Any]:
+        """
+        Combine the delivered items with the parsed final response
+
+        Delivered items are kept as they were handed out; the final response
+        supplies any items after them.
+        """
+        return self.items + list(items[len(self.items):])
+
+
+def _candidates(text: str) -> List[str]:
+    """Texts to look for JSON in: fenced blocks first, then the whole response"""
+    blocks = [match.group(1) for match in FENCE_PATTERN.finditer(text) if match.group(1).strip()]
+    return blocks + [text]
+
+
+def extract_json(text: str, expect: Optional[str] = None) -> tuple:
+    """
+    Extract a JSON value from a model response
+
+    Args:
+        text: Model response
+        expect: "array", "object" or None
+
+    Returns:
+        Tuple of (value, repaired) where repaired is True if the value
+        was not found as-is (surrounding prose removed or truncation repaired)
+
+    Raises:
+        ParseError: If no JSON value of the expected kind can be recovered
+    """
+    if text is None:
+        raise ParseError("Empty response")
+    wanted = {"array": list, "object": dict}.get(expect, (list, dict))
+
+    try:
+        value = json.loads(text)
+        if isinstance(value, wanted):
+            return value, False
+    except ValueError:
+        pass
+
+    errors = []
+    for candidate in _candidates(text):
+        # A bracket in the surrounding prose may start a non-JSON region;
+        # retry from the next opening bracket
+        offset = 0
+        for _ in range(MAX_START_ATTEMPTS):
+            parser = JSONStreamParser(expect)
+            parser.feed(candidate[offset:])
+            if parser.start is None:
+                break
+            try:
+                value = parser.value()
+                if isinstance(value, wanted):
+                    return value, True
+            except (ParseError, ValueError) as e:
+                errors.append(str(e))
+            offset += parser.start + 1
+    raise ParseError(errors[-1] if errors else "No JSON value found in response")
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Validate a value against a JSON-Schema subset
+
+    Supported keywords: type, properties, required, items, minItems, minimum,
+    maximum and enum.
+
+    Returns:
+        List of error messages (empty if the value is valid)
+    """
+    types = {
+        "object": dict, "array": list, "string": str, "boolean": bool,
+        "number": (int, float), "integer": int, "null": type(None)
+    }
+    expected = schema.get("type")
+    if expected:
+        allowed = expected if isinstance(expected, list) else [expected]
+        matches = any(
+            isinstance(value, types[t]) and not (t in ("number", "integer") and isinstance(value, bool))
+            for t in allowed
+        )
+        if not matches:
+            return [f"{path}: expected {expected}, got {type(value).__name__}"]
+
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} is below {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} is above {schema['maximum']}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required property '{key}'")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(value[key], subschema, f"{path}.{key}"))
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items")
+        if "items" in schema:
+            for idx, item in enumerate(value):
+                errors.extend(validate(item, schema["items"], f"{path}[{idx}]"))
+    return errors
+
+
+class ParseStats:
+    """
+    Thread-safe per-call-site counts of parse outcomes
+
+    parse_stats counts the parses of the whole process; collect() also counts
+    those of one run on a separate instance.
+    """
+
+    OUTCOMES = ("ok", "repaired", "failed")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        # Instances collecting the parses of the current context, see collect()
+        self._collectors = contextvars.ContextVar("parse_stats_collectors", default=())
+
+    def record(self, name: str, outcome: str):
+        for stats in (self,) + self._collectors.get():
+            with stats.lock:
+                counts = stats.counts.setdefault(name, {key: 0 for key in self.OUTCOMES})
+                counts[outcome] += 1
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Also count the parses made inside the block on a new ParseStats
+
+        Only parses in the current context are counted, including those on
+        worker threads whose tasks were submitted through
+        src.tracing.in_context, so concurrent runs (e.g. two API tasks) each
+        count only their own.
+
+        Yields:
+            The new ParseStats
+        """
+        run = ParseStats()
+        token = self._collectors.set(self._collectors.get() + (run,))
+        try:
+            yield run
+        finally:
+            self._collectors.reset(token)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Counts and failure rate per call site"""
+        with self.lock:
+            report = {}
+            for name, counts in sorted(self.counts.items()):
+                total = sum(counts.values())
+                report[name] = dict(counts, total=total, failure_rate=counts["failed"] / total if total else 0.0)
+            return report
+
+
+parse_stats = ParseStats()
+
+
+def parse_json(text: str,
+               expect: Optional[str] = None,
+               schema: Optional[Dict[str, Any]] = None,
+               name: str = "unnamed",
+               drop_invalid_items: bool = False) -> Any:
+    """
+    Extract, repair and validate the JSON value of a model response
+
+    Args:
+        text: Model response
+        expect: "array", "object" or None
+        schema: Optional JSON-Schema subset the value must satisfy
+        name: Call-site name for the parse statistics
+        drop_invalid_items: For arrays, drop items that fail the item schema
+            instead of rejecting the response (at least one must remain)
+
+    Returns:
+        The parsed value
+
+    Raises:
+        ParseError: If the response holds no valid value
+    """
+    try:
+        value, repaired = extract_json(text, expect)
+        if schema:
+            if drop_invalid_items and isinstance(value, list) and "items" in schema:
+                valid = [item for item in value if not validate(item, schema["items"])]
+                if len(valid) < len(value):
+                    print(f"[{name}] Dropped {len(value) - len(valid)} invalid item(s)")
+                    value, repaired = valid, True
+            errors = validate(value, schema)
+            if errors:
+                raise ParseError("; ".join(errors[:5]))
+    except ParseError:
+        parse_stats.record(name, "failed")
+        raise
+
+    parse_stats.record(name, "repaired" if repaired else "ok")
+    return value
+
+
+def get_parse_stats() -> Dict[str, Dict[str, Any]]:
+    """Parse outcome counts and failure rates of this process, per call site"""
+    return parse_stats.report()
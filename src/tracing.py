@@ -0,0 +1,359 @@
+"""
+Tracing
+Nested timing spans across a run, exported as Chrome trace events.
+
+A span covers one unit of work (a deliberation, a chapter, a slide, a
+pipeline step, an LLM call, a compile) and records its start, duration,
+thread and attributes (model, tokens, retries, cache hits, queue wait).
+Spans nest through a context variable, so the current span follows a task
+into a worker thread when the task is submitted through `in_context`.
+
+Spans are only recorded inside a trace opened with `trace()`. Span
+listeners (e.g. the metrics module) receive every finished span, inside a
+trace or not; without listeners, `span()` outside a trace costs a context
+variable lookup. A finished trace is written in
+the Trace Event Format (chrome://tracing, https://ui.perfetto.dev) with a
+summary of its critical path and of the time no LLM call was in flight.
+"""
+
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Spans kept per trace; later spans are counted but not recorded
+MAX_SPANS_PER_TRACE = 100000
+
+# Category of LLM call spans, used for the idle time summary
+LLM_CATEGORY = "llm"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Callbacks receiving every finished span
+_span_listeners = []
+_span_listeners_lock = threading.Lock()
+
+
+class Span:
+    """One timed unit of work; spans opened outside a trace have no trace_id"""
+
+    def __init__(self, name: str, category: str, trace_id: int, span_id: int, parent_id: Optional[int],
+                 attributes: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.thread_name = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attributes):
+        """Add or replace attributes of the span"""
+        self.attributes.update(attributes)
+
+
+class _NullSpan:
+    """Span returned outside a trace; setting attributes does nothing"""
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Thread-safe store of the finished spans of open traces"""
+
+    def __init__(self, max_spans: int = MAX_SPANS_PER_TRACE):
+        self.lock = threading.Lock()
+        self.max_spans = max_spans
+        self.ids = itertools.count(1)
+        self.spans = {}     # Trace ID -> finished spans
+        self.dropped = {}   # Trace ID -> spans not recorded
+        self.open = set()   # IDs of traces not yet exported
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self.ids)
+
+    def start(self) -> int:
+        """Open a new trace, returning its ID"""
+        with self.lock:
+            trace_id = next(self.ids)
+            self.open.add(trace_id)
+            return trace_id
+
+    def record(self, span: Span):
+        with self.lock:
+            if span.trace_id not in self.open:
+                # Trace already exported, e.g. a worker outliving a failed run
+                return
+            spans = self.spans.setdefault(span.trace_id, [])
+            if len(spans) < self.max_spans:
+                spans.append(span)
+            else:
+                self.dropped[span.trace_id] = self.dropped.get(span.trace_id, 0) + 1
+
+    def pop(self, trace_id: int) -> tuple:
+        """Remove a trace, returning (spans, number of dropped spans)"""
+        with self.lock:
+            self.open.discard(trace_id)
+            return self.spans.pop(trace_id, []), self.dropped.pop(trace_id, 0)
+
+
+tracer = Tracer()
+
+
+def add_span_listener(listener: Callable[[Span], None]):
+    """
+    Register a callback for finished spans
+
+    The listener is called with every span when it ends, on the thread that
+    ran it, including spans opened outside a trace. It must not block.
+    """
+    with _span_listeners_lock:
+        if listener not in _span_listeners:
+            _span_listeners.append(listener)
+
+
+def remove_span_listener(listener: Callable[[Span], None]):
+    """Unregister a callback added with add_span_listener"""
+    with _span_listeners_lock:
+        if listener in _span_listeners:
+            _span_listeners.remove(listener)
+
+
+@contextlib.contextmanager
+def _open(name: str, category: str, trace_id: int, parent_id: Optional[int], attributes: Dict[str, Any]):
+    opened = Span(name, category, trace_id, tracer.next_id(), parent_id, attributes)
+    token = _current_span.set(opened)
+    try:
+        yield opened
+    except BaseException as e:
+        opened.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        opened.end = time.perf_counter()
+        _current_span.reset(token)
+        if trace_id is not None:
+            tracer.record(opened)
+        for listener in list(_span_listeners):
+            try:
+                listener(opened)
+            except Exception as e:
+                print(f"Span listener failed: {e}")
+
+
+@contextlib.contextmanager
+def trace(name: str, category: str = "run", **attributes):
+    """
+    Open the root span of a new trace
+
+    Args:
+        name: Span name, e.g. "addie"
+        category: Span category
+        **attributes: Span attributes
+
+    Yields:
+        The root span; pass it to export_chrome_trace once the block has ended
+    """
+    with _open(name, category, tracer.start(), None, attributes) as root:
+        yield root
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = "", **attributes):
+    """
+    Open a span nested in the current one
+
+    Outside a trace the span is only passed to the span listeners; without
+    listeners NULL_SPAN is yielded.
+
+    Args:
+        name: Span name, e.g. "chapter" or "latex"
+        category: Span category, e.g. "llm", "compile" or "step"
+        **attributes: Span attributes
+
+    Yields:
+        The span, whose attributes can be extended with set()
+    """
+    parent = _current_span.get()
+    if parent is None:
+        if not _span_listeners:
+            yield NULL_SPAN
+            return
+        with _open(name, category, None, None, attributes) as opened:
+            yield opened
+        return
+    with _open(name, category, parent.trace_id, parent.span_id, attributes) as opened:
+        yield opened
+
+
+def in_context(fn: Callable, name: str = None, category: str = "task", **attributes) -> Callable:
+    """
+    Carry the current span into a function run by a worker thread
+
+    Wrap the function when it is submitted, e.g.
+    executor.submit(in_context(fn, "chapter", index=i), *args).
+
+    Args:
+        fn: Function to run
+        name: If given, the function runs in a span of this name, with the
+            time between wrapping and running recorded as "queue_wait"
+        category: Category of that span
+        **attributes: Attributes of that span
+
+    Returns:
+        Function with the same arguments
+    """
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def task(*args, **kwargs):
+        if name is None:
+            return fn(*args, **kwargs)
+        with span(name, category, queue_wait=time.perf_counter() - submitted, **attributes):
+            return fn(*args, **kwargs)
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(task, *args, **kwargs)
+    return run
+
+
+def _busy_time(intervals: List[tuple]) -> tuple:
+    """Length of the union of (start, end) intervals and the peak number overlapping"""
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    busy = 0.0
+    depth = peak = 0
+    last = None
+    for moment, delta in events:
+        if depth > 0:
+            busy += moment - last
+        depth += delta
+        peak = max(peak, depth)
+        last = moment
+    return busy, peak
+
+
+def _blocking_chain(node: Span, children: Dict[int, List[Span]]) -> List[Span]:
+    """
+    Children a span waited on: the child finishing last, then the child
+    finishing last before that one started, and so on
+    """
+    chain = []
+    limit = node.end
+    for child in sorted(children.get(node.span_id, []), key=lambda s: s.end, reverse=True):
+        if child.end <= limit:
+            chain.append(child)
+            limit = child.start
+    return chain[::-1]
+
+
+def _critical_path(root: Span, children: Dict[int, List[Span]]) -> List[Dict[str, Any]]:
+    """Spans on the critical path of a trace, depth first, with their depth below the root"""
+    path = []
+
+    def expand(node, depth):
+        for child in _blocking_chain(node, children):
+            path.append({"name": child.name, "category": child.category, "depth": depth,
+                         "start": child.start - root.start, "duration": child.duration})
+            expand(child, depth + 1)
+
+    expand(root, 1)
+    return path
+
+
+def summarize(root: Span, spans: List[Span]) -> Dict[str, Any]:
+    """
+    Summarize where the wall time of a trace went
+
+    Returns:
+        Dictionary with the wall time, totals per category, LLM busy and idle
+        time, the peak number of concurrent LLM calls and the critical path
+    """
+    children = {}
+    categories = {}
+    for s in spans:
+        if s.parent_id is not None:
+            children.setdefault(s.parent_id, []).append(s)
+        counts = categories.setdefault(s.category or "other", {"spans": 0, "total_time": 0.0})
+        counts["spans"] += 1
+        counts["total_time"] += s.duration
+
+    llm_calls = [s for s in spans if s.category == LLM_CATEGORY]
+    busy, peak = _busy_time([(s.start, s.end) for s in llm_calls])
+    wall = root.duration
+    return {
+        "wall_time": wall,
+        "categories": categories,
+        "llm_calls": len(llm_calls),
+        "llm_busy_time": busy,
+        "llm_idle_time": max(0.0, wall - busy),
+        "llm_mean_concurrency": sum(s.duration for s in llm_calls) / wall if wall else 0.0,
+        "llm_max_concurrency": peak,
+        "queue_wait": sum(s.attributes.get("queue_wait", 0.0) for s in spans),
+        "critical_path": _critical_path(root, children)
+    }
+
+
+def _json_safe(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def export_chrome_trace(root: Span, path: str) -> Dict[str, Any]:
+    """
+    Write a finished trace as Chrome trace events and release its spans
+
+    Args:
+        root: Root span yielded by trace(), after its block has ended
+        path: File to write
+
+    Returns:
+        The summary() of the trace, also stored under "otherData" in the file
+    """
+    spans, dropped = tracer.pop(root.trace_id)
+    summary = summarize(root, spans)
+    summary["dropped_spans"] = dropped
+
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for s in sorted(spans, key=lambda s: s.start):
+        threads.setdefault(s.thread_id, s.thread_name)
+        args = {key: _json_safe(value) for key, value in s.attributes.items()}
+        args.update(span_id=s.span_id, parent_id=s.parent_id)
+        events.append({
+            "name": s.name,
+            "cat": s.category or "other",
+            "ph": "X",
+            "ts": round((s.start - root.start) * 1e6, 1),
+            "dur": round(s.duration * 1e6, 1),
+            "pid": pid,
+            "tid": s.thread_id,
+            "args": args
+        })
+    for thread_id, thread_name in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id,
+                       "args": {"name": thread_name}})
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": summary}, f)
+    return summary